@@ -5,25 +5,27 @@ Built with Ursina Engine - SM64 Engine Style Recreation
 IndyCat-Origin Build
 """
 
-from ursina import *
-from ursina.prefabs.first_person_controller import FirstPersonController
-import math
+from sm64.startup import StartupTimer, DeferredLoader
 
-# Initialize app with specific settings
-app = Ursina(
-    title='Samsoft Mario 64 - Peach\'s Castle',
-    borderless=False,
-    fullscreen=False,
-    vsync=True
-)
+# Time every startup phase from here on
+startup = StartupTimer()
 
-# SM64 Color Palette - using normalized values
-SKY_BLUE = color.rgb(140/255, 180/255, 240/255)
-GRASS_GREEN = color.rgb(34/255, 177/255, 76/255)
-CASTLE_WALL = color.rgb(245/255, 245/255, 220/255)
-CASTLE_ROOF = color.rgb(220/255, 60/255, 60/255)
-WATER_BLUE = color.rgb(64/255, 164/255, 223/255)
-PATH_STONE = color.rgb(180/255, 180/255, 160/255)
+with startup.phase('import'):
+    from ursina import *
+    from ursina.prefabs.first_person_controller import FirstPersonController
+    import math
+    from sm64.castle import SKY_BLUE, GRASS_GREEN, PeachCastle, CastleGrounds
+    from sm64.quality import apply_quality, quality_preset
+    from sm64.sky import GradientSky
+
+# Initialize app with specific settings
+with startup.phase('window'):
+    app = Ursina(
+        title='Samsoft Mario 64 - Peach\'s Castle',
+        borderless=False,
+        fullscreen=False,
+        vsync=True
+    )
 
 # Configure window
 window.color = SKY_BLUE
@@ -33,208 +35,9 @@ window.fps_counter.enabled = True
 # Camera setup first
 camera.fov = 90
 
-# Sky configuration with texture='sky_default' to avoid white screen
-sky = Sky(
-    color=SKY_BLUE,
-    texture=None
-)
-
-# Ground plane with grass texture
-ground = Entity(
-    model='plane',
-    color=GRASS_GREEN,
-    scale=(200, 1, 200),
-    position=(0, 0, 0),
-    texture='grass',
-    texture_scale=(40, 40),
-    collider='box'
-)
-
-# Castle base structure
-class PeachCastle(Entity):
-    def __init__(self):
-        super().__init__()
-        
-        # Main castle body
-        self.main_body = Entity(
-            parent=self,
-            model='cube',
-            color=CASTLE_WALL,
-            scale=(20, 25, 18),
-            position=(0, 12.5, -30),
-            collider='box'
-        )
-        
-        # Central tower
-        self.central_tower = Entity(
-            parent=self,
-            model='cylinder',
-            color=CASTLE_WALL,
-            scale=(8, 35, 8),
-            position=(0, 17.5, -30),
-            collider='box'
-        )
-        
-        # Central tower roof (cone)
-        self.tower_roof = Entity(
-            parent=self,
-            model='cone',
-            color=CASTLE_ROOF,
-            scale=(10, 8, 10),
-            position=(0, 39, -30),
-            rotation=(0, 0, 0)
-        )
-        
-        # Left tower
-        self.left_tower = Entity(
-            parent=self,
-            model='cylinder',
-            color=CASTLE_WALL,
-            scale=(6, 28, 6),
-            position=(-15, 14, -30),
-            collider='box'
-        )
-        
-        # Left tower roof
-        self.left_roof = Entity(
-            parent=self,
-            model='cone',
-            color=CASTLE_ROOF,
-            scale=(7, 6, 7),
-            position=(-15, 30, -30)
-        )
-        
-        # Right tower
-        self.right_tower = Entity(
-            parent=self,
-            model='cylinder',
-            color=CASTLE_WALL,
-            scale=(6, 28, 6),
-            position=(15, 14, -30),
-            collider='box'
-        )
-        
-        # Right tower roof
-        self.right_roof = Entity(
-            parent=self,
-            model='cone',
-            color=CASTLE_ROOF,
-            scale=(7, 6, 7),
-            position=(15, 30, -30)
-        )
-        
-        # Castle entrance
-        self.entrance = Entity(
-            parent=self,
-            model='cube',
-            color=color.rgb(40, 30, 20),
-            scale=(4, 6, 0.5),
-            position=(0, 3, -20.5)
-        )
-        
-        # Bridge to castle
-        self.bridge = Entity(
-            parent=self,
-            model='cube',
-            color=PATH_STONE,
-            scale=(8, 0.3, 20),
-            position=(0, 0.15, -10),
-            collider='box'
-        )
-        
-        # Decorative windows
-        for i in range(3):
-            for j in range(2):
-                window = Entity(
-                    parent=self,
-                    model='cube',
-                    color=color.rgb(100, 150, 200),
-                    scale=(1.5, 2, 0.2),
-                    position=(-5 + i*5, 8 + j*6, -20.8)
-                )
-
-# Moat around castle
-moat = Entity(
-    model='cube',
-    color=WATER_BLUE,
-    scale=(60, 0.1, 60),
-    position=(0, -0.05, -30)
-)
-
-# Stone path leading to castle
-main_path = Entity(
-    model='cube',
-    color=PATH_STONE,
-    scale=(10, 0.2, 40),
-    position=(0, 0.1, 0),
-    collider='box'
-)
-
-# Decorative trees (simple representation)
-class Tree(Entity):
-    def __init__(self, x, z):
-        super().__init__()
-        self.trunk = Entity(
-            parent=self,
-            model='cylinder',
-            color=color.rgb(101, 67, 33),
-            scale=(1, 5, 1),
-            position=(x, 2.5, z)
-        )
-        self.leaves = Entity(
-            parent=self,
-            model='sphere',
-            color=color.rgb(34, 139, 34),
-            scale=(5, 5, 5),
-            position=(x, 6, z)
-        )
-
-# Place trees around the castle
-tree_positions = [
-    (-30, -10), (30, -10),
-    (-35, -40), (35, -40),
-    (-25, -55), (25, -55),
-    (-40, 10), (40, 10),
-    (-20, 15), (20, 15)
-]
-
-for pos in tree_positions:
-    Tree(pos[0], pos[1])
-
-# Hills in background
-for i in range(5):
-    hill = Entity(
-        model='sphere',
-        color=GRASS_GREEN,
-        scale=(20 + i*3, 10 + i*2, 20 + i*3),
-        position=(-60 + i*30, -5, -80 - i*10)
-    )
-
-# Create small decorative elements
-class Coin(Entity):
-    def __init__(self, position):
-        super().__init__(
-            model='cylinder',
-            color=color.rgb(255, 215, 0),
-            scale=(0.8, 0.1, 0.8),
-            position=position,
-            rotation=(90, 0, 0)
-        )
-        self.rotation_speed = 100
-    
-    def update(self):
-        self.rotation_y += self.rotation_speed * time.dt
-
-# Place some coins
-coin_positions = [
-    (5, 1, 5),
-    (-5, 1, 5),
-    (0, 1, 10),
-    (10, 1, -5),
-    (-10, 1, -5)
-]
-
-coins = [Coin(pos) for pos in coin_positions]
+# Full-screen gradient sky, drawn behind everything in one pass
+with startup.phase('scene build', 'sky'):
+    sky = GradientSky('castle')
 
 # Player controller (Mario-style)
 class MarioController(FirstPersonController):
@@ -263,21 +66,6 @@ class MarioController(FirstPersonController):
         if key == 'ctrl' and not self.grounded:
             self.y_velocity = -20
 
-# Create castle instance
-castle = PeachCastle()
-
-# Create player
-player = MarioController()
-
-# Fix lighting - set ambient light first, then directional
-scene.ambient_light = Vec4(0.4, 0.4, 0.4, 1.0)
-
-# Add directional light (sun) with proper intensity
-sun = DirectionalLight()
-sun.look_at(Vec3(1, -1, -1))
-sun.color = color.rgb(1, 0.9, 0.8)
-sun.intensity = 0.6
-
 # Info text
 info_text = Text(
     'WASD: Move | Mouse: Look | Space: Jump | Shift: Long Jump | Ctrl: Ground Pound',
@@ -294,8 +82,75 @@ title_text = Text(
     font='VeraMono.ttf'
 )
 
+def warm_assets():
+    """Load the models and textures the castle needs ahead of time"""
+    for name in ('plane', 'cube', 'sphere'):
+        load_model(name)
+        yield name
+    load_texture('grass')
+    yield 'grass'
+
+def build_world():
+    """Build the castle a piece per frame behind the title, the player last"""
+    global ground, grounds, coins, castle, player, sun
+    
+    # Ground plane with grass texture
+    ground = Entity(
+        model='plane',
+        color=GRASS_GREEN,
+        scale=(200, 1, 200),
+        position=(0, 0, 0),
+        texture='grass',
+        texture_scale=(40, 40),
+        collider='box'
+    )
+    yield 'ground'
+    
+    # Castle grounds: moat, path, trees, hills and coins
+    grounds = CastleGrounds()
+    coins = grounds.coins
+    yield 'grounds'
+    
+    # Create castle instance
+    castle = PeachCastle()
+    yield 'castle'
+    
+    # Fix lighting - set ambient light first, then directional
+    scene.ambient_light = Vec4(0.4, 0.4, 0.4, 1.0)
+    
+    # Add directional light (sun) with proper intensity
+    sun = DirectionalLight()
+    sun.look_at(Vec3(1, -1, -1))
+    sun.color = color.rgb(1, 0.9, 0.8)
+    sun.intensity = 0.6
+    
+    # Static geometry never moves, so light it once into vertex colors;
+    # the sun keeps lighting the player, coins and the moat's waves
+    if quality_preset()['bake_static']:
+        from sm64.bake import bake_static_lighting
+        bake_static_lighting([ground, castle, grounds], sun, ambient=scene.ambient_light, exclude=[*coins, grounds.moat],
+                             cache='castle-1.0')
+        yield 'lighting bake'
+    
+    # Quality preset (SM64_QUALITY=low/medium/high)
+    apply_quality(lights=[sun])
+    yield 'lighting'
+    
+    # Create player
+    player = MarioController()
+    yield 'player'
+
+loader = DeferredLoader(startup)
+loader.add(warm_assets(), 'assets')
+loader.add(build_world())
+loader.on_done.append(lambda: print(startup.report()))
+loader.start()
+
 # Camera bobbing effect
 def update():
+    if not loader.done:
+        return
+    
     # Simple camera bob when moving
     if hasattr(player, 'grounded') and player.grounded:
         if held_keys['w'] or held_keys['s'] or held_keys['a'] or held_keys['d']:
@@ -311,5 +166,6 @@ print("♪ Peach's Castle theme would play here ♪")
 print("Engine: Samsoft Unix Emulator - IndyCat-Origin")
 print("Build: CatKernel v0.1 with Ursina hooks")
 
-# Run the application
-app.run()
+# Run the application (launcher.py hosts builds in its own window)
+if __name__ == '__main__':
+    app.run()
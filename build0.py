@@ -5,26 +5,31 @@ Built with Ursina Engine - SM64 Engine Style Recreation
 IndyCat-Origin Build
 """
 
-from ursina import *
-from ursina.prefabs.first_person_controller import FirstPersonController
-import math
-import time as pytime
+from sm64.startup import StartupTimer, DeferredLoader
+
+# Time every startup phase from here on
+startup = StartupTimer()
+
+with startup.phase('import'):
+    from ursina import *
+    from ursina.prefabs.first_person_controller import FirstPersonController
+    import math
+    import time as pytime
+    from sm64.castle import SKY_BLUE, GRASS_GREEN, PeachCastle, CastleGrounds
+    from sm64.quality import apply_quality, quality_preset
+    from sm64.saves import SLOTS, SaveFile, read_stars
+    from sm64.sky import GradientSky
 
 # Initialize app with specific settings
-app = Ursina(
-    title='Samsoft Mario 64 - Peach\'s Castle',
-    borderless=False,
-    fullscreen=False,
-    vsync=True
-)
+with startup.phase('window'):
+    app = Ursina(
+        title='Samsoft Mario 64 - Peach\'s Castle',
+        borderless=False,
+        fullscreen=False,
+        vsync=True
+    )
 
-# SM64 Color Palette - using normalized values
-SKY_BLUE = color.rgb(140/255, 180/255, 240/255)
-GRASS_GREEN = color.rgb(34/255, 177/255, 76/255)
-CASTLE_WALL = color.rgb(245/255, 245/255, 220/255)
-CASTLE_ROOF = color.rgb(220/255, 60/255, 60/255)
-WATER_BLUE = color.rgb(64/255, 164/255, 223/255)
-PATH_STONE = color.rgb(180/255, 180/255, 160/255)
+# Spaceworld menu palette
 MENU_BLUE = color.rgb(48/255, 104/255, 184/255)
 MENU_YELLOW = color.rgb(248/255, 248/255, 120/255)
 
@@ -84,6 +89,9 @@ class SpaceworldMenu(Entity):
         # File slots
         self.file_slots = []
         self.selected_file = 0
+        self.save_file = None   # the file being played
+        self.erasing = False
+        self.starting = False   # fading out to the castle
         
         for i in range(4):
             y_pos = 0.05 - (i * 0.12)
@@ -98,7 +106,7 @@ class SpaceworldMenu(Entity):
             )
             
             # File text
-            if i < 3:
+            if i < SLOTS:
                 file_text = Text(
                     f'FILE {i + 1}  -  NEW',
                     parent=self,
@@ -132,6 +140,7 @@ class SpaceworldMenu(Entity):
                 'stars': stars_text,
                 'position': y_pos
             })
+        self.refresh_slots()
         
         # Selection cursor (star)
         self.cursor = Text(
@@ -165,7 +174,14 @@ class SpaceworldMenu(Entity):
         
         # Sound effect placeholder
         self.menu_sound = False
-        
+    
+    def refresh_slots(self):
+        """Label every file from its save header, without reading the whole save"""
+        for i, slot in enumerate(self.file_slots[:SLOTS]):
+            stars = read_stars(i + 1)
+            slot['text'].text = f'FILE {i + 1}  -  NEW' if stars is None else f'FILE {i + 1}'
+            slot['stars'].text = '☆ × 0' if stars is None else f'★ × {stars}'
+    
     def update(self):
         global game_started, menu_active
         
@@ -183,16 +199,30 @@ class SpaceworldMenu(Entity):
         if held_keys['down arrow']:
             self.selected_file = min(3, self.selected_file + 1)
             self.cursor.y = self.file_slots[self.selected_file]['position']
+    
+    def input(self, key):
+        # Once per press, so choosing ERASE FILE doesn't flip back on the next frame
+        if not menu_active or self.starting or key not in ('enter', 'space'):
+            return
         
-        if held_keys['enter'] or held_keys['space']:
-            if self.selected_file < 3:  # File selection
-                self.start_game()
-            else:  # Erase option
-                print("Erase function not implemented")
+        if self.selected_file == SLOTS:  # Erase option, pick a file next or choose it again to cancel
+            self.erasing = not self.erasing
+        elif self.erasing:
+            SaveFile(self.selected_file + 1).erase()
+            self.erasing = False
+            self.refresh_slots()
+            print(f"File {self.selected_file + 1} erased")
+        else:  # File selection
+            self.start_game()
+        self.instructions.text = 'Select a file to ERASE' if self.erasing else 'Press ↑↓ to select, ENTER to start'
     
     def start_game(self):
         global game_started, menu_active
         
+        # Finish whatever the deferred loader hasn't built yet
+        loader.finish()
+        self.starting = True
+        
         # Fade out effect
         fade = Entity(
             parent=camera.ui,
@@ -209,6 +239,10 @@ class SpaceworldMenu(Entity):
         # Hide menu after fade
         invoke(self.hide_menu, delay=0.5)
         
+        # A NEW file is created as soon as it's picked
+        self.save_file = SaveFile(self.selected_file + 1)
+        self.save_file.save()
+        
         print(f"Starting File {self.selected_file + 1}")
         print("♪ File select jingle ♪")
     
@@ -217,6 +251,7 @@ class SpaceworldMenu(Entity):
         
         # Hide all menu elements
         self.enabled = False
+        self.starting = False
         menu_active = False
         game_started = True
         
@@ -230,215 +265,13 @@ class SpaceworldMenu(Entity):
         
         print("♪ Peach's Castle theme starts ♪")
 
-# Create menu first
-menu = SpaceworldMenu()
+# Create the menu first so it is on screen by the first frame
+with startup.phase('scene build', 'menu'):
+    menu = SpaceworldMenu()
 
 # Camera setup first
 camera.fov = 90
 
-# Sky configuration with texture='sky_default' to avoid white screen
-sky = Sky(
-    color=SKY_BLUE,
-    texture=None
-)
-
-# Ground plane with grass texture
-ground = Entity(
-    model='plane',
-    color=GRASS_GREEN,
-    scale=(200, 1, 200),
-    position=(0, 0, 0),
-    texture='grass',
-    texture_scale=(40, 40),
-    collider='box'
-)
-
-# Castle base structure
-class PeachCastle(Entity):
-    def __init__(self):
-        super().__init__()
-        
-        # Main castle body
-        self.main_body = Entity(
-            parent=self,
-            model='cube',
-            color=CASTLE_WALL,
-            scale=(20, 25, 18),
-            position=(0, 12.5, -30),
-            collider='box'
-        )
-        
-        # Central tower
-        self.central_tower = Entity(
-            parent=self,
-            model='cylinder',
-            color=CASTLE_WALL,
-            scale=(8, 35, 8),
-            position=(0, 17.5, -30),
-            collider='box'
-        )
-        
-        # Central tower roof (cone)
-        self.tower_roof = Entity(
-            parent=self,
-            model='cone',
-            color=CASTLE_ROOF,
-            scale=(10, 8, 10),
-            position=(0, 39, -30),
-            rotation=(0, 0, 0)
-        )
-        
-        # Left tower
-        self.left_tower = Entity(
-            parent=self,
-            model='cylinder',
-            color=CASTLE_WALL,
-            scale=(6, 28, 6),
-            position=(-15, 14, -30),
-            collider='box'
-        )
-        
-        # Left tower roof
-        self.left_roof = Entity(
-            parent=self,
-            model='cone',
-            color=CASTLE_ROOF,
-            scale=(7, 6, 7),
-            position=(-15, 30, -30)
-        )
-        
-        # Right tower
-        self.right_tower = Entity(
-            parent=self,
-            model='cylinder',
-            color=CASTLE_WALL,
-            scale=(6, 28, 6),
-            position=(15, 14, -30),
-            collider='box'
-        )
-        
-        # Right tower roof
-        self.right_roof = Entity(
-            parent=self,
-            model='cone',
-            color=CASTLE_ROOF,
-            scale=(7, 6, 7),
-            position=(15, 30, -30)
-        )
-        
-        # Castle entrance
-        self.entrance = Entity(
-            parent=self,
-            model='cube',
-            color=color.rgb(40, 30, 20),
-            scale=(4, 6, 0.5),
-            position=(0, 3, -20.5)
-        )
-        
-        # Bridge to castle
-        self.bridge = Entity(
-            parent=self,
-            model='cube',
-            color=PATH_STONE,
-            scale=(8, 0.3, 20),
-            position=(0, 0.15, -10),
-            collider='box'
-        )
-        
-        # Decorative windows
-        for i in range(3):
-            for j in range(2):
-                window = Entity(
-                    parent=self,
-                    model='cube',
-                    color=color.rgb(100, 150, 200),
-                    scale=(1.5, 2, 0.2),
-                    position=(-5 + i*5, 8 + j*6, -20.8)
-                )
-
-# Moat around castle
-moat = Entity(
-    model='cube',
-    color=WATER_BLUE,
-    scale=(60, 0.1, 60),
-    position=(0, -0.05, -30)
-)
-
-# Stone path leading to castle
-main_path = Entity(
-    model='cube',
-    color=PATH_STONE,
-    scale=(10, 0.2, 40),
-    position=(0, 0.1, 0),
-    collider='box'
-)
-
-# Decorative trees (simple representation)
-class Tree(Entity):
-    def __init__(self, x, z):
-        super().__init__()
-        self.trunk = Entity(
-            parent=self,
-            model='cylinder',
-            color=color.rgb(101, 67, 33),
-            scale=(1, 5, 1),
-            position=(x, 2.5, z)
-        )
-        self.leaves = Entity(
-            parent=self,
-            model='sphere',
-            color=color.rgb(34, 139, 34),
-            scale=(5, 5, 5),
-            position=(x, 6, z)
-        )
-
-# Place trees around the castle
-tree_positions = [
-    (-30, -10), (30, -10),
-    (-35, -40), (35, -40),
-    (-25, -55), (25, -55),
-    (-40, 10), (40, 10),
-    (-20, 15), (20, 15)
-]
-
-for pos in tree_positions:
-    Tree(pos[0], pos[1])
-
-# Hills in background
-for i in range(5):
-    hill = Entity(
-        model='sphere',
-        color=GRASS_GREEN,
-        scale=(20 + i*3, 10 + i*2, 20 + i*3),
-        position=(-60 + i*30, -5, -80 - i*10)
-    )
-
-# Create small decorative elements
-class Coin(Entity):
-    def __init__(self, position):
-        super().__init__(
-            model='cylinder',
-            color=color.rgb(255, 215, 0),
-            scale=(0.8, 0.1, 0.8),
-            position=position,
-            rotation=(90, 0, 0)
-        )
-        self.rotation_speed = 100
-    
-    def update(self):
-        self.rotation_y += self.rotation_speed * time.dt
-
-# Place some coins
-coin_positions = [
-    (5, 1, 5),
-    (-5, 1, 5),
-    (0, 1, 10),
-    (10, 1, -5),
-    (-10, 1, -5)
-]
-
-coins = [Coin(pos) for pos in coin_positions]
-
 # Player controller (Mario-style)
 class MarioController(FirstPersonController):
     def __init__(self):
@@ -469,20 +302,73 @@ class MarioController(FirstPersonController):
         if key == 'ctrl' and not self.grounded:
             self.y_velocity = -20
 
-# Create castle instance
-castle = PeachCastle()
-
-# Create player
-player = MarioController()
-
-# Fix lighting - set ambient light first, then directional
-scene.ambient_light = Vec4(0.4, 0.4, 0.4, 1.0)
+def warm_assets():
+    """Load the models and textures the castle needs ahead of time"""
+    for name in ('plane', 'cube', 'sphere'):
+        load_model(name)
+        yield name
+    load_texture('grass')
+    yield 'grass'
+
+def build_world():
+    """Build the castle a piece per frame while the menu is up"""
+    global sky, ground, grounds, coins, castle, player, sun
+    
+    # Full-screen gradient sky, drawn behind everything in one pass
+    sky = GradientSky('castle')
+    yield 'sky'
+    
+    # Ground plane with grass texture
+    ground = Entity(
+        model='plane',
+        color=GRASS_GREEN,
+        scale=(200, 1, 200),
+        position=(0, 0, 0),
+        texture='grass',
+        texture_scale=(40, 40),
+        collider='box'
+    )
+    yield 'ground'
+    
+    # Castle grounds: moat, path, trees, hills and coins
+    grounds = CastleGrounds()
+    coins = grounds.coins
+    yield 'grounds'
+    
+    # Create castle instance
+    castle = PeachCastle()
+    yield 'castle'
+    
+    # Create player
+    player = MarioController()
+    yield 'player'
+    
+    # Fix lighting - set ambient light first, then directional
+    scene.ambient_light = Vec4(0.4, 0.4, 0.4, 1.0)
+    
+    # Add directional light (sun) with proper intensity
+    sun = DirectionalLight()
+    sun.look_at(Vec3(1, -1, -1))
+    sun.color = color.rgb(1, 0.9, 0.8)
+    sun.intensity = 0.6
+    
+    # Static geometry never moves, so light it once into vertex colors;
+    # the sun keeps lighting the player, coins and the moat's waves
+    if quality_preset()['bake_static']:
+        from sm64.bake import bake_static_lighting
+        bake_static_lighting([ground, castle, grounds], sun, ambient=scene.ambient_light, exclude=[*coins, grounds.moat],
+                             cache='castle-build0')
+        yield 'lighting bake'
+    
+    # Quality preset (SM64_QUALITY=low/medium/high)
+    apply_quality(lights=[sun])
+    yield 'lighting'
 
-# Add directional light (sun) with proper intensity
-sun = DirectionalLight()
-sun.look_at(Vec3(1, -1, -1))
-sun.color = color.rgb(1, 0.9, 0.8)
-sun.intensity = 0.6
+loader = DeferredLoader(startup)
+loader.add(warm_assets(), 'assets')
+loader.add(build_world())
+loader.on_done.append(lambda: print(startup.report()))
+loader.start()
 
 # Info text (hidden initially)
 info_text = Text(
@@ -534,6 +420,10 @@ def return_to_menu():
     title_text.enabled = False
     window.color = color.black
     window.fps_counter.enabled = False
+    
+    if menu.save_file:
+        menu.save_file.save()
+    menu.refresh_slots()
 
 # Set background color as fallback
 camera.background_color = SKY_BLUE
@@ -548,5 +438,6 @@ print("♪ Spaceworld menu theme playing ♪")
 print("Use ↑↓ arrows to select, ENTER to start")
 print("ESC returns to menu during gameplay")
 
-# Run the application
-app.run()
+# Run the application (launcher.py hosts builds in its own window)
+if __name__ == '__main__':
+    app.run()
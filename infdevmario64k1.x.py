@@ -5,20 +5,32 @@ Optimized for performance and stability
 All areas working without crashes
 """
 
-from ursina import *
-from ursina.prefabs.first_person_controller import FirstPersonController
-import math
-import random
+from sm64.startup import StartupTimer, DeferredLoader
+
+# Time every startup phase from here on
+startup = StartupTimer()
+
+# Only what the menu needs, the game world's modules are imported by the loader
+with startup.phase('import'):
+    from ursina import *
+    from ursina.prefabs.first_person_controller import FirstPersonController
+    import math
+    import os
+    import random
+    from sm64.gcpolicy import GCPolicy, GCReadout
+    from sm64.quality import apply_quality
+    from sm64.saves import SaveFile, read_stars
 
 # Initialize app with optimized settings
-app = Ursina(
-    title='Ultra Mario 64 - Stable Edition',
-    borderless=False,
-    fullscreen=False,
-    vsync=True,
-    development_mode=False,
-    size=(1280, 720)
-)
+with startup.phase('window'):
+    app = Ursina(
+        title='Ultra Mario 64 - Stable Edition',
+        borderless=False,
+        fullscreen=False,
+        vsync=True,
+        development_mode=False,
+        size=(1280, 720)
+    )
 
 # Optimize texture loading
 Text.default_resolution = 1080 * Text.size
@@ -40,10 +52,50 @@ game_state = {
     'current_course': None
 }
 
+# Courses whose stars are saved one by one, in save file order
+COURSE_IDS = ('bob_omb', 'whomps', 'cool_cool', 'jolly_roger', 'bowser1')
+save_file = SaveFile(1, courses=COURSE_IDS)
+# Playtest bots (sm64.playtest) turn this off, their runs never reach the save file or the ghosts
+record_progress = True
+# Stars added with F3, counted on screen but kept out of the save
+debug_stars = 0
+
+def load_save():
+    """Copy the save file into game_state"""
+    global debug_stars
+    debug_stars = 0
+    game_state['stars_collected'] = save_file['stars']
+    game_state['coins'] = save_file['coins']
+    game_state['lives'] = save_file['lives']
+
+def write_save():
+    """Copy game_state into the save file, the disk is only touched if something changed"""
+    save_file['stars'] = min(game_state['stars_collected'] - debug_stars, 0xffff)
+    save_file['coins'] = game_state['coins']
+    save_file['lives'] = game_state['lives']
+    if record_progress:
+        save_file.save()
+
+# Other players, when a presence server is given (SM64_PRESENCE=host:port)
+presence = None
+if os.environ.get('SM64_PRESENCE'):
+    from sm64.presence import client_from_env
+    presence = client_from_env()
+# Areas by the byte presence shares them as, anything else (the menu) is AWAY
+AREAS = ('castle_grounds',) + COURSE_IDS
+AWAY = 255
+
+def area_index():
+    area = game_state['current_area']
+    return AREAS.index(area) if game_state['game_started'] and area in AREAS else AWAY
+
 # Set window properties
 window.color = SKY_BLUE
 window.fps_counter.enabled = False
 
+# Quality preset (SM64_QUALITY=low/medium/high)
+apply_quality()
+
 class SimplifiedMarioHead(Entity):
     """Simplified Mario head for menu - less entities"""
     def __init__(self):
@@ -102,6 +154,7 @@ class SimplifiedMenu(Entity):
         # Menu options
         self.options = []
         self.selected = 0
+        self.confirming = False     # START GAME pressed once over an existing file
         
         menu_items = ['START GAME', 'CONTINUE', 'EXIT']
         
@@ -131,6 +184,13 @@ class SimplifiedMenu(Entity):
             color=color.gray,
             origin=(0, 0)
         )
+        
+        self.refresh_continue()
+    
+    def refresh_continue(self):
+        """Show the save file's stars next to CONTINUE, read from its header only"""
+        stars = read_stars(save_file.slot)
+        self.options[1].text = 'CONTINUE' if stars is None else f'CONTINUE  ★ × {stars}'
     
     def input(self, key):
         if not game_state['menu_active']:
@@ -147,6 +207,8 @@ class SimplifiedMenu(Entity):
     
     def update_cursor(self):
         self.cursor.y = 0.05 - self.selected * 0.1
+        self.confirming = False
+        self.options[0].text = 'START GAME'
         
         # Highlight selected
         for i, opt in enumerate(self.options):
@@ -154,13 +216,27 @@ class SimplifiedMenu(Entity):
     
     def select_option(self):
         if self.selected == 0:  # Start Game
+            # A new game replaces the file on the next save, so an existing one takes a second press
+            if record_progress and read_stars(save_file.slot) is not None and not self.confirming:
+                self.confirming = True
+                self.options[0].text = 'START GAME - ERASE FILE?'
+                return
+            self.update_cursor()
+            save_file.reset()
+            load_save()
             self.start_game()
         elif self.selected == 1:  # Continue
+            if not save_file.load():
+                print("No save file found! Starting new game...")
+            load_save()
             self.start_game()
         elif self.selected == 2:  # Exit
             application.quit()
     
     def start_game(self):
+        # Make sure the deferred world is finished before we use it
+        loader.finish()
+        
         game_state['menu_active'] = False
         game_state['game_started'] = True
         game_state['current_area'] = 'castle_grounds'
@@ -168,13 +244,19 @@ class SimplifiedMenu(Entity):
         self.enabled = False
         mario_head.enabled = False
         
-        # Enable game elements
+        # Enable game elements, the orbit camera after the controller so it keeps the camera
         player.enabled = True
+        lakitu.enabled = True
         castle.enabled = True
         hud.enabled = True
+        hud.update_display()
         
         # Position player
         player.position = Vec3(0, 1, 0)
+        track_snapshots()
+        snapshots.enabled = True
+        gc_policy.transition()
+        gc_policy.gameplay()
         
         print("Game Started! Welcome to Peach's Castle!")
 
@@ -183,6 +265,9 @@ class OptimizedCastle(Entity):
     def __init__(self):
         super().__init__(enabled=False)
         
+        # Drives painting ripples on the GPU
+        self.motion = MotionClock(self)
+        
         # Castle grounds
         self.ground = Entity(
             parent=self,
@@ -243,63 +328,70 @@ class OptimizedCastle(Entity):
     
     def create_paintings(self):
         """Create course entrance paintings"""
-        self.paintings = []
+        # Positions are in castle space, which is also world space
+        self.entrances = ComponentStore(
+            capacity=8,
+            position=(np.float32, 3),
+            course_id=object,
+            ripple_end=np.float32     # MotionClock time the current ripple finishes
+        )
         
         # Bob-omb Battlefield
-        painting1 = CourseEntrance(
+        self.add_entrance(CourseEntrance(
             name='BOB-OMB\nBATTLEFIELD',
-            course_id='bob_omb',
             position=(-10, 3, -19.5),
             color=color.green,
             parent=self
-        )
-        self.paintings.append(painting1)
+        ), 'bob_omb')
         
         # Whomp's Fortress
-        painting2 = CourseEntrance(
+        self.add_entrance(CourseEntrance(
             name="WHOMP'S\nFORTRESS",
-            course_id='whomps',
             position=(10, 3, -19.5),
             color=color.brown,
             parent=self
-        )
-        self.paintings.append(painting2)
+        ), 'whomps')
         
         # Cool Cool Mountain
-        painting3 = CourseEntrance(
+        self.add_entrance(CourseEntrance(
             name='COOL COOL\nMOUNTAIN',
-            course_id='cool_cool',
             position=(-15, 3, -25),
             rotation_y=90,
             color=color.white,
             parent=self
-        )
-        self.paintings.append(painting3)
+        ), 'cool_cool')
         
         # Jolly Roger Bay
-        painting4 = CourseEntrance(
+        self.add_entrance(CourseEntrance(
             name='JOLLY ROGER\nBAY',
-            course_id='jolly_roger',
             position=(15, 3, -25),
             rotation_y=-90,
             color=color.blue,
             parent=self
-        )
-        self.paintings.append(painting4)
+        ), 'jolly_roger')
         
         # Bowser Stage
-        painting5 = CourseEntrance(
+        self.add_entrance(CourseEntrance(
             name='BOWSER\nDARK WORLD',
-            course_id='bowser1',
             position=(0, 8, -29.5),
             color=color.red,
             parent=self
-        )
-        self.paintings.append(painting5)
+        ), 'bowser1')
+    
+    def add_entrance(self, painting, course_id):
+        return self.entrances.add(painting, position=painting.position, course_id=course_id, ripple_end=-1)
+    
+    def ripple(self, row):
+        """Play a painting's ripple once on the GPU, no per-frame update needed"""
+        entrances = self.entrances
+        if self.motion.time < entrances.ripple_end[row]:
+            return
+        duration = self.motion.ripple(entrances.nodes[row], speed=5, amplitude=(0.1 / 3, 0.1 / 4))
+        entrances.ripple_end[row] = self.motion.time + duration
 
 class CourseEntrance(Entity):
-    """Optimized painting entrance"""
-    def __init__(self, name, course_id, **kwargs):
+    """Optimized painting entrance, its state lives in OptimizedCastle.entrances"""
+    def __init__(self, name, **kwargs):
         super().__init__(
             model='cube',
             scale=(3, 4, 0.2),
@@ -307,9 +399,6 @@ class CourseEntrance(Entity):
             **kwargs
         )
         
-        self.course_id = course_id
-        self.course_name = name
-        
         # Simple text label
         self.label = Text(
             name,
@@ -319,38 +408,19 @@ class CourseEntrance(Entity):
             color=color.white,
             origin=(0, 0)
         )
-        
-        # Ripple effect
-        self.ripple_time = 0
-        self.is_rippling = False
-        
-    def update(self):
-        if self.is_rippling:
-            self.ripple_time += time.dt * 5
-            self.scale_x = 3 + math.sin(self.ripple_time) * 0.1
-            self.scale_y = 4 + math.cos(self.ripple_time) * 0.1
-            
-            if self.ripple_time > math.pi * 2:
-                self.is_rippling = False
-                self.ripple_time = 0
-                self.scale = (3, 4, 0.2)
 
 class SimpleCourse(Entity):
     """Base class for simplified courses"""
     def __init__(self, name):
         super().__init__(enabled=False)
         self.course_name = name
+        self.terrain = None
+        self.nav = None
+        self.flow = None
+        self.platforms = None
         
         # Basic ground
-        self.ground = Entity(
-            parent=self,
-            model='cube',
-            color=color.green,
-            scale=(60, 1, 60),
-            position=(0, -0.5, 0),
-            texture='white_cube',
-            collider='box'
-        )
+        self.create_ground()
         
         # Add some platforms
         self.create_platforms()
@@ -364,7 +434,7 @@ class SimpleCourse(Entity):
             model='cube',
             color=color.rgba(255, 255, 0, 128),
             scale=(2, 3, 0.5),
-            position=(0, 1.5, 25),
+            position=(0, self.ground_height(0, 25) + 1.5, 25),
             collider='box'
         )
         
@@ -377,77 +447,157 @@ class SimpleCourse(Entity):
             origin=(0, 0)
         )
     
+    def create_ground(self):
+        self.ground = Entity(
+            parent=self,
+            model='cube',
+            color=color.green,
+            scale=(60, 1, 60),
+            position=(0, -0.5, 0),
+            texture='white_cube',
+            collider='box'
+        )
+    
+    def ground_height(self, x, z):
+        """Height of the course floor, terrain courses have slopes"""
+        if self.terrain:
+            return self.terrain.height_at(x, z)
+        return 0
+    
+    def bake_navigation(self):
+        """Walkable cells from the course's colliders, and a flow field toward Mario for enemies to share"""
+        cache = self.course_name.lower().replace(' ', '_').replace("'", '')
+        moving = self.platforms.bodies if self.platforms else ()
+        self.nav = NavGrid.bake(self, self.ground, self.terrain, exclude=moving, cache=cache)
+        self.flow = FlowField(self.nav)
+    
     def create_platforms(self):
-        # Create some simple platforms
+        # Create some simple platforms, laid out the same every run so the nav bake stays cached
+        rng = random.Random(self.course_name)
         for i in range(5):
+            x, z = rng.uniform(-20, 20), rng.uniform(-20, 20)
             platform = Entity(
                 parent=self,
                 model='cube',
                 color=color.brown,
                 scale=(5, 1, 5),
-                position=(
-                    random.uniform(-20, 20),
-                    random.uniform(1, 8),
-                    random.uniform(-20, 20)
-                ),
+                position=(x, self.ground_height(x, z) + rng.uniform(1, 8), z),
                 texture='white_cube',
                 collider='box'
             )
     
     def create_stars(self):
-        # Add collectible stars
-        self.stars = []
+        # Add collectible stars, positions are in course space (courses sit at the origin)
+        self.stars = ComponentStore(
+            capacity=4,
+            position=(np.float32, 3),
+            collected=np.bool_,
+            angle=np.float32,
+            phase=np.float32
+        )
         for i in range(3):
+            x, z = random.uniform(-20, 20), random.uniform(-20, 20)
             star = SimpleStar(
-                position=(
-                    random.uniform(-20, 20),
-                    random.uniform(2, 10),
-                    random.uniform(-20, 20)
-                ),
+                position=(x, self.ground_height(x, z) + random.uniform(2, 10), z),
                 parent=self
             )
-            self.stars.append(star)
+            self.stars.add(star, position=star.position, phase=random.uniform(0, math.tau))
+    
+    def track_state(self, snapshots):
+        """Add what the course changes while it's played to a SnapshotRing"""
+        stars = self.stars
+        def show_stars():
+            for row in stars.rows().tolist():
+                stars.nodes[row].enabled = not stars.collected[row]
+        snapshots.add_store('stars', stars, after=show_stars)
+        if self.platforms:
+            platforms = self.platforms
+            def read_clock(out):
+                out[0] = platforms.time
+            def write_clock(values):
+                platforms.time = float(values[0])
+                platforms.refresh()
+            snapshots.add('platforms', read_clock, write_clock, 1, np.float64)
+    
+    def update(self):
+        # Spin and bob every uncollected star in one pass
+        stars = self.stars
+        rows = stars.rows(~stars.collected)
+        stars.angle[rows] = (stars.angle[rows] + 100 * time.dt) % 360
+        bob = np.sin(time.time() * 2 + stars.phase[rows]) * 0.25
+        heights = stars.position[rows, 1] + bob
+        for row, angle, y in zip(rows.tolist(), stars.angle[rows].tolist(), heights.tolist()):
+            node = stars.nodes[row]
+            node.rotation_y = angle
+            node.y = y
 
 class BobOmbBattlefield(SimpleCourse):
     """Simplified Bob-omb Battlefield"""
     def __init__(self):
         super().__init__("Bob-omb Battlefield")
         
-        # Mountain in center
-        self.mountain = Entity(
-            parent=self,
-            model='cone',
-            color=color.brown,
-            scale=(15, 20, 15),
-            position=(0, 10, 0),
-            collider='box'
-        )
-        
         # Some cannons
-        for pos in [(15, 0, 15), (-15, 0, -15)]:
+        self.cannons = []
+        for x, z in [(15, 15), (-15, -15)]:
             cannon = Entity(
                 parent=self,
                 model='cylinder',
                 color=color.black,
                 scale=(2, 3, 2),
-                position=pos,
+                position=(x, self.ground_height(x, z), z),
                 rotation=(30, 0, 0),
                 collider='box'
             )
+            self.cannons.append(cannon)
         
-        # Simple enemies (just decorative spheres)
-        for i in range(5):
-            bobomb = Entity(
-                parent=self,
-                model='sphere',
-                color=color.black,
-                scale=1,
-                position=(
-                    random.uniform(-20, 20),
-                    0.5,
-                    random.uniform(-20, 20)
-                )
-            )
+        # Cannonballs lob at Mario and stop on anything solid except the cannons they leave from
+        self.cannon_shots = ProjectilePool('cannonball', capacity=16, parent=self, terrain=self.terrain, target=player,
+                                           on_hit=hurt_player, boxes=static_boxes(self, exclude=self.cannons))
+        self.cannon_clock = 0
+        
+        # Enemies walk the terrain and go after Mario around the cannons and
+        # platforms, simulated a swarm at a time
+        self.bake_navigation()
+        self.bobombs = EnemySwarm('bobomb', 24, area=40, parent=self, target=player, terrain=self.terrain,
+                                  flow=self.flow, on_hit=hurt_player, seed=1)
+        self.goombas = EnemySwarm('goomba', 24, area=40, parent=self, target=player, terrain=self.terrain,
+                                  flow=self.flow, on_hit=hurt_player, seed=2)
+    
+    def track_state(self, snapshots):
+        super().track_state(snapshots)
+        snapshots.add_store('bobombs', self.bobombs.enemies, after=self.bobombs.refresh)
+        snapshots.add_store('goombas', self.goombas.enemies, after=self.goombas.refresh)
+        snapshots.add_store('cannon_shots', self.cannon_shots.shots, after=self.cannon_shots.refresh)
+        def read_clock(out):
+            out[0] = self.cannon_clock
+        def write_clock(values):
+            self.cannon_clock = float(values[0])
+        snapshots.add('cannon_clock', read_clock, write_clock, 1)
+    
+    def update(self):
+        super().update()
+        
+        # Every cannon in range fires together every few seconds
+        self.cannon_clock += time.dt
+        if self.cannon_clock < 2.5:
+            return
+        self.cannon_clock = 0
+        for cannon in self.cannons:
+            if distance_xz(cannon, player) < 40:
+                muzzle = cannon.position + cannon.up * 1.8
+                self.cannon_shots.fire(muzzle, launch_velocity(muzzle, player.position + Vec3(0, 1, 0), 18))
+    
+    def create_ground(self):
+        # Rolling field with the summit mountain behind the start
+        field = HeightField.from_function(
+            lambda x, z: mountain(x, z, center=(0, -45), height=24, radius=22) + rolling_hills(x, z, seed=1) + 1.5,
+            width=160, depth=160
+        )
+        self.terrain = self.ground = Terrain(
+            field,
+            parent=self,
+            bands=((3, (0.35, 0.65, 0.25)), (14, (0.3, 0.55, 0.2)), (1e9, (0.55, 0.45, 0.3)))
+        )
 
 class WhompsFortress(SimpleCourse):
     """Simplified Whomp's Fortress"""
@@ -474,42 +624,97 @@ class WhompsFortress(SimpleCourse):
             position=(0, 12.5, -15),
             collider='box'
         )
+        
+        # Moving platforms, all posed by one scheduler that carries Mario along
+        self.platforms = PlatformScheduler(rider=player, parent=self)
+        
+        # Stairs of sliding blocks up the east wall
+        for i in range(10):
+            self.platforms.add_slider((14, 1.5 + i * 1.4, 12 - i * 2.6), offset=(2.5, 0, 0), period=4, phase=i / 10,
+                                      color=color.light_gray)
+        
+        # Spinning planks on the roof
+        for x, z in [(-5, -5), (5, -5), (-5, 5), (5, 5)]:
+            self.platforms.add_spinner((x, 15.25, z), speed=40 if x * z > 0 else -40, color=color.brown)
+        
+        # A lane of Whomps along the west side, slamming in turn
+        for i in range(8):
+            self.platforms.add_whomp((-15, 0, 18 - i * 4), heading=180, period=6, phase=i / 8, color=color.gray)
 
 class CoolCoolMountain(SimpleCourse):
     """Simplified Cool Cool Mountain"""
     def __init__(self):
         super().__init__("Cool Cool Mountain")
         
-        # Snow ground
-        self.ground.color = color.white
-        
-        # Mountain
-        self.mountain = Entity(
-            parent=self,
-            model='cone',
-            color=color.white,
-            scale=(20, 30, 20),
-            position=(0, 15, 0),
-            collider='box'
-        )
-        
-        # Slide entrance
+        # Slide entrance on the summit
         self.cabin = Entity(
             parent=self,
             model='cube',
             color=color.brown,
             scale=(5, 4, 5),
-            position=(0, 25, 0),
+            position=(0, self.ground_height(0, -40) + 2, -40),
             collider='box'
         )
+        
+        # Slide spiraling down from the cabin door to the foot of the mountain
+        points = []
+        for i in range(40):
+            angle, radius = i * 0.15, 4.5 + i * 0.85
+            x, z = math.sin(angle) * radius, -40 + math.cos(angle) * radius
+            points.append((x, self.ground_height(x, z) + 1, z))
+        self.slide = SlideTrack(CatmullRom(points), parent=self, color=color.rgb(170/255, 215/255, 1), on_finish=self.leave_slide)
+    
+    def leave_slide(self, rider):
+        rider.riding = None
+    
+    def track_state(self, snapshots):
+        super().track_state(snapshots)
+        slide = self.slide
+        def read_slide(out):
+            out[:] = (slide.rider is not None, slide.distance, slide.speed, slide.offset)
+        def write_slide(values):
+            riding, slide.distance, slide.speed, slide.offset = values.tolist()
+            slide.rider = player if riding else None
+            player.riding = slide.rider and slide
+        snapshots.add('slide', read_slide, write_slide, 4)
+    
+    def update(self):
+        super().update()
+        
+        # Stepping onto the start of the slide sends Mario down it
+        if not player.riding and distance(player.position, self.slide.start) < 2:
+            self.slide.ride(player)
+            player.riding = self.slide
+    
+    def create_ground(self):
+        # Snowy mountain taking up most of the course
+        field = HeightField.from_function(
+            lambda x, z: mountain(x, z, center=(0, -40), height=30, radius=35) + rolling_hills(x, z, amplitude=0.8, seed=2),
+            width=160, depth=160
+        )
+        self.terrain = self.ground = Terrain(
+            field,
+            parent=self,
+            bands=((1e9, (0.95, 0.96, 1.0)),),
+            cliff_color=(0.55, 0.6, 0.7),
+            cliff_slope=0.5
+        )
 
 class JollyRogerBay(SimpleCourse):
     """Simplified Jolly Roger Bay"""
     def __init__(self):
         super().__init__("Jolly Roger Bay")
         
-        # Water effect
-        self.ground.color = color.rgba(0, 100, 200, 128)
+        # Sandy sea floor under an animated bay that reaches out past the course
+        self.ground.color = color.rgb(194/255, 178/255, 128/255)
+        self.water = WaterSurface(
+            parent=self,
+            size=60,
+            ring_size=240,
+            waves=OCEAN_WAVES,
+            color=color.rgba(0, 100/255, 200/255, 0.7),
+            position=(0, 1, 0)
+        )
         
         # Sunken ship
         self.ship = Entity(
@@ -558,9 +763,39 @@ class BowserStage(SimpleCourse):
             scale=(1.2, 1.1, 1.3),
             position=(0, 0, -0.3)
         )
+        
+        # Fans of fireballs, all drawn from one pool
+        self.fireballs = ProjectilePool('fireball', capacity=64, parent=self, target=player, on_hit=hurt_player,
+                                        boxes=static_boxes(self))
+        self.attack_clock = 0
+    
+    def track_state(self, snapshots):
+        super().track_state(snapshots)
+        snapshots.add_store('fireballs', self.fireballs.shots, after=self.fireballs.refresh)
+        def read_clock(out):
+            out[0] = self.attack_clock
+        def write_clock(values):
+            self.attack_clock = float(values[0])
+        snapshots.add('attack_clock', read_clock, write_clock, 1)
+    
+    def update(self):
+        super().update()
+        
+        self.attack_clock += time.dt
+        if self.attack_clock < 1.5:
+            return
+        self.attack_clock = 0
+        mouth = self.bowser.position + Vec3(0, 1.5, 0)
+        aim = player.position + Vec3(0, 1, 0) - mouth
+        heading = math.atan2(aim.x, aim.z)
+        pitch = math.atan2(aim.y, math.hypot(aim.x, aim.z))
+        for i in range(-4, 5):
+            angle = heading + math.radians(i * 12)
+            self.fireballs.fire(mouth, (math.sin(angle) * math.cos(pitch) * 10, math.sin(pitch) * 10,
+                                        math.cos(angle) * math.cos(pitch) * 10))
 
 class SimpleStar(Entity):
-    """Simple collectible star"""
+    """Simple collectible star, its state lives in the course's stars store"""
     def __init__(self, **kwargs):
         super().__init__(
             model='sphere',
@@ -568,13 +803,6 @@ class SimpleStar(Entity):
             scale=1,
             **kwargs
         )
-        
-        self.collected = False
-        
-    def update(self):
-        if not self.collected:
-            self.rotation_y += 100 * time.dt
-            self.y += math.sin(time.time() * 2) * 0.01
 
 class SimpleHUD(Entity):
     """Simplified HUD"""
@@ -623,6 +851,12 @@ class SimpleHUD(Entity):
         self.area_text.enabled = True
         invoke(setattr, self.area_text, 'enabled', False, delay=3)
 
+def hurt_player(kind):
+    """An enemy got Mario"""
+    game_state['lives'] = max(game_state['lives'] - 1, 0)
+    hud.update_display()
+    print(f"Hit by a {kind}! Lives: {game_state['lives']}")
+
 class MarioController(FirstPersonController):
     """Simplified Mario controller"""
     def __init__(self):
@@ -635,6 +869,55 @@ class MarioController(FirstPersonController):
         
         self.jump_count = 0
         self.last_jump_time = 0
+        self.grounded_on_terrain = False
+        self.last_y = self.y
+        self.riding = None      # a SlideTrack moving Mario along it
+        
+        # Seen from behind by the orbit camera
+        Entity(parent=self, model='cube', color=color.rgb(0, 92/255, 170/255), scale=(0.8, 1, 0.6), y=0.5)
+        Entity(parent=self, model='sphere', color=color.rgb(230/255, 0, 18/255), scale=0.7, y=1.35)
+    
+    def update(self):
+        if self.riding:
+            # The track places Mario itself
+            self.last_y = self.y
+            return
+        
+        # Jumps animate y before entity updates run, so compare with the end of last frame
+        rising = self.y > self.last_y
+        super().update()
+        
+        # Terrain has no colliders, stand on the heightfield instead;
+        # follow it down slopes unless a jump is carrying us up
+        course = game_state['current_course']
+        terrain = course.terrain if course else None
+        if terrain:
+            ground = terrain.height_at(self.x, self.z)
+            if self.y < ground or (self.grounded_on_terrain and not rising and self.y - ground < 0.5):
+                self.y = ground
+                if not self.grounded:
+                    self.land()
+                self.grounded_on_terrain = True
+            else:
+                self.grounded_on_terrain = False
+        self.last_y = self.y
+    
+    def read_state(self, out):
+        """Transform and motion into a snapshot channel"""
+        out[:] = (self.x, self.y, self.z, self.rotation_y, self.camera_pivot.rotation_x,
+                  self.air_time, self.grounded, self.jump_count)
+    
+    def write_state(self, values):
+        x, y, z, heading, pitch, self.air_time, grounded, jump_count = values.tolist()
+        # A jump in progress would keep animating y from where it was
+        if hasattr(self, 'y_animator'):
+            self.y_animator.kill()
+        self.position = Vec3(x, y, z)
+        self.rotation_y = heading
+        self.camera_pivot.rotation_x = pitch
+        self.grounded = bool(grounded)
+        self.jump_count = int(jump_count)
+        self.last_y = y
         
     def input(self, key):
         super().input(key)
@@ -653,28 +936,179 @@ class MarioController(FirstPersonController):
                 self.jump_height = 2
             self.last_jump_time = current_time
 
-# Create game objects
-print("Loading game objects...")
-mario_head = SimplifiedMarioHead()
-menu = SimplifiedMenu()
-player = MarioController()
-castle = OptimizedCastle()
-hud = SimpleHUD()
+# Create the menu first so it is on screen by the first frame
+with startup.phase('scene build', 'menu'):
+    mario_head = SimplifiedMarioHead()
+    menu = SimplifiedMenu()
 
 # Course instances (created on demand)
 courses = {}
+# Set while a painting's ripple plays, so holding E enters once
+entering = False
+
+# (area, snapshot) taken with F5, restored with F8
+quicksave = None
+
+# Started and stopped with F4, samples are tagged with the area
+profiler = None
+
+def memory_areas():
+    """Root entity of every area, for the memory ledger"""
+    areas = {'menu': menu, 'mario_head': mario_head}
+    if loader.done:
+        areas.update(player=player, castle=castle, hud=hud, sky=sky)
+        if presence:
+            areas['avatars'] = avatars
+    areas.update(courses)
+    return areas
+
+# Collections happen between scenes rather than mid-frame, their pauses show under the fps counter
+gc_policy = GCPolicy()
+gc_readout = GCReadout(gc_policy, enabled=False)
+
+# Best run to a star on the current course, replayed while racing it
+ghost = None
 
 # Camera setup
 camera.fov = 60
 camera.position = (0, 0, 5)
 
-# Simple sky
-sky = Entity(
-    model='sphere',
-    color=SKY_BLUE,
-    scale=500,
-    double_sided=True
-)
+def import_gameplay():
+    """Modules only the game world uses, imported while the menu is up"""
+    global np, ComponentStore, EnemySwarm, AIR, IDLE, SLIDE, WALK, Ghost, GhostRecorder, GhostRun, ghost_path
+    global LakituCamera, MemoryLedger, MemoryOverlay, MotionClock, FlowField, NavGrid, static_boxes
+    global PlatformScheduler, ProjectilePool, launch_velocity, AvatarPool, PresencePanel, SnapshotRing
+    global GradientSky, SKY_PRESETS, CatmullRom, SlideTrack, WaterSurface, OCEAN_WAVES
+    global HeightField, Terrain, mountain, rolling_hills
+    import numpy as np
+    from sm64.components import ComponentStore
+    from sm64.snapshots import SnapshotRing
+    yield 'numpy'
+    from sm64.motion import MotionClock
+    from sm64.sky import GradientSky, SKY_PRESETS
+    from sm64.lakitu import LakituCamera
+    from sm64.ghosts import AIR, IDLE, SLIDE, WALK, Ghost, GhostRecorder, GhostRun, ghost_path
+    from sm64.remote import AvatarPool, PresencePanel
+    yield 'castle modules'
+    from sm64.memory import MemoryLedger, MemoryOverlay
+    yield 'memory'
+    from sm64.enemies import EnemySwarm
+    from sm64.navigation import FlowField, NavGrid, static_boxes
+    from sm64.platforms import PlatformScheduler
+    from sm64.projectiles import ProjectilePool, launch_velocity
+    from sm64.splines import CatmullRom, SlideTrack
+    from sm64.water import WaterSurface, OCEAN_WAVES
+    from sm64.terrain import HeightField, Terrain, mountain, rolling_hills
+    yield 'course modules'
+
+def warm_assets():
+    """Load the models and textures the castle needs ahead of time"""
+    for name in ('cube', 'sphere', 'cone', 'cylinder'):
+        load_model(name)
+        yield name
+    load_texture('white_cube')
+    yield 'white_cube'
+
+def read_game_state(out):
+    out[:] = (game_state['stars_collected'], game_state['coins'], game_state['lives'], debug_stars)
+
+def write_game_state(values):
+    global debug_stars
+    game_state['stars_collected'], game_state['coins'], game_state['lives'], debug_stars = (int(v) for v in values)
+    hud.update_display()
+
+def mario_anim():
+    """What Mario is doing, as a ghost animation state"""
+    if player.riding:
+        return SLIDE
+    if not (player.grounded or player.grounded_on_terrain):
+        return AIR
+    if held_keys['w'] or held_keys['a'] or held_keys['s'] or held_keys['d']:
+        return WALK
+    return IDLE
+
+def start_ghost_race(course):
+    """Record this visit, racing the course's best run to a star if there is one"""
+    global ghost
+    stop_ghost_race()
+    run = GhostRun.load(ghost_path(game_state['current_area']))
+    if run:
+        ghost = Ghost(run, parent=course)
+    recorder.restart()
+    recorder.enabled = True
+
+def stop_ghost_race():
+    global ghost
+    recorder.enabled = False
+    if ghost:
+        ghost.run.close()
+        destroy(ghost)
+        ghost = None
+
+def void_ghost_race():
+    """A rewind or quickload breaks the clock, the run goes on but can't become the ghost"""
+    if recorder.enabled:
+        recorder.enabled = False
+        print("Debug: This run no longer counts for the ghost")
+
+def finish_ghost_race():
+    """A star ends the run, it becomes the course's ghost if it beat the old one"""
+    if not recorder.enabled or not record_progress:
+        return
+    recorder.enabled = False
+    if ghost and recorder.ticks >= ghost.run.ticks:
+        print(f"Run: {recorder.duration:.2f} s, best is {ghost.run.duration:.2f} s")
+        return
+    # Unmaps the old run, os.replace() can't write over a mapped file on Windows
+    stop_ghost_race()
+    recorder.save(ghost_path(game_state['current_area']))
+    print(f"New best run: {recorder.duration:.2f} s")
+
+def track_snapshots(course=None):
+    """Point the snapshot ring at Mario, game_state and the course being played, if any"""
+    snapshots.reset()
+    snapshots.add('player', player.read_state, player.write_state, 8)
+    snapshots.add('game', read_game_state, write_game_state, 4, np.int32)
+    if course:
+        course.track_state(snapshots)
+
+def build_world():
+    """Build the game objects a piece per frame while the menu is up"""
+    global player, lakitu, snapshots, recorder, castle, hud, sky, avatars, presence_panel, memory, memory_overlay
+    print("Loading game objects...")
+    
+    # Memory by area and class, shown with F12 and written out with F11
+    memory = MemoryLedger(memory_areas)
+    memory_overlay = MemoryOverlay(memory, enabled=False)
+    
+    player = MarioController()
+    # The controller grabs the camera, the orbit camera parks it for the menu until the game starts
+    lakitu = LakituCamera(player, enabled=False)
+    # A few seconds of rewind for QA, captured while the game runs
+    snapshots = SnapshotRing(capacity=80, rate=8, enabled=False)
+    recorder = GhostRecorder(player, anim=mario_anim, enabled=False)
+    if presence:
+        avatars = AvatarPool(presence, area_index)
+        presence_panel = PresencePanel(presence, enabled=False)
+    yield 'player'
+    
+    castle = OptimizedCastle()
+    yield 'castle'
+    
+    hud = SimpleHUD()
+    yield 'hud'
+    
+    # Screen-space sky, presets are swapped per course
+    sky = GradientSky('castle')
+    yield 'sky'
+
+loader = DeferredLoader(startup)
+loader.add(import_gameplay(), 'import')
+loader.add(warm_assets(), 'assets')
+loader.add(build_world())
+loader.on_done.append(lambda: print(startup.report()))
+loader.on_done.append(gc_policy.loaded)
+loader.start()
 
 def load_course(course_id):
     """Load a course on demand"""
@@ -692,48 +1126,83 @@ def load_course(course_id):
             courses[course_id] = BowserStage()
         else:
             courses[course_id] = SimpleCourse(f"Course {course_id}")
+        if not courses[course_id].nav:
+            courses[course_id].bake_navigation()
+        gc_policy.loaded()
     
     return courses[course_id]
 
 def enter_course(course_id):
     """Enter a course"""
+    global entering
+    entering = False
     castle.enabled = False
     
     course = load_course(course_id)
     course.enabled = True
     
+    # Stars already won on this file stay gone
+    stars = course.stars
+    for row in stars.rows().tolist():
+        won = save_file.star_collected(course_id, row)
+        stars.collected[row] = won
+        stars.nodes[row].enabled = not won
+    
     game_state['current_course'] = course
     game_state['current_area'] = course_id
     
     player.position = Vec3(0, 2, 0)
+    lakitu.ground = course.terrain.height_at if course.terrain else None
+    sky.set_preset(course_id if course_id in SKY_PRESETS else 'castle')
     
     hud.show_area(course.course_name)
+    track_snapshots(course)
+    start_ghost_race(course)
+    gc_policy.transition()
     print(f"Entered {course.course_name}!")
 
 def exit_course():
     """Exit current course"""
+    left = game_state['current_area']
     if game_state['current_course']:
         game_state['current_course'].enabled = False
         game_state['current_course'] = None
+    stop_ghost_race()
     
     castle.enabled = True
     game_state['current_area'] = 'castle_grounds'
     
+    if player.riding:
+        player.riding.release()
+        player.riding = None
     player.position = Vec3(0, 1, 0)
+    lakitu.ground = None
+    sky.set_preset('castle')
+    write_save()
+    track_snapshots()
     
+    # Each visit should leave the course as big as the last one did
+    leak = memory.visited(left)
+    if leak:
+        print(f"Warning: {leak}")
+    gc_policy.transition()
     print("Returned to castle!")
 
 def update():
     """Main update loop"""
+    global entering
+    if presence and loader.done:
+        presence.publish(area_index(), player.world_position, player.world_rotation_y)
+    
     # Check for painting collisions
-    if game_state['game_started'] and castle.enabled:
-        for painting in castle.paintings:
-            dist = distance(player.position, painting.world_position)
-            if dist < 3:
-                # Show prompt
-                if held_keys['e']:
-                    painting.is_rippling = True
-                    invoke(enter_course, painting.course_id, delay=0.5)
+    if game_state['game_started'] and castle.enabled and not entering:
+        for row in castle.entrances.within(player.position, 3):
+            # Show prompt
+            if held_keys['e']:
+                entering = True
+                castle.ripple(row)
+                invoke(enter_course, castle.entrances.course_id[row], delay=0.5)
+                break
     
     # Check for exit portal in courses
     if game_state['current_course']:
@@ -743,16 +1212,21 @@ def update():
                 exit_course()
         
         # Check star collection
-        for star in course.stars:
-            if not star.collected and distance(player.position, star.world_position) < 2:
-                star.collected = True
-                star.enabled = False
-                game_state['stars_collected'] += 1
-                hud.update_display()
-                print(f"Star collected! Total: {game_state['stars_collected']}")
+        stars = course.stars
+        for row in stars.within(player.position, 2, ~stars.collected):
+            stars.collected[row] = True
+            stars.nodes[row].enabled = False
+            game_state['stars_collected'] += 1
+            save_file.collect_star(game_state['current_area'], row)
+            write_save()
+            finish_ghost_race()
+            hud.update_display()
+            print(f"Star collected! Total: {game_state['stars_collected']}")
 
 def input(key):
     """Global input handler"""
+    global quicksave, profiler, debug_stars
+    
     # Return to menu
     if key == 'escape':
         if game_state['game_started']:
@@ -767,15 +1241,19 @@ def input(key):
                 mario_head.enabled = True
                 
                 player.enabled = False
+                lakitu.enabled = False
+                snapshots.enabled = False
                 castle.enabled = False
                 hud.enabled = False
                 
-                camera.position = (0, 0, 5)
-                camera.rotation = (0, 0, 0)
+                write_save()
+                menu.refresh_continue()
+                gc_policy.menu()
     
     # Debug keys
     if key == 'f1':
         window.fps_counter.enabled = not window.fps_counter.enabled
+        gc_readout.enabled = window.fps_counter.enabled
     
     if key == 'f2' and game_state['game_started']:
         print(f"Area: {game_state['current_area']}")
@@ -784,8 +1262,60 @@ def input(key):
     
     if key == 'f3' and game_state['game_started']:
         game_state['stars_collected'] += 10
+        debug_stars += 10
         hud.update_display()
-        print(f"Debug: Added 10 stars!")
+        print(f"Debug: Added 10 stars, they won't be saved")
+    
+    if key == 'f4':
+        if profiler is None:
+            from sm64.profiler import SamplingProfiler
+            profiler = SamplingProfiler(context=lambda: game_state['current_area'], name='infdev')
+        if profiler.running:
+            path = profiler.stop()
+            print(profiler.summary())
+            print(f"Debug: Flame graph written to {path}")
+        else:
+            profiler.start()
+            print(f"Debug: Profiling at {profiler.rate} Hz, F4 again to stop")
+    
+    if key == 'f5' and game_state['game_started']:
+        quicksave = (game_state['current_area'], snapshots.snapshot())
+        print(f"Debug: Quicksaved in {game_state['current_area']}")
+    
+    if key == 'f6' and game_state['game_started']:
+        # Two seconds back per press
+        steps = snapshots.rewind(round(2 / snapshots.interval))
+        print(f"Debug: Rewound {steps * snapshots.interval:.1f} s")
+        if steps:
+            void_ghost_race()
+    
+    if key == 'f7' and presence:
+        presence_panel.enabled = not presence_panel.enabled
+    
+    if key == 'f8' and game_state['game_started']:
+        quickload()
+    
+    if key == 'f11' and loader.done:
+        print(memory.report())
+        print(f"Debug: Memory report written to {memory.dump('infdev-memory')}")
+    
+    if key == 'f12' and loader.done:
+        memory_overlay.enabled = not memory_overlay.enabled
+
+def quickload():
+    """Back to the last quicksave, in whichever area it was taken"""
+    if not quicksave:
+        print("Debug: No quicksave yet")
+        return
+    area, record = quicksave
+    if area != game_state['current_area']:
+        if game_state['current_course']:
+            exit_course()
+        if area != 'castle_grounds':
+            enter_course(area)
+    snapshots.restore(record)
+    void_ghost_race()
+    print(f"Debug: Quickloaded in {area}")
 
 # Startup message
 print("""
@@ -801,9 +1331,15 @@ CONTROLS:
   • ESC - Menu/Back
   
 DEBUG:
-  • F1 - Toggle FPS
+  • F1 - Toggle FPS, frame time and GC pauses
   • F2 - Show position
-  • F3 - Add stars
+  • F3 - Add stars (not saved)
+  • F4 - Start/stop the profiler
+  • F5 / F8 - Quicksave / Quickload
+  • F6 - Rewind 2 seconds
+  • F7 - Presence stats (SM64_PRESENCE=host:port)
+  • F11 - Write a memory report (SM64_TRACEMALLOC=32 for Python memory)
+  • F12 - Memory by area
 
 COURSES AVAILABLE:
   ★ Bob-omb Battlefield
@@ -816,5 +1352,6 @@ Ready to play!
 ═══════════════════════════════════════════════════════════
 """)
 
-# Run the game
-app.run()
+# Run the game (launcher.py hosts builds in its own window)
+if __name__ == '__main__':
+    app.run()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Samsoft Mario 64 - Build Launcher
+Runs every build in one warm process
+F9/F10: previous/next build
+"""
+
+import argparse
+import time as pytime
+
+from ursina import *
+from sm64.builds import BUILDS, BuildHost
+
+parser = argparse.ArgumentParser(description='Run the Mario 64 builds in one window')
+parser.add_argument('build', nargs='?', default='infdev', choices=list(BUILDS))
+parser.add_argument('--kiosk', type=float, default=0, metavar='SECONDS',
+                    help='rotate to the next build every SECONDS')
+args = parser.parse_args()
+
+# One window for every build
+app = Ursina(
+    title='Samsoft Mario 64',
+    borderless=False,
+    fullscreen=False,
+    vsync=True
+)
+
+host = BuildHost()
+host.load(args.build)
+
+def update():
+    # Kiosk rotation
+    if args.kiosk and pytime.perf_counter() - host.loaded_at > args.kiosk:
+        host.request_next()
+    host.update()
+
+def input(key):
+    if key == 'f9':
+        host.request_next(-1)
+    elif key == 'f10':
+        host.request_next()
+    else:
+        host.input(key)
+
+print("Builds:", ', '.join(BUILDS))
+print("F9/F10 - Previous/next build")
+
+app.run()
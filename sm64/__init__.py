@@ -0,0 +1,10 @@
+"""
+Samsoft Mario 64 - shared engine helpers
+Imported by the standalone build scripts in the repo root
+"""
+
+import os
+
+
+# The repository root, where the build scripts, caches and saves live
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,240 @@
+"""
+Baked vertex lighting for static geometry
+
+Directional, ambient and a simple ambient-occlusion term are computed once
+into the vertex colors of static models, which then render unlit. The
+runtime lights only have to touch dynamic objects like the player and coins.
+
+With a cache name the baked colors are stored in CACHE_FOLDER, keyed by a
+hash of the geometry and the lights, and loaded instead of recomputed
+while neither changes. `python -m sm64.pipeline` fills the cache ahead of
+time.
+"""
+
+import hashlib
+import os
+import time as pytime
+
+import numpy as np
+from panda3d.core import (Geom, GeomVertexArrayFormat, GeomVertexData, GeomVertexFormat,
+                          GeomVertexReader, GeomVertexWriter, Vec3)
+from ursina import scene
+
+from sm64 import ROOT
+
+
+CACHE_FOLDER = os.path.join(ROOT, 'bakecache')
+
+# Occlusion probe directions, tilted slightly so no component is exactly zero
+AO_DIRECTIONS = np.array([
+    (0.05, 1, 0.03),
+    (0.7, 0.7, 0.05), (-0.7, 0.7, -0.05), (0.05, 0.7, 0.7), (-0.05, 0.7, -0.7),
+    (0.95, 0.2, 0.04), (-0.95, 0.2, -0.04), (0.04, 0.2, 0.95), (-0.04, 0.2, -0.95),
+], dtype=np.float32)
+AO_DIRECTIONS /= np.linalg.norm(AO_DIRECTIONS, axis=1)[:, None]
+AO_DISTANCE = 12.0
+
+
+def light_vertices(normals, sun_direction, sun_color, ambient):
+    """Lambert sun plus flat ambient per vertex. sun_direction is the way the light travels."""
+    to_sun = -np.asarray(sun_direction, dtype=np.float32)
+    to_sun /= np.linalg.norm(to_sun)
+    diffuse = np.clip(normals @ to_sun, 0, None)
+    return np.asarray(ambient, dtype=np.float32)[:3] + diffuse[:, None] * np.asarray(sun_color, dtype=np.float32)[:3]
+
+
+def occlusion(positions, normals, boxes, owners, max_distance=AO_DISTANCE):
+    """Fraction of hemisphere probes per vertex blocked by another object's bounding box.
+
+    boxes is (n, 2, 3) world-space min/max, owners is each vertex's own box
+    index so an object never occludes itself.
+    """
+    origins = positions + normals * 0.05
+    lo, hi = boxes[None, :, 0], boxes[None, :, 1]
+    others = owners[:, None] != np.arange(len(boxes))[None, :]
+    hits = np.zeros(len(positions), dtype=np.float32)
+    counts = np.zeros(len(positions), dtype=np.float32)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for direction in AO_DIRECTIONS:
+            facing = normals @ direction > 0
+            # Slab test of every vertex against every box at once
+            t1 = (lo - origins[:, None]) / direction
+            t2 = (hi - origins[:, None]) / direction
+            near = np.minimum(t1, t2).max(axis=2)
+            far = np.maximum(t1, t2).min(axis=2)
+            blocked = ((near <= far) & (far > 0) & (near < max_distance) & others).any(axis=1)
+            counts += facing
+            hits += blocked & facing
+
+    return np.divide(hits, counts, out=np.zeros_like(hits), where=counts > 0)
+
+
+def _matrix(node_path):
+    """World matrix of a node as numpy, row-vector convention like Panda's"""
+    mat = node_path.getMat(scene)
+    return np.array([[mat.getCell(r, c) for c in range(4)] for r in range(4)], dtype=np.float32)
+
+
+def lighting_path(cache):
+    return os.path.join(CACHE_FOLDER, f'{cache}.npz')
+
+
+def _column(vdata, name):
+    """(n, 3) float32 copy of a vertex column, or None if the vertices don't have one"""
+    format = vdata.getFormat()
+    array = format.getArrayWith(name)
+    if array < 0:
+        return None
+    column = format.getColumn(name)
+    if column.getNumericType() == Geom.NT_float32 and column.getNumComponents() == 3:
+        # Slice the column straight out of the raw rows
+        stride = format.getArray(array).getStride()
+        rows = np.frombuffer(vdata.getArray(array).getHandle().getData(), dtype=np.uint8).reshape(-1, stride)
+        start = column.getStart()
+        return rows[:, start:start + 12].copy().view(np.float32)
+    reader = GeomVertexReader(vdata, name)
+    values = []
+    while not reader.isAtEnd():
+        values.append(tuple(reader.getData3()))
+    return np.array(values, dtype=np.float32).reshape(-1, 3)
+
+
+def _read_geom(node_path):
+    """World-space positions and normals of every vertex under one GeomNode"""
+    mat = _matrix(node_path)
+    normal_mat = np.linalg.inv(mat[:3, :3]).T
+
+    geoms = []
+    node = node_path.node()
+    for i in range(node.getNumGeoms()):
+        vdata = node.getGeom(i).getVertexData()
+        local = _column(vdata, 'vertex')
+        normals = _column(vdata, 'normal')
+        if normals is None:
+            # No normals: point away from the model's center, fine for the convex primitives used here
+            normals = local - local.mean(axis=0)
+
+        positions = local @ mat[:3, :3] + mat[3, :3]
+        normals = normals @ normal_mat
+        normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-6)[:, None]
+        geoms.append((i, positions, normals))
+    return geoms
+
+
+def _own_model(entity):
+    """ursina instances cached models between entities, give this one its own copy to write into"""
+    model = entity.model
+    unique = model.copyTo(entity)
+    # Detach rather than remove: the first entity's model is ursina's cached mesh itself
+    model.detachNode()
+    entity._model = unique
+    return unique
+
+
+def _static_entities(root, excluded):
+    if any(root is e for e in excluded):
+        return
+    if root.model:
+        yield root
+    for child in root.children:
+        yield from _static_entities(child, excluded)
+
+
+def _write_colors(node_path, index, colors):
+    node = node_path.node()
+    geom = node.modifyGeom(index)     # copy-on-write, cached models stay untouched
+    vdata = geom.getVertexData()
+    if not vdata.hasColumn('color'):
+        format = GeomVertexFormat(vdata.getFormat())
+        format.addArray(GeomVertexArrayFormat('color', 4, Geom.NT_uint8, Geom.C_color))
+        vdata = vdata.convertTo(GeomVertexFormat.registerFormat(format))
+    vdata = GeomVertexData(vdata)
+    writer = GeomVertexWriter(vdata, 'color')
+    for r, g, b in colors.tolist():
+        writer.setData4(r, g, b, 1)
+    geom.setVertexData(vdata)
+
+
+def _load_colors(path, key):
+    try:
+        with np.load(path) as data:
+            if str(data['key']) == key:
+                return np.split(data['colors'], data['splits'])
+    except (OSError, ValueError, KeyError):
+        pass    # missing, unreadable or from an older format, bake again
+    return None
+
+
+def _save_colors(path, key, colors):
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    # Write then rename so a crash mid-save never leaves a broken cache
+    temporary = path + '.tmp.npz'
+    splits = np.cumsum([len(c) for c in colors])[:-1]
+    np.savez_compressed(temporary, key=key, colors=np.concatenate(colors), splits=splits)
+    os.replace(temporary, path)
+
+
+def bake_static_lighting(entities, sun, ambient=(0.4, 0.4, 0.4), exclude=(), ao_strength=0.5, cache=None):
+    """Bake sun, ambient and occlusion into the vertex colors of everything under `entities`.
+
+    Baked nodes get lighting turned off; anything under `exclude` is left
+    for the runtime lights. With a cache name the colors are reused from
+    CACHE_FOLDER as long as the geometry and lights are the same.
+    """
+    t = pytime.perf_counter()
+    excluded = list(exclude)
+    targets = []
+    for root in entities:
+        for entity in _static_entities(root, excluded):
+            model = _own_model(entity)
+            if model.node().isGeomNode():
+                targets.append(model)
+            targets.extend(model.findAllMatches('**/+GeomNode'))
+
+    boxes, parts = [], []
+    for owner, node_path in enumerate(targets):
+        bounds = node_path.getTightBounds(scene)
+        boxes.append(bounds if bounds else (Vec3(0), Vec3(0)))
+        for index, positions, normals in _read_geom(node_path):
+            parts.append((owner, node_path, index, positions, normals))
+    boxes = np.array([[tuple(lo), tuple(hi)] for lo, hi in boxes], dtype=np.float32).reshape(-1, 2, 3)
+
+    sun_color = tuple(sun.color)[:3]
+    intensity = getattr(sun, 'intensity', 1)
+    sun_color = [c * intensity for c in sun_color]
+    sun_direction = tuple(sun.forward)
+
+    baked = None
+    if cache:
+        key = hashlib.sha1(repr((sun_direction, sun_color, tuple(ambient), ao_strength, AO_DISTANCE)).encode())
+        key.update(AO_DIRECTIONS.tobytes())
+        key.update(boxes.tobytes())
+        for _, _, index, positions, normals in parts:
+            key.update(positions.tobytes())
+            key.update(normals.tobytes())
+        key = key.hexdigest()
+        baked = _load_colors(lighting_path(cache), key)
+        if baked is not None and len(baked) != len(parts):
+            baked = None
+    cached = baked is not None
+
+    if not cached:
+        baked = []
+        for owner, node_path, index, positions, normals in parts:
+            light = light_vertices(normals, sun_direction, sun_color, tuple(ambient))
+            # Only boxes within probe range of this mesh can occlude it
+            near = np.all((boxes[:, 0] < positions.max(axis=0) + AO_DISTANCE) & (boxes[:, 1] > positions.min(axis=0) - AO_DISTANCE), axis=1)
+            near[owner] = False
+            ao = occlusion(positions, normals, boxes[near], np.full(len(positions), -1))
+            baked.append(np.clip(light * (1 - ao_strength * ao)[:, None], 0, 1).astype(np.float32))
+        if cache:
+            _save_colors(lighting_path(cache), key, baked)
+
+    for (_, node_path, index, _, _), colors in zip(parts, baked):
+        _write_colors(node_path, index, colors)
+        node_path.setLightOff(1)
+
+    print(f"{'Loaded baked' if cached else 'Baked'} lighting into {len(parts)} meshes in "
+          f"{(pytime.perf_counter() - t) * 1000:.0f} ms")
+    return len(parts)
@@ -0,0 +1,231 @@
+"""
+Peach's Castle grounds shared by the castle builds
+(sm64-0.py, 1.0.py, build0.py)
+"""
+
+import numpy as np
+from ursina import Entity, color, time
+
+from sm64.components import ComponentStore
+from sm64.water import WaterSurface
+
+
+# SM64 Color Palette - using normalized values
+SKY_BLUE = color.rgb(140/255, 180/255, 240/255)
+GRASS_GREEN = color.rgb(34/255, 177/255, 76/255)
+CASTLE_WALL = color.rgb(245/255, 245/255, 220/255)
+CASTLE_ROOF = color.rgb(220/255, 60/255, 60/255)
+WATER_BLUE = color.rgba(64/255, 164/255, 223/255, 0.85)
+PATH_STONE = color.rgb(180/255, 180/255, 160/255)
+
+# Trees around the castle
+TREE_POSITIONS = [
+    (-30, -10), (30, -10),
+    (-35, -40), (35, -40),
+    (-25, -55), (25, -55),
+    (-40, 10), (40, 10),
+    (-20, 15), (20, 15)
+]
+
+# Coins on the path
+COIN_POSITIONS = [
+    (5, 1, 5),
+    (-5, 1, 5),
+    (0, 1, 10),
+    (10, 1, -5),
+    (-10, 1, -5)
+]
+
+
+# Castle base structure
+class PeachCastle(Entity):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        # Main castle body
+        self.main_body = Entity(
+            parent=self,
+            model='cube',
+            color=CASTLE_WALL,
+            scale=(20, 25, 18),
+            position=(0, 12.5, -30),
+            collider='box'
+        )
+
+        # Central tower
+        self.central_tower = Entity(
+            parent=self,
+            model='cylinder',
+            color=CASTLE_WALL,
+            scale=(8, 35, 8),
+            position=(0, 17.5, -30),
+            collider='box'
+        )
+
+        # Central tower roof (cone)
+        self.tower_roof = Entity(
+            parent=self,
+            model='cone',
+            color=CASTLE_ROOF,
+            scale=(10, 8, 10),
+            position=(0, 39, -30),
+            rotation=(0, 0, 0)
+        )
+
+        # Left tower
+        self.left_tower = Entity(
+            parent=self,
+            model='cylinder',
+            color=CASTLE_WALL,
+            scale=(6, 28, 6),
+            position=(-15, 14, -30),
+            collider='box'
+        )
+
+        # Left tower roof
+        self.left_roof = Entity(
+            parent=self,
+            model='cone',
+            color=CASTLE_ROOF,
+            scale=(7, 6, 7),
+            position=(-15, 30, -30)
+        )
+
+        # Right tower
+        self.right_tower = Entity(
+            parent=self,
+            model='cylinder',
+            color=CASTLE_WALL,
+            scale=(6, 28, 6),
+            position=(15, 14, -30),
+            collider='box'
+        )
+
+        # Right tower roof
+        self.right_roof = Entity(
+            parent=self,
+            model='cone',
+            color=CASTLE_ROOF,
+            scale=(7, 6, 7),
+            position=(15, 30, -30)
+        )
+
+        # Castle entrance
+        self.entrance = Entity(
+            parent=self,
+            model='cube',
+            color=color.rgb(40/255, 30/255, 20/255),
+            scale=(4, 6, 0.5),
+            position=(0, 3, -20.5)
+        )
+
+        # Bridge to castle
+        self.bridge = Entity(
+            parent=self,
+            model='cube',
+            color=PATH_STONE,
+            scale=(8, 0.3, 20),
+            position=(0, 0.15, -10),
+            collider='box'
+        )
+
+        # Decorative windows
+        for i in range(3):
+            for j in range(2):
+                window = Entity(
+                    parent=self,
+                    model='cube',
+                    color=color.rgb(100/255, 150/255, 200/255),
+                    scale=(1.5, 2, 0.2),
+                    position=(-5 + i*5, 8 + j*6, -20.8)
+                )
+
+# Decorative trees (simple representation)
+class Tree(Entity):
+    def __init__(self, x, z, **kwargs):
+        super().__init__(**kwargs)
+        self.trunk = Entity(
+            parent=self,
+            model='cylinder',
+            color=color.rgb(101/255, 67/255, 33/255),
+            scale=(1, 5, 1),
+            position=(x, 2.5, z)
+        )
+        self.leaves = Entity(
+            parent=self,
+            model='sphere',
+            color=color.rgb(34/255, 139/255, 34/255),
+            scale=(5, 5, 5),
+            position=(x, 6, z)
+        )
+
+# Create small decorative elements
+# Coins only draw; their spin lives in CastleGrounds.coin_state
+class Coin(Entity):
+    def __init__(self, position, **kwargs):
+        super().__init__(
+            model='cylinder',
+            color=color.rgb(255/255, 215/255, 0),
+            scale=(0.8, 0.1, 0.8),
+            position=position,
+            rotation=(90, 0, 0),
+            **kwargs
+        )
+
+class CastleGrounds(Entity):
+    """Moat, path, trees, hills and coins around the castle"""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        # Moat around castle, just above the grass and below the path
+        self.moat = WaterSurface(
+            parent=self,
+            size=60,
+            color=WATER_BLUE,
+            position=(0, 0.05, -30)
+        )
+
+        # Stone path leading to castle
+        self.main_path = Entity(
+            parent=self,
+            model='cube',
+            color=PATH_STONE,
+            scale=(10, 0.2, 40),
+            position=(0, 0.1, 0),
+            collider='box'
+        )
+
+        # Place trees around the castle
+        self.trees = [Tree(x, z, parent=self) for x, z in TREE_POSITIONS]
+
+        # Hills in background
+        self.hills = []
+        for i in range(5):
+            hill = Entity(
+                parent=self,
+                model='sphere',
+                color=GRASS_GREEN,
+                scale=(20 + i*3, 10 + i*2, 20 + i*3),
+                position=(-60 + i*30, -5, -80 - i*10)
+            )
+            self.hills.append(hill)
+
+        # Place some coins
+        self.coins = [Coin(pos, parent=self) for pos in COIN_POSITIONS]
+        self.coin_state = ComponentStore(
+            capacity=len(self.coins),
+            position=(np.float32, 3),
+            angle=np.float32,
+            spin=np.float32,        # degrees per second
+            collected=np.bool_
+        )
+        for coin in self.coins:
+            self.coin_state.add(coin, position=coin.position, spin=100)
+
+    def update(self):
+        # Spin every coin in one pass, then copy the angles onto their entities
+        coins = self.coin_state
+        rows = coins.rows(~coins.collected)
+        coins.angle[rows] = (coins.angle[rows] + coins.spin[rows] * time.dt) % 360
+        for row, angle in zip(rows.tolist(), coins.angle[rows].tolist()):
+            coins.nodes[row].rotation_y = angle
@@ -0,0 +1,84 @@
+"""
+Column-oriented storage for gameplay state
+
+Stars, coins, enemies and paintings keep their state in a ComponentStore
+instead of attributes on their entities: one numpy column per field, one
+row per object, with the entity that draws it in `nodes`. Systems work on
+whole columns at once, and an object costs a few bytes per field rather
+than a Python instance dict.
+"""
+
+import numpy as np
+
+
+class ComponentStore:
+    """Rows of gameplay state, one numpy column per field.
+
+    Fields are given as name=dtype, or name=(dtype, width) for vectors such
+    as positions. Removed rows are reused by later adds, so a row number
+    stays a valid handle for as long as its object exists.
+    """
+    def __init__(self, capacity=16, **fields):
+        self.fields = {name: spec if isinstance(spec, tuple) else (spec, 1) for name, spec in fields.items()}
+        self.columns = {}
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.nodes = [None] * capacity
+        self.count = 0      # rows ever used, alive or not
+        self.free = []
+        for name, (dtype, width) in self.fields.items():
+            shape = (capacity,) if width == 1 else (capacity, width)
+            self.columns[name] = np.zeros(shape, dtype=dtype)
+
+    def __getattr__(self, name):
+        # Columns read like attributes: store.position, store.collected
+        try:
+            return self.__dict__['columns'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __len__(self):
+        return self.count - len(self.free)
+
+    def _grow(self):
+        capacity = len(self.alive) * 2
+        self.alive = np.resize(self.alive, capacity)
+        self.alive[self.count:] = False
+        self.nodes.extend([None] * (capacity - len(self.nodes)))
+        for name, column in self.columns.items():
+            grown = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[:len(column)] = column
+            self.columns[name] = grown
+
+    def add(self, node=None, **values):
+        """Store a new object and return its row"""
+        if self.free:
+            row = self.free.pop()
+        else:
+            if self.count == len(self.alive):
+                self._grow()
+            row = self.count
+            self.count += 1
+
+        for name, column in self.columns.items():
+            column[row] = values.get(name, 0)
+        self.alive[row] = True
+        self.nodes[row] = node
+        return row
+
+    def remove(self, row):
+        self.alive[row] = False
+        self.nodes[row] = None
+        self.free.append(row)
+
+    def rows(self, mask=None):
+        """Rows of live objects, optionally only where `mask` (over all used rows) is set"""
+        alive = self.alive[:self.count]
+        if mask is not None:
+            alive = alive & mask[:self.count]
+        return np.flatnonzero(alive)
+
+    def within(self, point, radius, mask=None, column='position'):
+        """Rows of live objects whose position is within `radius` of `point`"""
+        offsets = self.columns[column][:self.count] - np.asarray(tuple(point), dtype=np.float32)
+        near = np.einsum('ij,ij->i', offsets, offsets) < radius * radius
+        return self.rows(near if mask is None else near & mask[:self.count])
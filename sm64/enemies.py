@@ -0,0 +1,243 @@
+"""
+Batched enemy simulation
+
+Every enemy of one kind lives in the rows of a ComponentStore and is
+simulated with whole-array NumPy operations: wander, chase the target
+within a radius, light a fuse and explode (bob-ombs) or hurt on contact
+(goombas). Enemies are drawn as instances of one shared model under a
+single entity, and the only per-enemy Python work each frame is copying
+the position and heading onto its node.
+"""
+
+import numpy as np
+from panda3d.core import NodePath
+from ursina import Entity, application, color, destroy, load_model, time
+
+from sm64.components import ComponentStore
+
+
+WANDER, CHASE, FUSE, DEAD = range(4)
+
+ENEMY_TYPES = {
+    'bobomb': {
+        'model': 'sphere',
+        'color': (0.1, 0.1, 0.12),
+        'scale': (1, 1, 1),
+        'speed': 1.5,
+        'chase_speed': 3.5,
+        'chase_radius': 10,
+        'wander_radius': 6,
+        'fuse_radius': 2.5,     # lights the fuse when this close
+        'fuse_time': 3.0,
+        'blast_radius': 3.0,
+        'contact_radius': 0,
+        'respawn_time': 8.0,
+    },
+    'goomba': {
+        'model': 'sphere',
+        'color': (0.55, 0.35, 0.2),
+        'scale': (1.2, 0.9, 1.2),
+        'speed': 1.2,
+        'chase_speed': 3.0,
+        'chase_radius': 8,
+        'wander_radius': 5,
+        'fuse_radius': 0,
+        'fuse_time': 0,
+        'blast_radius': 0,
+        'contact_radius': 1.0,  # hurts the target when this close
+        'respawn_time': 10.0,
+    },
+}
+
+
+class EnemySwarm(Entity):
+    """All enemies of one kind, simulated together.
+
+    target is the entity they chase (usually the player), terrain an
+    optional Terrain they walk on. With a FlowField from the course's
+    NavGrid, chasers path around obstacles and nobody walks into a blocked
+    cell; the field is in the space of the swarm's parent and can be shared
+    between swarms. on_hit(kind) is called when an enemy hurts the target.
+    """
+    def __init__(self, kind, count, area=20, center=(0, 0), target=None, terrain=None, flow=None, on_hit=None, seed=None, **kwargs):
+        super().__init__(**kwargs)
+        self.kind = kind
+        self.settings = ENEMY_TYPES[kind]
+        self.target = target
+        self.terrain = terrain
+        self.flow = flow
+        self.on_hit = on_hit
+        self.rng = np.random.default_rng(seed)
+
+        self.enemies = ComponentStore(
+            capacity=max(count, 1),
+            position=(np.float32, 3),
+            home=(np.float32, 2),
+            goal=(np.float32, 2),
+            heading=np.float32,
+            state=np.int8,
+            timer=np.float32
+        )
+
+        # One body shared by every instance, tinted per enemy through the color scale.
+        # It's a copy of ursina's cached model, which other entities may have tinted or scaled.
+        body = NodePath(kind)
+        body.setScale(*self.settings['scale'])
+        body.setY(self.settings['scale'][1] / 2)     # stand on the ground
+        name = self.settings['model']
+        model = load_model(name, application.asset_folder) or load_model(name, application.internal_models_compressed_folder)
+        template = model.copyTo(body)
+        template.clearTransform()
+        template.clearColorScale()
+        template.clearColor()
+        homes = np.asarray(center, dtype=np.float32) + self.rng.uniform(-area, area, (count, 2)).astype(np.float32)
+        if flow:
+            # Move homes that landed inside obstacles, a few tries each
+            for _ in range(10):
+                blocked = ~flow.grid.walkable_at(homes[:, 0] + self.x, homes[:, 1] + self.z)
+                if not blocked.any():
+                    break
+                homes[blocked] = np.asarray(center) + self.rng.uniform(-area, area, (blocked.sum(), 2))
+        for i, home in enumerate(homes):
+            node = self.attachNewNode(f'{kind}_{i}')
+            body.instanceTo(node)
+            node.setColorScale(*self.settings['color'], 1)
+            self.enemies.add(node, position=(home[0], 0, home[1]), home=home, goal=home,
+                             state=WANDER, timer=self.rng.uniform(0, 3))
+        self._ground()
+        self._sync(self.enemies.rows())
+
+    def _ground(self):
+        enemies = self.enemies
+        position = enemies.position[:enemies.count]
+        if self.terrain:
+            # Terrain heights are in world space, enemies in this entity's space
+            position[:, 1] = self.terrain.heights_at(position[:, 0] + self.world_x, position[:, 2] + self.world_z) - self.world_y
+        else:
+            position[:, 1] = 0
+
+    def _sync(self, rows):
+        """Copy transforms of the given rows onto their nodes"""
+        enemies = self.enemies
+        nodes = enemies.nodes
+        position = enemies.position[rows].tolist()
+        heading = enemies.heading[rows].tolist()
+        for row, (x, y, z), h in zip(rows.tolist(), position, heading):
+            nodes[row].setPosHpr(x, y, z, -h, 0, 0)
+
+    def refresh(self):
+        """Bring every node in line with its row, after the rows were set from outside (rewinds)"""
+        enemies = self.enemies
+        rows = enemies.rows()
+        fuse = (1, 0.35, 0.2)
+        for row, state in zip(rows.tolist(), enemies.state[rows].tolist()):
+            node = enemies.nodes[row]
+            node.setColorScale(*(fuse if state == FUSE else self.settings['color']), 1)
+            if state == DEAD:
+                node.hide()
+            else:
+                node.show()
+        self._sync(rows)
+
+    def update(self):
+        enemies = self.enemies
+        n = enemies.count
+        if not n or not self.target:
+            return
+        s = self.settings
+        dt = time.dt
+
+        position = enemies.position[:n]
+        state = enemies.state[:n]
+        timer = enemies.timer[:n]
+        goal = enemies.goal[:n]
+        timer -= dt
+
+        target = self.target.world_position - self.world_position
+        offset = np.array((target.x, target.z), dtype=np.float32) - position[:, (0, 2)]
+        distance = np.hypot(offset[:, 0], offset[:, 1])
+        active = state != DEAD
+
+        # State changes
+        state[(state == WANDER) & (distance < s['chase_radius'])] = CHASE
+        state[(state == CHASE) & (distance > s['chase_radius'] * 1.5)] = WANDER
+
+        if s['fuse_time']:
+            lit = np.flatnonzero((state == CHASE) & (distance < s['fuse_radius']))
+            state[lit] = FUSE
+            timer[lit] = s['fuse_time']
+            for row in lit.tolist():
+                enemies.nodes[row].setColorScale(1, 0.35, 0.2, 1)
+            boom = np.flatnonzero((state == FUSE) & (timer <= 0))
+            if len(boom):
+                self._explode(boom, distance[boom] < s['blast_radius'])
+
+        if s['contact_radius']:
+            touching = np.flatnonzero(active & (distance < s['contact_radius']) &
+                                      (np.abs(target.y - position[:, 1]) < 1.5))
+            if len(touching):
+                self._kill(touching)
+                if self.on_hit:
+                    self.on_hit(self.kind)
+
+        respawn = np.flatnonzero((state == DEAD) & (timer <= 0))
+        if len(respawn):
+            position[respawn, 0] = enemies.home[respawn, 0]
+            position[respawn, 2] = enemies.home[respawn, 1]
+            goal[respawn] = enemies.home[respawn]
+            state[respawn] = WANDER
+            for row in respawn.tolist():
+                enemies.nodes[row].setColorScale(*s['color'], 1)
+                enemies.nodes[row].show()
+
+        # New wander goals around home once the old one is reached or times out
+        to_goal = goal - position[:, (0, 2)]
+        arrived = np.einsum('ij,ij->i', to_goal, to_goal) < 0.25
+        retarget = np.flatnonzero((state == WANDER) & ((timer <= 0) | arrived))
+        if len(retarget):
+            goal[retarget] = enemies.home[retarget] + self.rng.uniform(-s['wander_radius'], s['wander_radius'], (len(retarget), 2))
+            timer[retarget] = self.rng.uniform(2, 5, len(retarget))
+
+        # Steer toward the goal or the target
+        chasing = (state == CHASE) | (state == FUSE)
+        move = np.where(chasing[:, None], offset, goal - position[:, (0, 2)])
+        if self.flow and chasing.any():
+            # One shared field around the target; close in directly once next to it
+            self.flow.seek(target.x + self.x, target.z + self.z)
+            directions, reachable = self.flow.directions_at(position[:, 0] + self.x, position[:, 2] + self.z)
+            follow = chasing & reachable & (distance > 1.5)
+            move[follow] = directions[follow] * distance[follow, None]
+        length = np.maximum(np.hypot(move[:, 0], move[:, 1]), 1e-6)
+        speed = np.where(chasing, s['chase_speed'], s['speed']) * dt
+        step = np.minimum(speed, length) / length
+        moving = np.flatnonzero(state != DEAD)
+        x = position[moving, 0] + move[moving, 0] * step[moving]
+        z = position[moving, 2] + move[moving, 1] * step[moving]
+        if self.flow:
+            # Stop at walls rather than walk into them
+            free = self.flow.grid.walkable_at(x + self.x, z + self.z)
+            x, z = np.where(free, x, position[moving, 0]), np.where(free, z, position[moving, 2])
+        position[moving, 0] = x
+        position[moving, 2] = z
+        enemies.heading[moving] = np.degrees(np.arctan2(move[moving, 0], move[moving, 1]))
+
+        self._ground()
+        self._sync(moving)
+
+    def _kill(self, rows):
+        enemies = self.enemies
+        enemies.state[rows] = DEAD
+        enemies.timer[rows] = self.settings['respawn_time']
+        for row in rows.tolist():
+            enemies.nodes[row].hide()
+
+    def _explode(self, rows, hit):
+        radius = self.settings['blast_radius']
+        for x, y, z in self.enemies.position[rows].tolist():
+            blast = Entity(parent=self, model='sphere', color=color.orange, position=(x, y + 0.5, z), scale=0.5)
+            blast.animate_scale(radius * 2, duration=0.3)
+            blast.fade_out(duration=0.3)
+            destroy(blast, delay=0.35)
+        self._kill(rows)
+        if hit.any() and self.on_hit:
+            self.on_hit(self.kind)
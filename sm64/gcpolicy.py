@@ -0,0 +1,139 @@
+"""
+Garbage collection around loading and gameplay
+
+Python's cyclic collector runs once enough container objects have been
+allocated, which during gameplay means in the middle of whichever frame
+crossed the threshold. Most of what a full collection walks is the scene
+graph and its assets, which live as long as the build and never become
+garbage. GCPolicy moves that work out of the frames that matter:
+
+    loaded()      after the castle or a course is built: collect, then
+                  gc.freeze() what's left so collections skip it from now on
+    gameplay()    raise the thresholds so the collector runs less often
+    transition()  collect now, while a fade or course switch hides the pause
+    menu()        back to the default thresholds
+
+Frozen objects are never collected, which is fine for scenes that stay
+loaded. BuildHost calls reset() when it swaps builds, which unfreezes
+everything so the old build can be freed.
+
+Every collection is timed through gc.callbacks. GCReadout shows the frame
+time and those pauses under the fps counter.
+"""
+
+import gc
+import time as pytime
+from collections import deque
+
+from ursina import Text, camera, color, time, window
+
+
+DEFAULT_THRESHOLDS = gc.get_threshold()
+# Young collections get rarer but each one walks more objects, a few hundred microseconds
+GAMEPLAY_THRESHOLDS = (10000, 20, 100)
+
+_active = None
+
+
+class GCPolicy:
+    """The process's collector settings and pause times, only one is active at a time"""
+    def __init__(self, history=256):
+        reset()
+        self.pauses = deque(maxlen=history)     # (generation, seconds, objects collected)
+        self.collections = [0, 0, 0]
+        self.longest = 0.0
+        self.unread = 0.0      # pause time since the last take_pause()
+        self.frozen = 0
+        self.mode = 'menu'
+        self._started = None
+        gc.callbacks.append(self._callback)
+        global _active
+        _active = self
+
+    def _callback(self, phase, info):
+        if phase == 'start':
+            self._started = pytime.perf_counter()
+        elif self._started is not None:
+            seconds = pytime.perf_counter() - self._started
+            self._started = None
+            self.pauses.append((info['generation'], seconds, info['collected']))
+            self.collections[info['generation']] += 1
+            self.longest = max(self.longest, seconds)
+            self.unread += seconds
+
+    def take_pause(self):
+        """Seconds spent collecting since the last call"""
+        seconds, self.unread = self.unread, 0.0
+        return seconds
+
+    def loaded(self):
+        """A scene finished building: clear out its garbage and freeze the rest"""
+        gc.collect()
+        gc.freeze()
+        self.frozen = gc.get_freeze_count()
+
+    def gameplay(self):
+        self.mode = 'gameplay'
+        gc.set_threshold(*GAMEPLAY_THRESHOLDS)
+
+    def transition(self):
+        """Collect while nothing is moving"""
+        gc.collect()
+
+    def menu(self):
+        self.mode = 'menu'
+        gc.set_threshold(*DEFAULT_THRESHOLDS)
+        gc.collect()
+
+    def release(self):
+        """Undo everything: thresholds, frozen objects and the pause timer"""
+        if self._callback in gc.callbacks:
+            gc.callbacks.remove(self._callback)
+        gc.set_threshold(*DEFAULT_THRESHOLDS)
+        gc.unfreeze()
+        self.frozen = 0
+
+    def summary(self):
+        recent = list(self.pauses)
+        total = sum(seconds for _, seconds, _ in recent)
+        return (f"gc {self.mode}: {self.frozen} frozen, collections {'/'.join(map(str, self.collections))}, "
+                f"longest pause {self.longest * 1000:.2f} ms, {total * 1000:.1f} ms over the last {len(recent)}")
+
+
+def reset():
+    """Release the active policy, if any"""
+    global _active
+    if _active:
+        _active.release()
+        _active = None
+
+
+class GCReadout(Text):
+    """Frame time and collector pauses, under the fps counter"""
+    def __init__(self, policy, **kwargs):
+        super().__init__('', parent=camera.ui, origin=(0.5, 0.5), position=(window.aspect_ratio / 2 - 0.01, 0.42),
+                         scale=0.7, color=color.white, ignore=False, **kwargs)     # Text skips update() by default
+        self.policy = policy
+        self.frames = deque(maxlen=60)
+        self.pause_times = deque(maxlen=60)     # time collecting in each of the same frames
+        self.clock = 0.0
+
+    def on_enable(self):
+        # Pauses from while we were hidden don't belong to any frame shown
+        self.policy.take_pause()
+        self.frames.clear()
+        self.pause_times.clear()
+        self.clock = 0.0
+
+    def update(self):
+        self.frames.append(time.dt_unscaled)
+        self.pause_times.append(self.policy.take_pause())
+
+        self.clock -= time.dt_unscaled
+        if self.clock > 0:
+            return
+        self.clock = 0.25
+        frames = self.frames or [0.0]
+        self.text = (f"frame {sum(frames) / len(frames) * 1000:.1f} ms, worst {max(frames) * 1000:.1f}\n"
+                     f"gc {sum(self.pause_times) * 1000:.2f} ms/{len(frames)} frames, "
+                     f"worst {max(self.pause_times, default=0) * 1000:.2f}")
@@ -0,0 +1,171 @@
+"""
+Ghost runs: recorded trajectories replayed by a translucent Mario
+
+A run is sampled at a fixed tick rate into fixed-width records. Every
+KEYFRAME_TICKS ticks a full float position is stored as a keyframe, and
+each tick only stores its offset from its keyframe in 16-bit fixed point,
+along with its heading in a byte and its animation state in another. A
+tick costs 8 bytes, so an hour at 30 ticks per second is under a megabyte.
+
+Offsets are taken from the keyframe rather than from the previous tick,
+so any tick decodes from exactly two records and seeking is O(1). Files
+are memory-mapped on playback: only the pages around the ghost's current
+tick are ever read.
+"""
+
+import os
+import struct
+
+import numpy as np
+from ursina import Entity, Vec3, color, time
+
+from sm64 import ROOT
+
+
+GHOST_FOLDER = os.path.join(ROOT, 'ghosts')
+
+MAGIC = b'GHST'
+VERSION = 1
+# magic, version, ticks per second, ticks, ticks per keyframe
+HEADER = struct.Struct('<4sHHII')
+KEYFRAME_TICKS = 64
+UNIT = 1 / 128      # offset resolution, offsets reach +-256 units from their keyframe
+
+KEYFRAME = np.dtype([('position', '<f4', 3)])
+TICK = np.dtype([('offset', '<i2', 3), ('heading', 'u1'), ('anim', 'u1')])
+
+IDLE, WALK, AIR, SLIDE = range(4)
+
+
+def ghost_path(name, folder=GHOST_FOLDER):
+    return os.path.join(folder, f'{name}.ghost')
+
+
+class GhostRecorder(Entity):
+    """Samples target's position, heading and anim() every tick while enabled"""
+    def __init__(self, target, anim=None, rate=30, capacity=4096, **kwargs):
+        super().__init__(**kwargs)
+        self.target = target
+        self.anim = anim
+        self.rate = rate
+        self.clock = 0.0
+        self.ticks = 0
+        self.keyframes = np.zeros(capacity // KEYFRAME_TICKS + 1, dtype=KEYFRAME)
+        self.records = np.zeros(capacity, dtype=TICK)
+
+    @property
+    def duration(self):
+        return self.ticks / self.rate
+
+    def restart(self):
+        self.clock = 0.0
+        self.ticks = 0
+
+    def record(self, position, heading, anim=IDLE):
+        """Append one tick"""
+        if self.ticks == len(self.records):
+            # Doubling keeps appends cheap over long runs
+            self.records = np.resize(self.records, len(self.records) * 2)
+            self.keyframes = np.resize(self.keyframes, len(self.records) // KEYFRAME_TICKS + 1)
+        key, i = divmod(self.ticks, KEYFRAME_TICKS)
+        if i == 0:
+            self.keyframes[key]['position'] = position
+        offset = (np.asarray(position, dtype=np.float32) - self.keyframes[key]['position']) / UNIT
+        tick = self.records[self.ticks]
+        tick['offset'] = np.clip(np.round(offset), -32768, 32767)
+        tick['heading'] = round(heading % 360 / 360 * 256) % 256
+        tick['anim'] = anim
+        self.ticks += 1
+
+    def save(self, path):
+        """Write the run so far, through a temporary file so a crash never leaves half a ghost"""
+        keys = -(-self.ticks // KEYFRAME_TICKS)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.rate, self.ticks, KEYFRAME_TICKS))
+            f.write(self.keyframes[:keys].tobytes())
+            f.write(self.records[:self.ticks].tobytes())
+        os.replace(temporary, path)
+
+    def update(self):
+        self.clock += time.dt
+        interval = 1 / self.rate
+        while self.clock >= interval:
+            self.clock -= interval
+            target = self.target
+            self.record(tuple(target.world_position), target.world_rotation_y, self.anim() if self.anim else IDLE)
+
+
+class GhostRun:
+    """A saved run, memory-mapped"""
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f'{path} is not a ghost run')
+        magic, version, self.rate, self.ticks, self.keyframe_ticks = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or not self.ticks:
+            raise ValueError(f'{path} is not a ghost run')
+        keys = -(-self.ticks // self.keyframe_ticks)
+        self.keyframes = np.memmap(path, dtype=KEYFRAME, mode='r', offset=HEADER.size, shape=(keys,))
+        self.records = np.memmap(path, dtype=TICK, mode='r', offset=HEADER.size + keys * KEYFRAME.itemsize,
+                                 shape=(self.ticks,))
+
+    @classmethod
+    def load(cls, path):
+        """The run at path, or None if there isn't a readable one"""
+        try:
+            return cls(path)
+        except (OSError, ValueError):
+            return None
+
+    @property
+    def duration(self):
+        return self.ticks / self.rate
+
+    def close(self):
+        """Unmap the file so it can be replaced, the run can't be sampled after this"""
+        self.keyframes = self.records = None
+
+    def frame(self, tick):
+        """(x, y, z), heading and anim state of a tick, clamped to the run"""
+        tick = min(max(int(tick), 0), self.ticks - 1)
+        record = self.records[tick]
+        x, y, z = self.keyframes[tick // self.keyframe_ticks]['position'] + record['offset'] * np.float32(UNIT)
+        return (float(x), float(y), float(z)), int(record['heading']) * 360 / 256, int(record['anim'])
+
+    def sample(self, seconds):
+        """Position, heading and anim state `seconds` into the run, between ticks"""
+        t = min(max(seconds * self.rate, 0), self.ticks - 1)
+        a, heading, anim = self.frame(t)
+        b, next_heading, _ = self.frame(t + 1)
+        f = t - int(t)
+        turn = (next_heading - heading + 180) % 360 - 180
+        return tuple(p + (q - p) * f for p, q in zip(a, b)), heading + turn * f, anim
+
+
+class Ghost(Entity):
+    """Translucent Mario replaying a GhostRun from the start, holding the last pose once it ends"""
+    def __init__(self, run, **kwargs):
+        super().__init__(**kwargs)
+        self.run = run
+        self.time = 0.0
+        self.body = Entity(parent=self, model='cube', color=color.rgba(0, 92/255, 170/255, 0.4), scale=(0.8, 1, 0.6), y=0.5)
+        self.head = Entity(parent=self, model='sphere', color=color.rgba(230/255, 0, 18/255, 0.4), scale=0.7, y=1.35)
+        self.restart()
+
+    def restart(self):
+        self.time = 0.0
+        self._pose()
+
+    def _pose(self):
+        (x, y, z), heading, anim = self.run.sample(self.time)
+        self.world_position = Vec3(x, y, z)
+        self.world_rotation_y = heading
+        # Crouch on the slide, stretch in the air
+        self.body.scale_y = {SLIDE: 0.6, AIR: 1.15}.get(anim, 1)
+
+    def update(self):
+        self.time += time.dt
+        self._pose()
@@ -0,0 +1,32 @@
+"""
+A windowless app for tools that run the game without showing it
+
+Playtest bots and offline bakes run builds in worker processes: the scene
+still needs a camera and a window to hang the UI on, but nothing is ever
+drawn, and every frame advances a fixed time however long it took. Benchmarks
+that time drawing too boot with render=True, which draws every frame into
+the offscreen buffer.
+"""
+
+from panda3d.core import ClockObject
+
+
+_app = None
+
+
+def boot(fps=30, render=False):
+    """The process's headless app, started on first use"""
+    global _app
+    if _app:
+        return _app
+    from ursina import Ursina, mouse
+
+    _app = Ursina(window_type='offscreen', development_mode=False)
+    _app.win.setActive(render)
+    # There's no pointer to lock offscreen, the controller still asks for it
+    type(mouse).locked = property(lambda self: getattr(self, '_locked', False),
+                                  lambda self, value: setattr(self, '_locked', value))
+    clock = ClockObject.getGlobalClock()
+    clock.setMode(ClockObject.MNonRealTime)
+    clock.setDt(1 / fps)
+    return _app
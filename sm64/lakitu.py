@@ -0,0 +1,140 @@
+"""
+Third-person orbit camera on a spring arm
+
+LakituCamera hangs the camera behind its target at the target's heading
+and looks back at it. The arm is shortened when level geometry gets in
+the way, snapping in at once and easing back out.
+
+Occlusion is checked with a small fan of rays around the arm, and results
+are cached: while the target and the arm direction stay put no rays are
+cast at all, and when they move the center ray is cast every frame while
+the side rays take turns, a few per frame.
+"""
+
+import math
+
+from ursina import Entity, Vec3, camera, raycast, scene, time
+
+
+class LakituCamera(Entity):
+    """Orbit camera for a FirstPersonController-style target.
+
+    The target's rotation_y sets the orbit heading, and its camera_pivot's
+    pitch (mouse look) tilts the orbit. ground is an optional height(x, z)
+    function for floors without colliders, like Terrain.height_at, that
+    the camera is kept above. While disabled the camera is parked
+    at rest_position / rest_rotation / rest_fov, which is where menus
+    expect it.
+    """
+    def __init__(self, target, distance=8, height=1.5, pitch=15, radius=0.3, rays_per_frame=2,
+                 rest_position=(0, 0, 5), rest_rotation=(0, 0, 0), rest_fov=60, fov=60, enabled=True, **kwargs):
+        super().__init__(**kwargs)
+        self.target = target
+        self.distance = distance
+        self.height = height
+        self.pitch = pitch
+        self.radius = radius
+        self.rays_per_frame = rays_per_frame
+        self.rest_position = rest_position
+        self.rest_rotation = rest_rotation
+        self.rest_fov = rest_fov
+        self.fov = fov
+        self.ground = None
+
+        self.arm = distance
+        self.yaw = None
+        self.key = None
+        self.pivot = None
+        # Center ray first, then the four around it
+        self.whiskers = [(0, 0), (1, 0), (-1, 0), (0, 1), (0, -1)]
+        self.hits = [distance] * len(self.whiskers)
+        self.next_whisker = 1
+        self.rays_cast = 0      # total, for profiling
+
+        self.enabled = enabled
+        if not enabled:
+            self.release()
+
+    def on_enable(self):
+        if not hasattr(self, 'target'):
+            return      # still in Entity.__init__
+        camera.parent = scene
+        camera.fov = self.fov
+        self.yaw = None
+        self.key = None
+        if hasattr(self.target, 'cursor'):
+            self.target.cursor.enabled = False
+
+    def on_disable(self):
+        if hasattr(self, 'target'):
+            self.release()
+
+    def release(self):
+        """Park the camera at its rest pose"""
+        camera.parent = scene
+        camera.position = self.rest_position
+        camera.rotation = self.rest_rotation
+        camera.fov = self.rest_fov
+
+    def _occlusion(self, pivot, direction):
+        """Free arm length along direction, from cached and fresh rays"""
+        key = (round(pivot.x, 2), round(pivot.y, 2), round(pivot.z, 2),
+               round(direction.x, 3), round(direction.y, 3), round(direction.z, 3))
+        if key == self.key:
+            return min(self.hits)
+        self.key = key
+        # Side rays from far away, after a teleport or a quick swing, say nothing about here
+        if self.pivot is None or (pivot - self.pivot).length() > 1 or direction.dot(self.direction) < 0.9:
+            self.hits = [self.distance] * len(self.whiskers)
+        self.pivot = pivot
+        self.direction = direction
+
+        right = direction.cross(Vec3(0, 1, 0)).normalized()
+        up = right.cross(direction).normalized()
+        batch = [0]
+        for _ in range(self.rays_per_frame - 1):
+            batch.append(self.next_whisker)
+            self.next_whisker = self.next_whisker % (len(self.whiskers) - 1) + 1
+
+        ignore = (self.target,)
+        for i in batch:
+            x, y = self.whiskers[i]
+            origin = pivot + (right * x + up * y) * self.radius
+            hit = raycast(origin, direction, distance=self.distance, ignore=ignore)
+            self.hits[i] = hit.distance if hit.hit else self.distance
+            self.rays_cast += 1
+        return min(self.hits)
+
+    def update(self):
+        target = self.target
+        if camera.parent != scene:
+            camera.parent = scene     # the controller takes it back when it's enabled after us
+        dt = time.dt
+
+        # Swing around behind the target instead of snapping to its heading
+        heading = target.world_rotation_y
+        if self.yaw is None:
+            self.yaw = heading
+        turn = (heading - self.yaw + 180) % 360 - 180
+        self.yaw += turn * min(dt * 8, 1)
+
+        pitch = self.pitch
+        if hasattr(target, 'camera_pivot'):
+            pitch += target.camera_pivot.rotation_x
+        pitch = math.radians(min(max(pitch, -10), 75))
+        yaw = math.radians(self.yaw)
+        direction = Vec3(-math.sin(yaw) * math.cos(pitch), math.sin(pitch), -math.cos(yaw) * math.cos(pitch))
+
+        pivot = target.world_position + Vec3(0, self.height, 0)
+        free = max(self._occlusion(pivot, direction) - self.radius, 0.5)
+        # Pull in at once so nothing clips, ease back out
+        if free < self.arm:
+            self.arm = free
+        else:
+            self.arm += (free - self.arm) * min(dt * 3, 1)
+
+        position = pivot + direction * self.arm
+        if self.ground:
+            position.y = max(position.y, self.ground(position.x, position.z) + 0.5)
+        camera.world_position = position
+        camera.look_at(pivot)
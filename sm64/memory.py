@@ -0,0 +1,286 @@
+"""
+Memory accounting by area and entity class
+
+A MemoryLedger is given the root entity of every area of a build (the
+castle, each course, the menu, the HUD, ...). A census walks the scene once
+and sorts every entity under its area and class, counting entities and
+the GPU bytes their vertex buffers and textures take. A shared buffer
+counts once per area, and once in the total.
+
+Python memory comes from tracemalloc, which is off unless SM64_TRACEMALLOC
+is set because tracing slows every allocation. Each traced block is
+charged to the classes whose methods are on its allocation stack: the
+innermost class owns the block, and the outermost area class says which
+area it belongs to.
+
+visited() records an area's footprint each time the player leaves it.
+An area that grows on every one of the last few visits is reported as a
+probable leak.
+"""
+
+import bisect
+import inspect
+import os
+import time as pytime
+import tracemalloc
+from collections import defaultdict
+
+from ursina import Text, camera, color, scene, time
+
+from sm64 import ROOT
+from sm64.profiler import PROFILE_FOLDER
+
+
+TRACE = int(os.environ.get('SM64_TRACEMALLOC', 0))     # stack frames kept per allocation, 0 is off
+LEAK_VISITS = 3
+LEAK_BYTES = 64 * 1024
+
+
+def _kilobytes(size):
+    return f'{size / 1024:,.0f} KB'
+
+
+def geom_arrays(entity):
+    """{array pointer: bytes} of the vertex and index buffers of an entity's own model"""
+    return node_arrays(entity.model) if entity.model else {}
+
+
+def node_arrays(root):
+    """{array pointer: bytes} of the vertex and index buffers of every geom under a NodePath"""
+    arrays = {}
+    # Walk nodes rather than findAllMatches(), which returns every path to an instanced node
+    seen = set()
+    nodes = [root.node()]
+    while nodes:
+        node = nodes.pop()
+        if node.this in seen:
+            continue
+        seen.add(node.this)
+        nodes.extend(node.getChildren())
+        if not node.isGeomNode():
+            continue
+        for i in range(node.getNumGeoms()):
+            geom = node.getGeom(i)
+            vdata = geom.getVertexData()
+            for j in range(vdata.getNumArrays()):
+                array = vdata.getArray(j)
+                arrays[array.this] = array.getDataSizeBytes()
+            for k in range(geom.getNumPrimitives()):
+                vertices = geom.getPrimitive(k).getVertices()
+                if vertices:
+                    arrays[vertices.this] = vertices.getDataSizeBytes()
+    return arrays
+
+
+def texture_bytes(entity):
+    """(pointer, bytes) of an entity's texture, mipmaps included, or None"""
+    texture = getattr(entity, 'texture', None)
+    texture = getattr(texture, '_texture', None)
+    if texture is None:
+        return None
+    size = texture.getExpectedRamImageSize()
+    if texture.usesMipmaps():
+        size = size * 4 // 3
+    return texture.this, size
+
+
+class MemoryLedger:
+    """Memory by area and class for the areas areas() returns, as {name: root entity}"""
+    def __init__(self, areas, trace=TRACE):
+        self.areas = areas
+        self.visits = defaultdict(list)     # area -> footprints when it was left
+        self.leaks = {}                     # area -> description
+        self._lines = {}                    # filename -> sorted [(first line, last line, class)]
+        self._classes = set()
+        self._owners = {}                   # (filename, line) -> class or None
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start(trace)
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def _area_of(self, roots):
+        """entity -> area name, following parents up to an area root"""
+        known = {id(root): name for name, root in roots.items()}
+
+        def area(entity):
+            node = entity
+            while node is not None and node is not scene:
+                name = known.get(id(node))
+                if name:
+                    return name
+                node = getattr(node, 'parent', None)
+            return 'ui' if entity.has_ancestor(camera.ui) else 'other'
+        return area
+
+    def census(self):
+        """{area: {class name: [entities, gpu bytes]}}, and the deduplicated gpu total"""
+        area_of = self._area_of(self.areas())
+        counts = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+        seen = defaultdict(set)     # area -> buffer pointers already counted
+        everything = {}
+        for entity in scene.entities:
+            area = area_of(entity)
+            row = counts[area][type(entity).__name__]
+            row[0] += 1
+            buffers = geom_arrays(entity)
+            texture = texture_bytes(entity)
+            if texture:
+                buffers[texture[0]] = texture[1]
+            for pointer, size in buffers.items():
+                if pointer not in seen[area]:
+                    seen[area].add(pointer)
+                    row[1] += size
+            everything.update(buffers)
+        return counts, sum(everything.values())
+
+    def _index_class(self, cls):
+        """Remember the line ranges of every function cls defines, to recognise them on stacks"""
+        if cls in self._classes:
+            return
+        self._classes.add(cls)
+        for value in vars(cls).values():
+            function = getattr(value, '__func__', value)
+            code = getattr(function, '__code__', None)
+            if code is None or not code.co_filename.startswith(ROOT):
+                continue
+            lines = [line for _, _, line in code.co_lines() if line]
+            ranges = self._lines.setdefault(code.co_filename, [])
+            bisect.insort(ranges, (code.co_firstlineno, max(lines, default=code.co_firstlineno), cls.__name__))
+        self._owners.clear()
+
+    def _owner(self, filename, line):
+        key = (filename, line)
+        if key not in self._owners:
+            owner = None
+            ranges = self._lines.get(filename, ())
+            i = bisect.bisect_right(ranges, (line, float('inf'), ''))
+            # The innermost function containing the line, nested ranges start later
+            while i > 0:
+                i -= 1
+                first, last, name = ranges[i]
+                if first <= line <= last:
+                    owner = name
+                    break
+            self._owners[key] = owner
+        return self._owners[key]
+
+    def python_bytes(self):
+        """{(area, class name): bytes} of live traced allocations, empty when not tracing"""
+        if not self.tracing:
+            return {}
+        roots = self.areas()
+        area_classes = {type(root).__name__: name for name, root in roots.items()}
+        for entity in scene.entities:
+            for cls in inspect.getmro(type(entity)):
+                self._index_class(cls)
+
+        # Group the raw (domain, size, frames, ...) traces by stack, Snapshot.statistics() builds
+        # objects for every frame. Whatever the loop allocates is traced too, at the cost of a
+        # stack walk each, so sizes are appended rather than added up into new ints.
+        stacks = defaultdict(list)
+        for trace in tracemalloc.take_snapshot().traces._traces:
+            stacks[trace[2]].append(trace[1])
+        charged = defaultdict(int)
+        for frames, sizes in stacks.items():
+            size = sum(sizes)
+            owner = area = None
+            # Frames run innermost first
+            for filename, line in frames:
+                name = self._owner(filename, line)
+                if name:
+                    owner = owner or name
+                    area = area_classes.get(name, area)
+            charged[(area or 'other', owner or 'other')] += size
+        return dict(charged)
+
+    def footprint(self, area):
+        """(entities, gpu bytes, python bytes) of one area"""
+        counts, _ = self.census()
+        rows = counts.get(area, {}).values()
+        python = sum(size for (owner_area, _), size in self.python_bytes().items() if owner_area == area)
+        return sum(row[0] for row in rows), sum(row[1] for row in rows), python
+
+    def visited(self, area):
+        """Record area's footprint after a visit, returns a warning if it looks like it leaks"""
+        visits = self.visits[area]
+        visits.append(self.footprint(area))
+        del visits[:-(LEAK_VISITS + 1)]
+        if len(visits) <= LEAK_VISITS:
+            return None
+        pairs = list(zip(visits, visits[1:]))
+        entities = [b[0] - a[0] for a, b in pairs]
+        sizes = [(b[1] + b[2]) - (a[1] + a[2]) for a, b in pairs]
+        if all(e > 0 for e in entities) or (all(s > 0 for s in sizes) and sum(sizes) > LEAK_BYTES):
+            self.leaks[area] = (f"{area} grew on each of its last {LEAK_VISITS} visits: "
+                                f"+{sum(entities)} entities, +{_kilobytes(sum(sizes))}")
+            return self.leaks[area]
+        self.leaks.pop(area, None)
+        return None
+
+    def summary(self):
+        """One line per area, for the overlay"""
+        counts, total = self.census()
+        lines = []
+        for area, classes in sorted(counts.items(), key=lambda item: -sum(r[1] for r in item[1].values())):
+            entities = sum(row[0] for row in classes.values())
+            gpu = sum(row[1] for row in classes.values())
+            lines.append(f"{area:<14} {entities:6} entities {_kilobytes(gpu):>10}")
+        lines.append(f"{'gpu total':<14} {'':6}          {_kilobytes(total):>10}")
+        if self.tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            lines.append(f"{'python':<14} {_kilobytes(current):>15} (peak {_kilobytes(peak)})")
+        for warning in self.leaks.values():
+            lines.append(f"LEAK? {warning}")
+        return '\n'.join(lines)
+
+    def report(self):
+        """Every area and class, with Python bytes when tracing"""
+        counts, total = self.census()
+        python = self.python_bytes()
+        lines = [f"{'area':<14} {'class':<24} {'entities':>8} {'gpu':>12} {'python':>12}"]
+        areas = sorted(set(counts) | {area for area, _ in python})
+        for area in areas:
+            classes = set(counts.get(area, {})) | {owner for owner_area, owner in python if owner_area == area}
+            for name in sorted(classes):
+                entities, gpu = counts.get(area, {}).get(name, (0, 0))
+                size = python.get((area, name))
+                lines.append(f"{area:<14} {name:<24} {entities:8} {_kilobytes(gpu):>12} "
+                             f"{_kilobytes(size) if size is not None else '-':>12}")
+        lines.append(f"gpu total {_kilobytes(total)}")
+        if self.tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            lines.append(f"python traced {_kilobytes(current)}, peak {_kilobytes(peak)}")
+        else:
+            lines.append("python not traced, set SM64_TRACEMALLOC=32 to attribute it")
+        lines.extend(f"LEAK? {warning}" for warning in self.leaks.values())
+        return '\n'.join(lines)
+
+    def dump(self, name='memory', folder=PROFILE_FOLDER):
+        """Write report() to a file, returns its path"""
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{name}-{pytime.strftime('%Y%m%d-%H%M%S')}.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.report() + '\n')
+        return path
+
+
+class MemoryOverlay(Text):
+    """The ledger's summary, refreshed every `interval` seconds while enabled"""
+    def __init__(self, ledger, interval=2.0, **kwargs):
+        super().__init__('', parent=camera.ui, position=(0.25, 0.3), scale=0.7, color=color.white,
+                         background=True, ignore=False, **kwargs)
+        self.ledger = ledger
+        self.interval = interval
+        self.clock = 0.0
+
+    def on_enable(self):
+        self.clock = 0.0
+
+    def update(self):
+        self.clock -= time.dt
+        if self.clock > 0:
+            return
+        self.clock = self.interval
+        self.text = self.ledger.summary()
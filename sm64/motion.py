@@ -0,0 +1,136 @@
+"""
+GPU-driven decorative motion (bob, spin, sway, pulse, ripple)
+
+Motions are declared once per entity as shader inputs. The only per-frame
+Python work is a single MotionClock pushing the time uniform onto a root
+entity, which every animated child inherits through the scene graph.
+"""
+
+import math
+
+from ursina import Entity, Shader, Vec2, Vec3, Vec4, time
+
+
+motion_shader = Shader(name='motion_shader', language=Shader.GLSL, vertex='''#version 140
+
+uniform mat4 p3d_ModelMatrix;
+uniform mat4 p3d_ViewProjectionMatrix;
+in vec4 p3d_Vertex;
+in vec2 p3d_MultiTexCoord0;
+in vec4 p3d_Color;
+out vec2 texcoords;
+out vec4 vertex_color;
+uniform vec2 texture_scale;
+uniform vec2 texture_offset;
+
+uniform float motion_time;
+uniform vec3 motion_bob;      // peak offset in the scene root's space
+uniform vec2 motion_bob_wave; // speed, phase
+uniform vec4 motion_spin;     // degrees per second, sway degrees, sway speed, sway phase
+uniform vec3 motion_spin_axis; // unit axis in model space
+uniform vec3 motion_pulse;    // amplitude, speed, phase
+uniform vec4 motion_ripple;   // start time, speed, x amplitude, y amplitude
+
+
+void main() {
+    float t = motion_time;
+    vec4 v = p3d_Vertex;
+
+    // Pulse: uniform scale between 1 and 1 + amplitude
+    v.xyz *= 1.0 + motion_pulse.x * (sin(t * motion_pulse.y + motion_pulse.z) + 1.0) * 0.5;
+
+    // Ripple: one cycle of squash and stretch after it was triggered
+    float r = (t - motion_ripple.x) * motion_ripple.y;
+    if (r >= 0.0 && r < 6.2831853) {
+        v.x *= 1.0 + sin(r) * motion_ripple.z;
+        v.y *= 1.0 + cos(r) * motion_ripple.w;
+    }
+
+    // Spin and sway around the axis, the same way round as the entity's rotation about it
+    float angle = radians(motion_spin.x * t + motion_spin.y * sin(t * motion_spin.z + motion_spin.w));
+    float c = cos(angle);
+    float s = sin(angle);
+    vec3 k = motion_spin_axis;
+    v.xyz = v.xyz * c - cross(k, v.xyz) * s + k * dot(k, v.xyz) * (1.0 - c);
+
+    // Bob after the model matrix: add() converted the parent-space offset to this space,
+    // so the amplitude ignores the entity's own scale and rotation
+    vec4 world = p3d_ModelMatrix * v;
+    world.xyz += motion_bob * sin(t * motion_bob_wave.x + motion_bob_wave.y);
+
+    gl_Position = p3d_ViewProjectionMatrix * world;
+    texcoords = (p3d_MultiTexCoord0 * texture_scale) + texture_offset;
+    vertex_color = p3d_Color;
+}
+''',
+
+fragment='''
+#version 140
+
+uniform sampler2D p3d_Texture0;
+uniform vec4 p3d_ColorScale;
+in vec2 texcoords;
+in vec4 vertex_color;
+out vec4 fragColor;
+
+
+void main() {
+    fragColor = texture(p3d_Texture0, texcoords) * p3d_ColorScale * vertex_color;
+}
+''',
+default_input={
+    'texture_scale': Vec2(1, 1),
+    'texture_offset': Vec2(0, 0),
+    'motion_bob': Vec3(0, 0, 0),
+    'motion_bob_wave': Vec2(0, 0),
+    'motion_spin': Vec4(0, 0, 0, 0),
+    'motion_spin_axis': Vec3(0, 0, 1),
+    'motion_pulse': Vec3(0, 0, 0),
+    'motion_ripple': Vec4(-1000, 1, 0, 0),
+}
+)
+
+AXES = {'x': 0, 'y': 1, 'z': 2}
+
+
+class MotionClock(Entity):
+    """Drives every declared motion under `root` from one time uniform"""
+    def __init__(self, root, **kwargs):
+        super().__init__(parent=root, **kwargs)
+        self.root = root
+        self.time = 0.0
+        root.set_shader_input('motion_time', 0.0)
+
+    def update(self):
+        self.time += time.dt
+        self.root.set_shader_input('motion_time', self.time)
+
+    def add(self, entity, bob=None, bob_axis='y', spin=0, sway=None, pulse=None, spin_axis='z'):
+        """Declare the periodic motion of `entity` once.
+
+        bob   = (amplitude, speed, phase) offset along bob_axis in parent units,
+                converted with the parent's transform as it is now
+        spin  = constant rotation in degrees per second around the model's spin_axis
+        sway  = (degrees, speed, phase) oscillating rotation around the same axis
+        pulse = (amplitude, speed, phase) scale between 1 and 1 + amplitude
+        """
+        entity.shader = motion_shader
+        amplitude, speed, phase = bob or (0, 0, 0)
+        offset = Vec3(0, 0, 0)
+        offset[AXES[bob_axis]] = amplitude
+        entity.set_shader_input('motion_bob', entity.getTop().getRelativeVector(entity.parent, offset))
+        entity.set_shader_input('motion_bob_wave', Vec2(speed, phase))
+        sway_degrees, sway_speed, sway_phase = sway or (0, 0, 0)
+        entity.set_shader_input('motion_spin', Vec4(spin, sway_degrees, sway_speed, sway_phase))
+        axis = Vec3(0, 0, 0)
+        axis[AXES[spin_axis]] = 1
+        entity.set_shader_input('motion_spin_axis', axis)
+        entity.set_shader_input('motion_pulse', Vec3(*(pulse or (0, 0, 0))))
+        return entity
+
+    def ripple(self, entity, speed=5, amplitude=(0.03, 0.03)):
+        """Play one squash-and-stretch cycle starting now (like a painting being entered)"""
+        if entity.shader is not motion_shader:
+            entity.shader = motion_shader
+        entity.set_shader_input('motion_ripple', Vec4(self.time, speed, amplitude[0], amplitude[1]))
+        return 2 * math.pi / speed
@@ -0,0 +1,269 @@
+"""
+Navigation grids baked from course colliders
+
+A course is sampled once into a grid of walkable cells: the floor comes
+from the terrain or the ground entity, and every other collider that would
+block something of agent height marks the cells under it as solid. The
+bake is cached on disk next to the build scripts and reused as long as the
+course layout hasn't changed.
+
+Single routes are answered with A*. Enemies chasing the player share one
+FlowField instead: it's rebuilt only when the player moves to another cell,
+and every chaser then just reads the direction stored under it.
+"""
+
+import hashlib
+import heapq
+import math
+import os
+
+import numpy as np
+from ursina import scene
+
+from sm64 import ROOT
+
+
+CACHE_FOLDER = os.path.join(ROOT, 'navcache')
+
+# (di, dj, cost) for the eight neighbours of a cell
+NEIGHBOURS = tuple((di, dj, math.hypot(di, dj)) for dj in (-1, 0, 1) for di in (-1, 0, 1) if di or dj)
+
+
+def static_boxes(root, exclude=()):
+    """(min x, min y, min z, max x, max y, max z) bounds in root's space of every collider under root"""
+    boxes = []
+    for entity in scene.entities:
+        if entity.collider and entity not in exclude and entity.has_ancestor(root):
+            bounds = entity.getTightBounds(root)
+            if bounds:
+                boxes.append((*bounds[0], *bounds[1]))
+    return boxes
+
+
+class NavGrid:
+    """Walkable cells every `cell` units from local (x0, z0), with the floor height of each"""
+    def __init__(self, walkable, heights, cell=1.0, x0=0.0, z0=0.0):
+        self.walkable = np.asarray(walkable, dtype=bool)
+        self.heights = np.asarray(heights, dtype=np.float32)
+        self.rows, self.columns = self.walkable.shape
+        self.cell = cell
+        self.x0 = x0
+        self.z0 = z0
+
+    @classmethod
+    def bake(cls, root, ground, terrain=None, cell=1.0, step_height=0.5, agent_height=2.0, max_slope=40,
+             exclude=(), cache=None):
+        """Build the grid for everything with a collider under `root`.
+
+        The grid covers the terrain if there is one, otherwise the top of
+        `ground`. With a cache name the result is stored in CACHE_FOLDER
+        and loaded instead of rebuilt while the layout stays the same.
+        """
+        obstacles = static_boxes(root, exclude={ground, terrain, *exclude})
+
+        if terrain:
+            field = terrain.field
+            x0, z0 = field.x0 + terrain.x, field.z0 + terrain.z
+            width, depth = field.width, field.depth
+        else:
+            low, high = ground.getTightBounds(root)
+            x0, z0 = low.x, low.z
+            width, depth = high.x - low.x, high.z - low.z
+        columns, rows = max(int(width / cell), 1), max(int(depth / cell), 1)
+
+        key = hashlib.sha1(repr((
+            x0, z0, columns, rows, cell, step_height, agent_height, max_slope,
+            sorted(tuple(round(v, 3) for v in box) for box in obstacles)
+        )).encode())
+        if terrain:
+            key.update(terrain.field.heights.tobytes())
+        key = key.hexdigest()
+
+        path = os.path.join(CACHE_FOLDER, f'{cache}.npz') if cache else None
+        if path and os.path.exists(path):
+            try:
+                with np.load(path) as data:
+                    if str(data['key']) == key:
+                        return cls(data['walkable'], data['heights'], cell, x0, z0)
+            except (OSError, ValueError, KeyError):
+                pass    # unreadable or from an older format, bake again
+
+        # Floor at every cell center
+        x = x0 + (np.arange(columns) + 0.5) * cell
+        z = z0 + (np.arange(rows) + 0.5) * cell
+        x, z = np.meshgrid(x, z)
+        if terrain:
+            heights = terrain.field.heights_at(x - terrain.x, z - terrain.z) + terrain.y
+            dz, dx = np.gradient(heights, cell)
+            walkable = np.hypot(dx, dz) <= math.tan(math.radians(max_slope))
+        else:
+            heights = np.full(x.shape, high.y, dtype=np.float32)
+            walkable = np.ones(x.shape, dtype=bool)
+
+        # Anything overlapping the space an agent stands in, but not low enough to step onto
+        for min_x, min_y, min_z, max_x, max_y, max_z in obstacles:
+            i0, i1 = max(int((min_x - x0) / cell), 0), min(int(math.ceil((max_x - x0) / cell)), columns)
+            j0, j1 = max(int((min_z - z0) / cell), 0), min(int(math.ceil((max_z - z0) / cell)), rows)
+            if i0 >= i1 or j0 >= j1:
+                continue
+            floor = heights[j0:j1, i0:i1]
+            blocked = (max_y > floor + step_height) & (min_y < floor + agent_height)
+            walkable[j0:j1, i0:i1] &= ~blocked
+
+        grid = cls(walkable, heights, cell, x0, z0)
+        if path:
+            os.makedirs(CACHE_FOLDER, exist_ok=True)
+            # Write then rename so a crash mid-save never leaves a broken cache
+            temporary = path + '.tmp.npz'
+            np.savez_compressed(temporary, key=key, walkable=grid.walkable, heights=grid.heights)
+            os.replace(temporary, path)
+        return grid
+
+    def cell_of(self, x, z):
+        """(i, j) of the cell containing a local point, clamped to the grid"""
+        i = min(max(int((x - self.x0) / self.cell), 0), self.columns - 1)
+        j = min(max(int((z - self.z0) / self.cell), 0), self.rows - 1)
+        return i, j
+
+    def cells_of(self, x, z):
+        """cell_of for numpy arrays of points"""
+        i = np.clip(((np.asarray(x) - self.x0) / self.cell).astype(np.int32), 0, self.columns - 1)
+        j = np.clip(((np.asarray(z) - self.z0) / self.cell).astype(np.int32), 0, self.rows - 1)
+        return i, j
+
+    def point(self, i, j):
+        """Local position on the floor at the center of a cell"""
+        return (self.x0 + (i + 0.5) * self.cell, float(self.heights[j, i]), self.z0 + (j + 0.5) * self.cell)
+
+    def walkable_at(self, x, z):
+        """Whether arrays of local points stand on walkable cells; points off the grid never do"""
+        x, z = np.asarray(x), np.asarray(z)
+        inside = (x >= self.x0) & (x < self.x0 + self.columns * self.cell) & \
+                 (z >= self.z0) & (z < self.z0 + self.rows * self.cell)
+        i, j = self.cells_of(x, z)
+        return inside & self.walkable[j, i]
+
+    def _passable(self, i, j, di, dj):
+        """Step from (i, j) by (di, dj) stays on the grid and doesn't cut a blocked corner"""
+        ni, nj = i + di, j + dj
+        if not (0 <= ni < self.columns and 0 <= nj < self.rows) or not self.walkable[nj, ni]:
+            return False
+        return not (di and dj) or (self.walkable[j, ni] and self.walkable[nj, i])
+
+    def find_path(self, start, goal):
+        """Local (x, y, z) waypoints from start to goal with A*, or [] if there is no way"""
+        start, goal = self.cell_of(start[0], start[2]), self.cell_of(goal[0], goal[2])
+        if not self.walkable[goal[1], goal[0]]:
+            return []
+
+        def estimate(cell):
+            # Octile distance, exact on an open 8-connected grid
+            dx, dz = abs(cell[0] - goal[0]), abs(cell[1] - goal[1])
+            return max(dx, dz) + (math.sqrt(2) - 1) * min(dx, dz)
+
+        came_from = {start: None}
+        cost = {start: 0.0}
+        frontier = [(estimate(start), start)]
+        while frontier:
+            _, current = heapq.heappop(frontier)
+            if current == goal:
+                path = []
+                while current:
+                    path.append(self.point(*current))
+                    current = came_from[current]
+                return path[::-1]
+            i, j = current
+            for di, dj, step in NEIGHBOURS:
+                if not self._passable(i, j, di, dj):
+                    continue
+                neighbour = (i + di, j + dj)
+                new_cost = cost[current] + step
+                if new_cost < cost.get(neighbour, math.inf):
+                    cost[neighbour] = new_cost
+                    came_from[neighbour] = current
+                    heapq.heappush(frontier, (new_cost + estimate(neighbour), neighbour))
+        return []
+
+
+class FlowField:
+    """Directions toward one target over the cells within `radius` of it.
+
+    Call seek() with the target every frame; the field is only rebuilt when
+    the target enters another cell, so any number of chasers share the cost.
+    """
+    def __init__(self, grid, radius=32):
+        self.grid = grid
+        self.radius = radius
+        self.target = None
+        self.i0 = self.j0 = 0
+        self.distance = np.zeros((0, 0), dtype=np.float32)
+        self.directions = np.zeros((0, 0, 2), dtype=np.float32)
+
+    def seek(self, x, z):
+        """Point the field at a local position, returns True if it had to be rebuilt"""
+        grid = self.grid
+        target = grid.cell_of(x, z)
+        if target == self.target:
+            return False
+        self.target = target
+
+        ti, tj = target
+        i0, i1 = max(ti - self.radius, 0), min(ti + self.radius + 1, grid.columns)
+        j0, j1 = max(tj - self.radius, 0), min(tj + self.radius + 1, grid.rows)
+        walkable = grid.walkable[j0:j1, i0:i1]
+        rows, columns = walkable.shape
+        self.i0, self.j0 = i0, j0
+
+        # Which of the eight steps leave each cell, padded so shifted views stay in bounds
+        open_cells = np.pad(walkable, 1)
+        allowed = []
+        for di, dj, step in NEIGHBOURS:
+            ok = walkable & open_cells[1 + dj:1 + dj + rows, 1 + di:1 + di + columns]
+            if di and dj:
+                ok &= open_cells[1:1 + rows, 1 + di:1 + di + columns] & open_cells[1 + dj:1 + dj + rows, 1:1 + columns]
+            allowed.append(ok)
+
+        # Relax all cells at once until distances settle, one ring of cells further per sweep
+        distance = np.full((rows + 2, columns + 2), np.inf, dtype=np.float32)
+        if walkable[tj - j0, ti - i0]:
+            distance[tj - j0 + 1, ti - i0 + 1] = 0
+        inner = distance[1:-1, 1:-1]
+        for _ in range(self.radius * 4):
+            best = inner.copy()
+            for (di, dj, step), ok in zip(NEIGHBOURS, allowed):
+                through = distance[1 + dj:1 + dj + rows, 1 + di:1 + di + columns] + step
+                np.minimum(best, np.where(ok, through, np.inf), out=best)
+            if np.array_equal(best, inner):
+                break
+            inner[:] = best
+
+        # Each cell points at its cheapest neighbour
+        candidates = np.stack([
+            np.where(ok, distance[1 + dj:1 + dj + rows, 1 + di:1 + di + columns] + step, np.inf)
+            for (di, dj, step), ok in zip(NEIGHBOURS, allowed)
+        ])
+        choice = np.argmin(candidates, axis=0)
+        steps = np.array([(di / cost, dj / cost) for di, dj, cost in NEIGHBOURS], dtype=np.float32)
+        directions = steps[choice]
+        directions[~np.isfinite(inner)] = 0
+        directions[tj - j0, ti - i0] = 0
+        self.distance = inner.copy()
+        self.directions = directions
+        return True
+
+    def directions_at(self, x, z):
+        """Unit xz directions for arrays of local points, and whether each point can reach the target.
+
+        Points outside the field, on blocked cells or in the target cell get
+        a zero direction and False.
+        """
+        if self.target is None:
+            return np.zeros((len(x), 2), dtype=np.float32), np.zeros(len(x), dtype=bool)
+        i, j = self.grid.cells_of(x, z)
+        i, j = i - self.i0, j - self.j0
+        rows, columns = self.distance.shape
+        inside = (i >= 0) & (i < columns) & (j >= 0) & (j < rows)
+        i, j = np.where(inside, i, 0), np.where(inside, j, 0)
+        directions = np.where(inside[:, None], self.directions[j, i], 0)
+        reachable = inside & np.isfinite(self.distance[j, i]) & (self.distance[j, i] > 0)
+        return directions, reachable
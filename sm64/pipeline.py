@@ -0,0 +1,310 @@
+"""
+Offline bake pipeline
+
+Bakes are the slow, deterministic parts of loading a scene whose results
+are cached on disk: castle vertex lighting (sm64.bake) and course
+navigation grids (sm64.navigation). Run them ahead of time with
+
+    python -m sm64.pipeline              # everything that's out of date
+    python -m sm64.pipeline 'nav:*' -f   # rebuild the navigation grids
+
+Each bake runs in a worker process that loads the build it belongs to
+headless and keeps it loaded for the next bake of the same build. Bakes
+are fanned out across a process pool in dependency order, so a bake only
+starts once everything it comes after is done.
+
+A bake is up to date when the hash of its inputs matches the manifest in
+CACHE_FOLDER and its outputs exist. Its inputs are its build script, the
+sm64 modules the script imports (followed through their own imports),
+its parameters and the hashes of the bakes it comes after. Only bakes
+that are out of date go to the pool. Each cache also keeps its own key, so
+a bake rerun over unchanged geometry just reloads its previous result.
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time as pytime
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from sm64 import ROOT
+from sm64.builds import BUILDS
+from sm64.bake import CACHE_FOLDER, lighting_path
+from sm64.navigation import CACHE_FOLDER as NAV_FOLDER
+
+
+MANIFEST = os.path.join(CACHE_FOLDER, 'manifest.json')
+
+IMPORT = re.compile(r'^\s*(?:from\s+sm64\.(\w+)\s+import|import\s+sm64\.(\w+))', re.MULTILINE)
+
+# infdev course ids and the cache names SimpleCourse.bake_navigation gives their grids
+NAV_CACHES = {
+    'bob_omb': 'bob-omb_battlefield',
+    'whomps': 'whomps_fortress',
+    'cool_cool': 'cool_cool_mountain',
+    'jolly_roger': 'jolly_roger_bay',
+    'bowser1': 'bowsers_dark_world',
+}
+
+
+def sources(path, found=None):
+    """path and every sm64 module it imports, directly or not"""
+    found = set() if found is None else found
+    if path in found or not os.path.exists(path):
+        return found
+    found.add(path)
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    for match in IMPORT.finditer(text):
+        sources(os.path.join(ROOT, 'sm64', f'{match.group(1) or match.group(2)}.py'), found)
+    return found
+
+
+class Bake:
+    """One bake: run(game, *args) in a worker with `build` loaded, writing `outputs`"""
+    def __init__(self, name, build, run, args=(), outputs=(), after=()):
+        self.name = name
+        self.build = build
+        self.run = run
+        self.args = tuple(args)
+        self.outputs = tuple(outputs)
+        self.after = tuple(after)
+
+    @property
+    def inputs(self):
+        return sorted(sources(os.path.join(ROOT, BUILDS[self.build]['script'])))
+
+    def key(self, after_keys=()):
+        key = hashlib.sha1(repr((self.name, self.build, self.run.__name__, self.args, tuple(after_keys))).encode())
+        for path in self.inputs:
+            key.update(os.path.relpath(path, ROOT).encode())
+            with open(path, 'rb') as f:
+                key.update(f.read())
+        return key.hexdigest()
+
+
+def _loaded(game):
+    """Lighting bakes as part of the build, which its loader builds behind the menu"""
+    game['loader'].finish()
+
+
+def _bake_navigation(game, course_id):
+    # Courses look for the player and castle the menu builds in the background
+    game['loader'].finish()
+    game['load_course'](course_id)
+
+
+def default_bakes():
+    bakes = [
+        Bake('lighting:1.0', '1.0', _loaded, outputs=[lighting_path('castle-1.0')]),
+        Bake('lighting:build0', 'build0', _loaded, outputs=[lighting_path('castle-build0')]),
+    ]
+    for course_id, cache in NAV_CACHES.items():
+        bakes.append(Bake(f'nav:{course_id}', 'infdev', _bake_navigation, args=[course_id],
+                          outputs=[os.path.join(NAV_FOLDER, f'{cache}.npz')]))
+    return bakes
+
+
+def ordered(bakes):
+    """Bakes with everything they come after first, raises ValueError on cycles or unknown names"""
+    by_name = {bake.name: bake for bake in bakes}
+    order, state = [], {}
+
+    def visit(bake, chain):
+        if state.get(bake.name) == 'done':
+            return
+        if state.get(bake.name) == 'visiting':
+            raise ValueError(f"bake cycle: {' -> '.join(chain + [bake.name])}")
+        state[bake.name] = 'visiting'
+        for name in bake.after:
+            if name not in by_name:
+                raise ValueError(f'{bake.name} comes after unknown bake {name}')
+            visit(by_name[name], chain + [bake.name])
+        state[bake.name] = 'done'
+        order.append(bake)
+
+    for bake in bakes:
+        visit(bake, [])
+    return order
+
+
+def select(bakes, patterns):
+    """Bakes matching any pattern, and everything they come after"""
+    if not patterns:
+        return list(bakes)
+    by_name = {bake.name: bake for bake in bakes}
+    chosen = set()
+
+    def add(name):
+        if name not in chosen:
+            chosen.add(name)
+            for after in by_name[name].after:
+                add(after)
+
+    for pattern in patterns:
+        matches = fnmatch.filter(by_name, pattern)
+        if not matches:
+            raise ValueError(f'no bake matches {pattern}')
+        for name in matches:
+            add(name)
+    return [bake for bake in bakes if bake.name in chosen]
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest):
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    temporary = MANIFEST + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(temporary, MANIFEST)
+
+
+def plan(bakes, manifest):
+    """(keys, fresh) for bakes in order: each one's input hash, and whether it's up to date"""
+    keys, fresh = {}, {}
+    for bake in bakes:
+        keys[bake.name] = bake.key(keys[name] for name in bake.after)
+        entry = manifest.get(bake.name, {})
+        fresh[bake.name] = entry.get('key') == keys[bake.name] and all(map(os.path.exists, bake.outputs))
+    return keys, fresh
+
+
+# Worker process state: the build loaded last, kept for the next bake of the same build
+_host = None
+
+
+def _start_worker():
+    global _host
+    # Lighting only bakes under presets that use it, and the bake is the same for all of them
+    os.environ['SM64_QUALITY'] = 'medium'
+    sys.stdout = open(os.devnull, 'w')
+    from sm64.headless import boot
+    from sm64.builds import BuildHost
+    boot()
+    _host = BuildHost()
+
+
+def _work(bake, force):
+    """Run one bake in a worker, returns (seconds loading, seconds baking, pid)"""
+    if force:
+        for path in bake.outputs:
+            if os.path.exists(path):
+                os.remove(path)
+    t = pytime.perf_counter()
+    # Lighting bakes on load, so those builds are always loaded fresh
+    if _host.name != bake.build or bake.run is _loaded:
+        _host.load(bake.build)
+    loaded = pytime.perf_counter()
+    bake.run(_host.namespace['update'].__globals__, *bake.args)
+    done = pytime.perf_counter()
+    missing = [path for path in bake.outputs if not os.path.exists(path)]
+    if missing:
+        raise RuntimeError(f"{bake.name} didn't write {', '.join(missing)}")
+    if bake.run is _loaded:
+        return 0.0, done - t, os.getpid()
+    return loaded - t, done - loaded, os.getpid()
+
+
+def run(bakes, workers=None, force=False):
+    """Bake everything out of date, returns one report row per bake"""
+    bakes = ordered(bakes)
+    manifest = load_manifest()
+    keys, fresh = plan(bakes, manifest)
+    rows = {}
+    todo = []
+    for bake in bakes:
+        if fresh[bake.name] and not force:
+            rows[bake.name] = {'name': bake.name, 'status': 'cached', 'load': 0.0, 'bake': 0.0, 'worker': None}
+        else:
+            todo.append(bake)
+
+    started = pytime.perf_counter()
+    if todo:
+        workers = min(workers or os.cpu_count(), len(todo))
+        context = multiprocessing.get_context('spawn')
+        waiting = {bake.name: bake for bake in todo}
+        running = {}
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_start_worker) as pool:
+            while waiting or running:
+                for bake in list(waiting.values()):
+                    statuses = [rows.get(name, {}).get('status') for name in bake.after]
+                    if any(status in ('failed', 'skipped') for status in statuses):
+                        del waiting[bake.name]
+                        rows[bake.name] = {'name': bake.name, 'status': 'skipped', 'load': 0.0, 'bake': 0.0, 'worker': None}
+                    elif all(status in ('cached', 'baked') for status in statuses):
+                        del waiting[bake.name]
+                        running[pool.submit(_work, bake, force)] = bake
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    bake = running.pop(future)
+                    try:
+                        load, seconds, worker = future.result()
+                    except Exception as error:
+                        rows[bake.name] = {'name': bake.name, 'status': 'failed', 'load': 0.0, 'bake': 0.0,
+                                           'worker': None, 'error': str(error)}
+                        manifest.pop(bake.name, None)
+                        continue
+                    rows[bake.name] = {'name': bake.name, 'status': 'baked', 'load': load, 'bake': seconds, 'worker': worker}
+                    manifest[bake.name] = {
+                        'key': keys[bake.name],
+                        'outputs': [os.path.relpath(path, ROOT) for path in bake.outputs],
+                        'seconds': round(load + seconds, 4),
+                    }
+        save_manifest(manifest)
+
+    wall = pytime.perf_counter() - started
+    return [rows[bake.name] for bake in bakes], wall
+
+
+def report(rows, wall):
+    """Timing table for run()'s rows"""
+    lines = [f"{'bake':<20} {'status':<8} {'load':>9} {'bake':>9}  worker"]
+    for row in rows:
+        worker = row['worker'] or ''
+        lines.append(f"{row['name']:<20} {row['status']:<8} {row['load'] * 1000:7.0f} ms {row['bake'] * 1000:6.0f} ms  {worker}")
+        if 'error' in row:
+            lines.append(f"    {row['error']}")
+    work = sum(row['load'] + row['bake'] for row in rows)
+    baked = sum(row['status'] == 'baked' for row in rows)
+    cached = sum(row['status'] == 'cached' for row in rows)
+    lines.append(f"{baked} baked, {cached} up to date in {wall:.2f} s "
+                 f"({work:.2f} s of work on {len({row['worker'] for row in rows if row['worker']})} workers)")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bake lighting and navigation caches ahead of time')
+    parser.add_argument('bakes', nargs='*', help="bake names or patterns, like 'nav:*' (default: all)")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count())
+    parser.add_argument('-f', '--force', action='store_true', help='rebake even if up to date')
+    parser.add_argument('--list', action='store_true', help='list bakes and whether they are up to date')
+    args = parser.parse_args(argv)
+
+    bakes = select(default_bakes(), args.bakes)
+    if args.list:
+        _, fresh = plan(ordered(bakes), load_manifest())
+        for bake in ordered(bakes):
+            print(f"{bake.name:<20} {'up to date' if fresh[bake.name] else 'out of date'}")
+        return 0
+
+    rows, wall = run(bakes, args.workers, args.force)
+    print(report(rows, wall))
+    return 1 if any(row['status'] in ('failed', 'skipped') for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Kinematic moving platforms
+
+Every moving platform in a course is a row in one PlatformScheduler.
+Poses are pure functions of the scheduler's clock and are evaluated for
+all rows at once with NumPy: sliders swing along an offset, spinners turn
+about their vertical axis, and Whomp blocks stand, slam flat onto their
+face and slowly rise again. Only rows whose pose changed are written back
+to the scene graph, and their box colliders move with their nodes, so
+nothing is rebuilt as they move.
+
+Whatever stands on a platform is carried: before the platforms move, the
+rider's feet are found in the platform's own space, and after the move
+they are put back at the same spot. Translation, spin and tipping all
+come out of the same transform.
+"""
+
+import math
+
+import numpy as np
+from ursina import Entity, scene, time
+
+from sm64.components import ComponentStore
+
+
+SLIDE, SPIN, WHOMP = range(3)
+
+# Whomp cycle as fractions of its period: stand, fall, lie flat, rise
+WHOMP_STAND, WHOMP_FALL, WHOMP_LIE = 0.45, 0.08, 0.2
+
+
+class PlatformScheduler(Entity):
+    """All moving platforms of a course, posed in one pass per frame.
+
+    rider is the entity carried by whatever platform it stands on.
+    """
+    def __init__(self, rider=None, capacity=32, **kwargs):
+        super().__init__(**kwargs)
+        self.rider = rider
+        self.time = 0.0
+        self.platforms = ComponentStore(
+            capacity=capacity,
+            kind=np.int8,
+            base=(np.float32, 3),       # rest pose
+            base_heading=np.float32,
+            offset=(np.float32, 3),
+            period=np.float32,
+            phase=np.float32,           # fraction of the period
+            spin=np.float32,            # degrees per second
+            position=(np.float32, 3),
+            heading=np.float32,
+            pitch=np.float32,
+            reach=np.float32,           # distance from the node to the far corner of its body
+            body=object                 # the entity with the collider, the node itself unless it's pivoted
+        )
+
+    @property
+    def bodies(self):
+        platforms = self.platforms
+        return [platforms.body[row] for row in platforms.rows()]
+
+    def _add(self, kind, node, body, **values):
+        half = np.array(body.scale, dtype=np.float32) / 2
+        reach = float(np.linalg.norm(half) + np.linalg.norm(np.array(body.position, dtype=np.float32)))
+        return self.platforms.add(node, kind=kind, base=node.position, base_heading=node.rotation_y, position=node.position,
+                                  heading=node.rotation_y, reach=reach, body=body, **values)
+
+    def add_slider(self, position, offset, period=4, phase=0, scale=(4, 0.5, 4), **kwargs):
+        """Platform swinging between position - offset and position + offset.
+
+        One swing takes `period` seconds, `phase` is where it starts as a fraction of that.
+        """
+        platform = Entity(parent=self, model='cube', texture='white_cube', collider='box', position=position, scale=scale, **kwargs)
+        return self._add(SLIDE, platform, platform, offset=offset, period=period, phase=phase)
+
+    def add_spinner(self, position, speed=30, heading=0, scale=(8, 0.5, 2), **kwargs):
+        """Platform turning about its vertical axis at `speed` degrees per second"""
+        platform = Entity(parent=self, model='cube', texture='white_cube', collider='box', position=position,
+                          rotation_y=heading, scale=scale, **kwargs)
+        return self._add(SPIN, platform, platform, spin=speed)
+
+    def add_whomp(self, position, heading=0, period=6, phase=0, scale=(3, 4, 1), **kwargs):
+        """Block standing on `position` that slams forward onto its face and gets back up.
+
+        It tips over its front bottom edge, so it lands face down in front
+        of where it stood, its back becoming a platform. One slam and recovery
+        takes `period` seconds, `phase` is where it starts as a fraction of that.
+        """
+        pivot = Entity(parent=self, position=position, rotation_y=heading)
+        body = Entity(parent=pivot, model='cube', texture='white_cube', collider='box',
+                      position=(0, scale[1] / 2, -scale[2] / 2), scale=scale, **kwargs)
+        return self._add(WHOMP, pivot, body, period=period, phase=phase)
+
+    def _pose(self, rows):
+        """Position, heading and pitch of the given rows at the current time"""
+        p = self.platforms
+        kind = p.kind[rows]
+        t = self.time
+        position = p.base[rows].copy()
+        heading = p.base_heading[rows].copy()
+        pitch = np.zeros(len(rows), dtype=np.float32)
+
+        slide = kind == SLIDE
+        if slide.any():
+            swing = np.sin((t / p.period[rows][slide] + p.phase[rows][slide]) * math.tau)
+            position[slide] += p.offset[rows][slide] * swing[:, None]
+
+        spin = kind == SPIN
+        if spin.any():
+            heading[spin] = (heading[spin] + p.spin[rows][spin] * t) % 360
+
+        whomp = kind == WHOMP
+        if whomp.any():
+            u = (t / p.period[rows][whomp] + p.phase[rows][whomp]) % 1
+            fall = np.clip((u - WHOMP_STAND) / WHOMP_FALL, 0, 1)
+            rise = np.clip((u - WHOMP_STAND - WHOMP_FALL - WHOMP_LIE) / (1 - WHOMP_STAND - WHOMP_FALL - WHOMP_LIE), 0, 1)
+            # Falls faster and faster, gets up smoothly
+            pitch[whomp] = 90 * (fall * fall - rise * rise * (3 - 2 * rise))
+        return position, heading, pitch
+
+    def _standing_on(self):
+        """Row of the platform under the rider's feet and the feet in its body's space, or None"""
+        rider = self.rider
+        p = self.platforms
+        rows = p.rows()
+        if not rider or not len(rows):
+            return None
+
+        # Broad phase on spheres around every node, exact test on the few left
+        feet = rider.getPos(self)
+        offsets = p.position[rows] - np.array((feet.x, feet.y, feet.z), dtype=np.float32)
+        near = rows[np.einsum('ij,ij->i', offsets, offsets) < p.reach[rows] ** 2]
+        for row in near.tolist():
+            body = p.body[row]
+            local = body.getRelativePoint(scene, rider.getPos(scene))
+            scale = body.scale
+            # The face pointing most upward is the one to stand on: the top, or a fallen Whomp's back
+            up = body.getRelativeVector(scene, (0, 1, 0))
+            axis = max(range(3), key=lambda i: abs(up[i] * scale[i]))
+            side = 1 if up[axis] > 0 else -1
+            height = (local[axis] * side - 0.5) * scale[axis]
+            if -0.25 <= height <= 0.6 and all(abs(local[i]) * scale[i] <= scale[i] / 2 + 0.2 for i in range(3) if i != axis):
+                return row, local
+        return None
+
+    def _move(self, rows):
+        """Pose the given rows for the current time, returns {row: heading change} of those that moved"""
+        p = self.platforms
+        position, heading, pitch = self._pose(rows)
+        changed = np.any(position != p.position[rows], axis=1) | (heading != p.heading[rows]) | (pitch != p.pitch[rows])
+        moved = rows[changed]
+        turned = dict(zip(moved.tolist(), ((heading[changed] - p.heading[moved] + 180) % 360 - 180).tolist()))
+        p.position[moved] = position[changed]
+        p.heading[moved] = heading[changed]
+        p.pitch[moved] = pitch[changed]
+
+        nodes = p.nodes
+        for row, (x, y, z), h, r in zip(moved.tolist(), position[changed].tolist(), heading[changed].tolist(), pitch[changed].tolist()):
+            nodes[row].setPosHpr(x, y, z, -h, -r, 0)
+        return turned
+
+    def refresh(self):
+        """Pose every platform at once without carrying anyone, after the clock was set from outside (rewinds)"""
+        self._move(self.platforms.rows())
+
+    def update(self):
+        p = self.platforms
+        rows = p.rows()
+        if not len(rows):
+            return
+        standing = self._standing_on()
+        self.time += time.dt
+        turned = self._move(rows)
+
+        # Put the rider back on the same spot of the platform it was standing on
+        if standing and standing[0] in turned:
+            row, local = standing
+            self.rider.world_position = scene.getRelativePoint(p.body[row], local)
+            self.rider.rotation_y += turned[row]
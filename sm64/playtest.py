@@ -0,0 +1,377 @@
+"""
+Playtest environments: the game as a reset/step API for bots
+
+MarioEnv runs the infdev build in the current process without a window,
+on a fixed timestep, so a step costs only the game logic. Actions are
+held movement keys, a turn and a jump. Observations are Mario's state
+and the triggers nearest him (stars, the exit portal, paintings), and
+collected stars are the reward. It follows gym's API, reset() -> (obs,
+info) and step() -> (obs, reward, terminated, truncated, info), without
+depending on gym.
+
+Ursina keeps one app per process, so VectorEnv gives each environment a
+worker process and steps them all in lockstep. `python -m sm64.playtest`
+plays random episodes across a pool of workers and reports where bots
+got stuck or fell out of the world, and which frames were slowest.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time as pytime
+import traceback
+from collections import Counter
+
+import numpy as np
+
+from sm64.headless import boot
+
+
+# Each action is (forward, strafe, turn, jump): 0/1/2 for back/none/ahead,
+# left/none/right and turning left/none/right, then 0/1 for jumping
+ACTIONS = (3, 3, 3, 2)
+IDLE_ACTION = (1, 1, 1, 0)
+
+NEAREST = 4                         # triggers in each observation
+STAR, EXIT, PAINTING = 1, 2, 3
+# position, velocity, heading sin/cos, grounded, stars left, then (dx, dy, dz, kind) per trigger
+OBSERVATION_SIZE = 10 + NEAREST * 4
+
+FALL_Y = -50                        # below this Mario has left the level
+
+
+class MarioEnv:
+    """One bot playing one course of the infdev build"""
+    def __init__(self, course='bob_omb', frame_skip=4, fps=30, max_steps=1000, turn_speed=180,
+                 spawn_jitter=2.0, stuck_steps=30, seed=None):
+        from sm64.builds import BuildHost
+
+        self.app = boot(fps)
+        self.course_id = course
+        self.frame_skip = frame_skip
+        self.dt = 1 / fps
+        self.max_steps = max_steps
+        self.turn_speed = turn_speed
+        self.spawn_jitter = spawn_jitter
+        self.stuck_steps = stuck_steps
+        self.rng = np.random.default_rng(seed)
+
+        self.host = BuildHost()
+        self.host.load('infdev')
+        self.game = self.host.namespace['update'].__globals__
+        self.game['record_progress'] = False
+        self.baseline = None
+        self.steps = 0
+        self.still = 0
+        self.previous = np.zeros(3, dtype=np.float32)
+
+    @property
+    def player(self):
+        return self.game['player']
+
+    def _start(self):
+        """Start a new game in the course, and remember how it looked on arrival"""
+        game = self.game
+        menu = game['menu']
+        menu.selected = 0
+        menu.select_option()
+        game['enter_course'](self.course_id)
+        # Bots don't look at the screen or race ghosts
+        game['lakitu'].enabled = False
+        game['snapshots'].enabled = False
+        game['recorder'].enabled = False
+        self.step_frames(1)
+        self.baseline = game['snapshots'].snapshot()
+
+    def step_frames(self, frames, turn=0):
+        for _ in range(frames):
+            if turn:
+                self.player.rotation_y += turn * self.turn_speed * self.dt
+            self.host.update()
+            self.app.step()
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        if self.baseline is None:
+            self._start()
+        else:
+            self.game['snapshots'].restore(self.baseline)
+        player = self.player
+        jitter = self.rng.uniform(-self.spawn_jitter, self.spawn_jitter, 2)
+        player.x += jitter[0]
+        player.z += jitter[1]
+        player.rotation_y = self.rng.uniform(0, 360)
+        self._hold(IDLE_ACTION)
+        self.steps = 0
+        self.still = 0
+        self.previous = np.array(player.position, dtype=np.float32)
+        return self.observe(), self._info(0.0)
+
+    def _hold(self, action):
+        from ursina import held_keys
+        forward, strafe, _, _ = action
+        held_keys['w'], held_keys['s'] = int(forward == 2), int(forward == 0)
+        held_keys['d'], held_keys['a'] = int(strafe == 2), int(strafe == 0)
+
+    def _stars(self):
+        course = self.game['game_state']['current_course']
+        return course.stars if course else None
+
+    def _triggers(self):
+        """(positions, kinds) of every trigger Mario can reach in this area"""
+        game = self.game
+        course = game['game_state']['current_course']
+        if course:
+            stars = course.stars
+            rows = stars.rows(~stars.collected)
+            positions = [stars.position[rows], np.array([tuple(course.exit_portal.world_position)], np.float32)]
+            kinds = [np.full(len(rows), STAR), [EXIT]]
+        else:
+            entrances = game['castle'].entrances
+            rows = entrances.rows()
+            positions, kinds = [entrances.position[rows]], [np.full(len(rows), PAINTING)]
+        return np.concatenate(positions).astype(np.float32), np.concatenate(kinds)
+
+    def observe(self):
+        player = self.player
+        position = np.array(player.position, dtype=np.float32)
+        velocity = (position - self.previous) / (self.dt * self.frame_skip)
+        heading = np.radians(player.rotation_y)
+        stars = self._stars()
+        left = np.count_nonzero(~stars.collected[stars.rows()]) if stars else 0
+
+        observation = np.zeros(OBSERVATION_SIZE, dtype=np.float32)
+        observation[0:3] = position
+        observation[3:6] = velocity
+        observation[6:8] = np.sin(heading), np.cos(heading)
+        observation[8] = player.grounded or player.grounded_on_terrain
+        observation[9] = left
+
+        positions, kinds = self._triggers()
+        offsets = positions - position
+        nearest = np.argsort(np.einsum('ij,ij->i', offsets, offsets))[:NEAREST]
+        triggers = observation[10:].reshape(NEAREST, 4)
+        triggers[:len(nearest), :3] = offsets[nearest]
+        triggers[:len(nearest), 3] = kinds[nearest]
+        return observation
+
+    def _info(self, frame_ms):
+        game_state = self.game['game_state']
+        return {
+            'position': tuple(self.player.position),
+            'area': game_state['current_area'],
+            'stars': game_state['stars_collected'],
+            'lives': game_state['lives'],
+            'stuck': self.still >= self.stuck_steps,
+            'fell': self.player.y < FALL_Y,
+            'frame_ms': frame_ms,
+        }
+
+    def step(self, action):
+        forward, strafe, turn, jump = (int(a) for a in action)
+        game_state = self.game['game_state']
+        stars = game_state['stars_collected']
+        self._hold((forward, strafe, turn, jump))
+        if jump:
+            self.player.input('space')
+
+        t = pytime.perf_counter()
+        self.step_frames(self.frame_skip, turn - 1)
+        frame_ms = (pytime.perf_counter() - t) * 1000 / self.frame_skip
+
+        observation = self.observe()
+        position = observation[0:3]
+        # Trying to move and going nowhere
+        moving = forward != 1 or strafe != 1
+        if moving and np.linalg.norm(position - self.previous) < 0.05:
+            self.still += 1
+        else:
+            self.still = 0
+        self.previous = position.copy()
+        self.steps += 1
+
+        info = self._info(frame_ms)
+        reward = float(game_state['stars_collected'] - stars)
+        terminated = observation[9] == 0 or game_state['lives'] <= 0 or info['fell'] or info['stuck']
+        truncated = not terminated and self.steps >= self.max_steps
+        return observation, reward, bool(terminated), truncated, info
+
+    def close(self):
+        self.host.unload()
+
+
+def _work(pipe, kwargs, quiet):
+    """Worker process: one MarioEnv driven over a pipe"""
+    if quiet:
+        sys.stdout = open(os.devnull, 'w')
+    try:
+        env = MarioEnv(**kwargs)
+        while True:
+            command, value = pipe.recv()
+            if command == 'reset':
+                pipe.send(('ok', env.reset(value)))
+            elif command == 'step':
+                observation, reward, terminated, truncated, info = env.step(value)
+                if terminated or truncated:
+                    # Start the next episode straight away, like gym's vector envs
+                    info['final_observation'] = observation
+                    observation, _ = env.reset()
+                pipe.send(('ok', (observation, reward, terminated, truncated, info)))
+            elif command == 'close':
+                # The process is about to exit and take the scene with it
+                pipe.send(('ok', None))
+                return
+    except (KeyboardInterrupt, EOFError):
+        pass
+    except Exception:
+        pipe.send(('error', traceback.format_exc()))
+
+
+class VectorEnv:
+    """`count` MarioEnvs in worker processes, stepped together.
+
+    Observations, rewards and done flags come back stacked, with one info
+    dict per environment. An environment whose episode ends is reset
+    straight away, its last observation is in info['final_observation'].
+    """
+    def __init__(self, count, quiet=True, **kwargs):
+        context = multiprocessing.get_context('spawn')
+        self.count = count
+        self.pipes = []
+        self.workers = []
+        for _ in range(count):
+            pipe, child = context.Pipe()
+            worker = context.Process(target=_work, args=(child, kwargs, quiet), daemon=True)
+            worker.start()
+            child.close()
+            self.pipes.append(pipe)
+            self.workers.append(worker)
+
+    def _gather(self):
+        results = []
+        for pipe in self.pipes:
+            status, value = pipe.recv()
+            if status == 'error':
+                raise RuntimeError(f'playtest worker failed:\n{value}')
+            results.append(value)
+        return results
+
+    def reset(self, seed=None):
+        for i, pipe in enumerate(self.pipes):
+            pipe.send(('reset', None if seed is None else seed + i))
+        observations, infos = zip(*self._gather())
+        return np.stack(observations), list(infos)
+
+    def step(self, actions):
+        for pipe, action in zip(self.pipes, actions):
+            pipe.send(('step', tuple(int(a) for a in action)))
+        observations, rewards, terminated, truncated, infos = zip(*self._gather())
+        return (np.stack(observations), np.array(rewards, dtype=np.float32),
+                np.array(terminated), np.array(truncated), list(infos))
+
+    def close(self):
+        for pipe in self.pipes:
+            try:
+                pipe.send(('close', None))
+                pipe.recv()
+            except (BrokenPipeError, EOFError):
+                pass
+        for worker in self.workers:
+            worker.join(timeout=5)
+
+
+class RandomPolicy:
+    """Wanders: keeps each environment's last action most of the time, and mostly walks ahead"""
+    def __init__(self, seed=None, keep=0.9):
+        self.rng = np.random.default_rng(seed)
+        self.keep = keep
+        self.actions = None
+
+    def sample(self, count):
+        actions = self.rng.integers(0, ACTIONS, size=(count, len(ACTIONS)))
+        ahead = self.rng.random(count) < 0.6
+        actions[ahead, 0] = 2
+        return actions
+
+    def __call__(self, observations):
+        count = len(observations)
+        if self.actions is None or len(self.actions) != count:
+            self.actions = self.sample(count)
+        change = self.rng.random(count) > self.keep
+        self.actions[change] = self.sample(int(change.sum()))
+        return self.actions
+
+
+def playtest(episodes=100, workers=None, policy=None, seed=0, cell=5.0, **kwargs):
+    """Play `episodes` episodes across worker processes, returns a report.
+
+    Stuck and fall spots are counted per `cell`-sized square of the course.
+    """
+    workers = workers or os.cpu_count()
+    policy = policy or RandomPolicy(seed)
+    envs = VectorEnv(workers, **kwargs)
+    started = pytime.perf_counter()
+    observations, _ = envs.reset(seed)
+
+    finished = steps = stars = 0
+    stuck, fell = Counter(), Counter()
+    slowest = []        # (frame_ms, position)
+    try:
+        while finished < episodes:
+            observations, rewards, terminated, truncated, infos = envs.step(policy(observations))
+            steps += envs.count
+            stars += int(rewards.sum())
+            for info, done in zip(infos, terminated | truncated):
+                slowest.append((info['frame_ms'], info['position']))
+                if not done:
+                    continue
+                finished += 1
+                x, _, z = info['position']
+                spot = (round(x / cell) * cell, round(z / cell) * cell)
+                if info['stuck']:
+                    stuck[spot] += 1
+                if info['fell']:
+                    fell[spot] += 1
+            if len(slowest) > 1000:
+                slowest = sorted(slowest, reverse=True)[:10]
+    finally:
+        envs.close()
+
+    seconds = pytime.perf_counter() - started
+    return {
+        'episodes': finished,
+        'steps': steps,
+        'seconds': seconds,
+        'episodes_per_hour': finished / seconds * 3600,
+        'steps_per_second': steps / seconds,
+        'stars': stars,
+        'stuck': stuck.most_common(10),
+        'fell': fell.most_common(10),
+        'slowest_frames': sorted(slowest, reverse=True)[:10],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play random episodes of a course with bots')
+    parser.add_argument('course', nargs='?', default='bob_omb')
+    parser.add_argument('--episodes', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--max-steps', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    report = playtest(args.episodes, args.workers, seed=args.seed, course=args.course, max_steps=args.max_steps)
+    print(f"{report['episodes']} episodes, {report['steps']} steps in {report['seconds']:.1f} s")
+    print(f"{report['episodes_per_hour']:.0f} episodes/hour, {report['steps_per_second']:.0f} steps/s, "
+          f"{report['stars']} stars")
+    for name in ('stuck', 'fell'):
+        for (x, z), count in report[name]:
+            print(f"  {name} near ({x:.0f}, {z:.0f}): {count}")
+    for frame_ms, (x, y, z) in report['slowest_frames'][:5]:
+        print(f"  {frame_ms:.2f} ms frame at ({x:.1f}, {y:.1f}, {z:.1f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,549 @@
+"""
+Presence server for local multiplayer
+
+Several game instances share where their Mario is (area, position and
+heading) through a small asyncio UDP server, on localhost or a LAN:
+
+    python -m sm64.presence serve
+    SM64_PRESENCE=127.0.0.1:6464 python infdevmario64k1.x.py
+
+Both directions are delta compressed against the last packet the other
+side acknowledged: every packet names the sequence number it's relative
+to, carries only the players and fields that changed since then, and
+acknowledges the newest packet received the other way. Lost packets just
+mean a later delta is taken against an older baseline. A client that
+hears nothing back, or whose states stop being acknowledged, for TIMEOUT
+seconds drops its baselines and says HELLO again, so it finds its way
+back to a restarted server.
+
+Each client picks how often it sends its own state and how many
+snapshots per second it wants back, and can change both at any time.
+Remote players are drawn from a short buffer of snapshots, interpolated
+a little in the past so motion stays smooth between packets.
+
+This module is plain asyncio and runs without ursina. The avatars and the
+stats panel are in sm64.remote. `python -m sm64.presence loopback` runs
+a server and 32 simulated clients in one process and checks everyone
+sees everyone.
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+
+PORT = 6464
+HELLO, WELCOME, STATE, SNAPSHOT, BYE = range(1, 6)
+
+KIND = struct.Struct('<B')
+HELLO_PACKET = struct.Struct('<BB')                 # kind, snapshot rate
+WELCOME_PACKET = struct.Struct('<BHB')              # kind, client id, server tick rate
+STATE_HEADER = struct.Struct('<BHHHBd')             # kind, seq, baseline, ack, snapshot rate, client time
+SNAPSHOT_HEADER = struct.Struct('<BHHHdd')          # kind, seq, baseline, ack, server time, echoed client time
+COUNT = struct.Struct('<H')
+RECORD = struct.Struct('<HB')                       # player id, field mask
+
+# A player's state is (area, x, y, z, heading), heading in 1/65536ths of a turn
+FIELDS = (struct.Struct('<B'), struct.Struct('<f'), struct.Struct('<f'), struct.Struct('<f'), struct.Struct('<H'))
+REMOVED = 0x80
+
+NO_BASELINE = 0xffff
+HISTORY = 64            # packets kept as possible baselines
+TIMEOUT = 5.0           # seconds of silence before a client is dropped, or a client gives up on the server
+
+
+def encode_players(players, baseline):
+    """Records for the players that changed since baseline, and for the ones that left"""
+    out = bytearray(COUNT.size)
+    count = 0
+    for player, state in players.items():
+        old = baseline.get(player)
+        mask = 0
+        for bit, value in enumerate(state):
+            if old is None or value != old[bit]:
+                mask |= 1 << bit
+        if not mask:
+            continue
+        out += RECORD.pack(player, mask)
+        for bit, value in enumerate(state):
+            if mask >> bit & 1:
+                out += FIELDS[bit].pack(value)
+        count += 1
+    for player in baseline:
+        if player not in players:
+            out += RECORD.pack(player, REMOVED)
+            count += 1
+    COUNT.pack_into(out, 0, count)
+    return bytes(out)
+
+
+def decode_players(data, offset, baseline):
+    """Apply records from data[offset:] to a copy of baseline"""
+    players = dict(baseline)
+    (count,) = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    for _ in range(count):
+        player, mask = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if mask & REMOVED:
+            players.pop(player, None)
+            continue
+        state = list(players.get(player, (0, 0.0, 0.0, 0.0, 0)))
+        for bit, field in enumerate(FIELDS):
+            if mask >> bit & 1:
+                (state[bit],) = field.unpack_from(data, offset)
+                offset += field.size
+        players[player] = tuple(state)
+    return players
+
+
+def newer(seq, than):
+    """Sequence order with 16-bit wraparound"""
+    return than is None or 0 < (seq - than) & 0xffff < 0x8000
+
+
+def forget_before(history, latest):
+    """Drop every entry of {seq: players} that's HISTORY or more packets older than latest"""
+    oldest = (latest - HISTORY) & 0xffff
+    for seq in [seq for seq in history if not newer(seq, oldest)]:
+        del history[seq]
+
+
+class Outbox:
+    """Sending side of a delta-compressed stream"""
+    def __init__(self):
+        self.seq = 0
+        self.sent = {}      # seq -> players, the possible baselines
+
+    def pack(self, players, ack):
+        """(seq, baseline seq, records) for the next packet, relative to what the peer acknowledged"""
+        self.seq = (self.seq + 1) & 0xffff
+        if self.seq == NO_BASELINE:
+            self.seq = 0
+        baseline = ack if ack in self.sent else NO_BASELINE
+        records = encode_players(players, self.sent.get(baseline, {}))
+        self.sent[self.seq] = players
+        forget_before(self.sent, self.seq)
+        return self.seq, baseline, records
+
+
+class Inbox:
+    """Receiving side of a delta-compressed stream"""
+    def __init__(self):
+        self.latest = None      # newest seq decoded, acknowledged back to the sender
+        self.received = {}
+
+    def unpack(self, seq, baseline, data, offset):
+        """Decoded players, or None for stale packets and ones whose baseline is gone"""
+        if not newer(seq, self.latest):
+            return None
+        if baseline != NO_BASELINE and baseline not in self.received:
+            return None
+        players = decode_players(data, offset, self.received.get(baseline, {}))
+        self.received[seq] = players
+        self.latest = seq
+        # Whole ranges, a baseline whose successor was lost would never come up again
+        forget_before(self.received, seq)
+        return players
+
+    @property
+    def ack(self):
+        return NO_BASELINE if self.latest is None else self.latest
+
+
+class Traffic:
+    """Bytes and packets each way, as totals and per-second rates"""
+    def __init__(self):
+        self.bytes_in = self.bytes_out = self.packets_in = self.packets_out = 0
+        self.rates = {'bytes_in': 0.0, 'bytes_out': 0.0, 'packets_in': 0.0, 'packets_out': 0.0}
+        self._mark = time.monotonic()
+        self._last = (0, 0, 0, 0)
+
+    def received(self, size):
+        self.bytes_in += size
+        self.packets_in += 1
+
+    def sent(self, size):
+        self.bytes_out += size
+        self.packets_out += 1
+
+    def tick(self):
+        """Refresh the rates about once a second"""
+        now = time.monotonic()
+        elapsed = now - self._mark
+        if elapsed < 1:
+            return
+        totals = (self.bytes_in, self.bytes_out, self.packets_in, self.packets_out)
+        for name, total, last in zip(self.rates, totals, self._last):
+            self.rates[name] = (total - last) / elapsed
+        self._mark, self._last = now, totals
+
+
+class _Client:
+    """Server-side record of one connected game"""
+    def __init__(self, player, address, rate):
+        self.player = player
+        self.address = address
+        self.rate = rate
+        self.next_send = 0.0
+        self.outbox = Outbox()
+        self.inbox = Inbox()
+        self.ack = NO_BASELINE
+        self.echo = 0.0         # client time of its newest state, and when it arrived
+        self.echo_at = 0.0
+        self.last_seen = time.monotonic()
+        self.state = None
+
+
+class PresenceServer(asyncio.DatagramProtocol):
+    """Relays every client's state to every other client at the rate each one asked for"""
+    def __init__(self, tick_rate=60, max_rate=60):
+        self.tick_rate = tick_rate
+        self.max_rate = max_rate
+        self.clients = {}       # address -> _Client
+        self.next_player = 1
+        self.transport = None
+        self.traffic = Traffic()
+        self.port = None
+
+    async def start(self, host='127.0.0.1', port=PORT):
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        self.port = self.transport.get_extra_info('sockname')[1]
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def close(self):
+        self._task.cancel()
+        self.transport.close()
+
+    def _send(self, data, address):
+        self.transport.sendto(data, address)
+        self.traffic.sent(len(data))
+
+    def datagram_received(self, data, address):
+        self.traffic.received(len(data))
+        try:
+            kind = data[0]
+            client = self.clients.get(address)
+            if kind == HELLO:
+                _, rate = HELLO_PACKET.unpack_from(data)
+                rate = min(max(rate, 1), self.max_rate)
+                if client:
+                    # The client gave up on us and starts over, so do its streams
+                    client.outbox, client.inbox, client.ack = Outbox(), Inbox(), NO_BASELINE
+                    client.rate = rate
+                else:
+                    client = self.clients[address] = _Client(self.next_player, address, rate)
+                    self.next_player = self.next_player % 0xfffe + 1
+                self._send(WELCOME_PACKET.pack(WELCOME, client.player, self.tick_rate), address)
+            elif kind == STATE and client:
+                _, seq, baseline, ack, rate, sent_at = STATE_HEADER.unpack_from(data)
+                players = client.inbox.unpack(seq, baseline, data, STATE_HEADER.size)
+                client.last_seen = time.monotonic()
+                client.rate = min(max(rate, 1), self.max_rate)
+                if players is not None:
+                    client.ack = ack
+                    client.echo, client.echo_at = sent_at, client.last_seen
+                    client.state = players.get(client.player)
+            elif kind == BYE and client:
+                del self.clients[address]
+        except (struct.error, IndexError):
+            pass    # malformed packet, ignore it
+
+    def _snapshot(self, client, now):
+        # Everyone but the client itself
+        players = {c.player: c.state for c in self.clients.values() if c is not client and c.state}
+        seq, baseline, records = client.outbox.pack(players, client.ack)
+        # The echoed time includes how long the server held it, so the client's round trip doesn't
+        echo = client.echo + (now - client.echo_at) if client.echo_at else 0.0
+        self._send(SNAPSHOT_HEADER.pack(SNAPSHOT, seq, baseline, client.inbox.ack, now, echo) + records, client.address)
+
+    async def _run(self):
+        interval = 1 / self.tick_rate
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for address, client in list(self.clients.items()):
+                if now - client.last_seen > TIMEOUT:
+                    del self.clients[address]
+                elif now >= client.next_send:
+                    self._snapshot(client, now)
+                    client.next_send = max(client.next_send + 1 / client.rate, now)
+            self.traffic.tick()
+
+
+class PresenceClient(asyncio.DatagramProtocol):
+    """One game's connection to a PresenceServer.
+
+    The game calls publish() with its own state and remote_players() for
+    everyone else; both are safe to call from the game's thread while
+    start() runs the network in a background thread. send_rate and
+    snapshot_rate can be changed at any time.
+    """
+    def __init__(self, host='127.0.0.1', port=PORT, send_rate=20, snapshot_rate=20, delay=0.1):
+        self.host = host
+        self.port = port
+        self.send_rate = send_rate
+        self.snapshot_rate = snapshot_rate
+        self.delay = delay          # interpolation delay behind the newest snapshot
+        self.running = False
+        self.transport = None
+        self.state = None
+        self.snapshots = deque(maxlen=32)   # (server time, players)
+        self.traffic = Traffic()
+        self.lock = threading.Lock()
+        self.thread = None
+        self._disconnect()
+
+    @property
+    def send_rate(self):
+        return self._send_rate
+
+    @send_rate.setter
+    def send_rate(self, rate):
+        self._send_rate = max(rate, 1)
+
+    @property
+    def snapshot_rate(self):
+        return self._snapshot_rate
+
+    @snapshot_rate.setter
+    def snapshot_rate(self, rate):
+        # Packed in a byte, the server clamps it further to its own max_rate
+        self._snapshot_rate = min(max(int(rate), 1), 255)
+
+    @property
+    def connected(self):
+        return self.player is not None
+
+    def _disconnect(self):
+        """Forget the session, the next HELLO starts a new one from empty baselines"""
+        self.player = None
+        self.server_rate = None
+        self.outbox = Outbox()
+        self.inbox = Inbox()
+        self.ack = NO_BASELINE
+        self.heard = self.acked = 0.0       # when the last snapshot came, and the last new ack of our states
+        self.rtt = None
+        with self.lock:
+            self.snapshots.clear()
+            self.offset = None              # server clock minus ours
+
+    def _timed_out(self, now):
+        """No snapshots, or snapshots that stopped taking our states: the server restarted or forgot us"""
+        return now - self.heard > TIMEOUT or (self.outbox.sent and now - self.acked > TIMEOUT)
+
+    def publish(self, area, position, heading):
+        """Set our own state, sent at the next send tick"""
+        x, y, z = position
+        self.state = (int(area), float(x), float(y), float(z), int(heading % 360 / 360 * 65536) & 0xffff)
+
+    def remote_players(self, now=None):
+        """{player id: (area, (x, y, z), heading in degrees)} for everyone else, interpolated"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if not self.snapshots or self.offset is None:
+                return {}
+            render = now + self.offset - self.delay
+            snapshots = self.snapshots
+            if render <= snapshots[0][0]:
+                return {player: _pose(state) for player, state in snapshots[0][1].items()}
+            for (t0, a), (t1, b) in zip(snapshots, list(snapshots)[1:]):
+                if t0 <= render < t1:
+                    f = (render - t0) / (t1 - t0)
+                    return {player: _lerp(a.get(player, state), state, f) for player, state in b.items()}
+            return {player: _pose(state) for player, state in snapshots[-1][1].items()}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def _send(self, data):
+        self.transport.sendto(data)
+        self.traffic.sent(len(data))
+
+    def datagram_received(self, data, address):
+        now = time.monotonic()
+        self.traffic.received(len(data))
+        try:
+            kind = data[0]
+            if kind == WELCOME:
+                if not self.connected:
+                    _, self.player, self.server_rate = WELCOME_PACKET.unpack_from(data)
+                    self.heard = now
+            elif kind == SNAPSHOT and self.connected:
+                _, seq, baseline, ack, server_time, echo = SNAPSHOT_HEADER.unpack_from(data)
+                players = self.inbox.unpack(seq, baseline, data, SNAPSHOT_HEADER.size)
+                if players is None:
+                    return
+                self.heard = now
+                if ack != self.ack:
+                    self.acked = now
+                self.ack = ack
+                if echo:
+                    rtt = now - echo
+                    self.rtt = rtt if self.rtt is None else self.rtt + (rtt - self.rtt) * 0.1
+                # Track the least delayed packets: jitter only ever makes them look later
+                sample = server_time - now
+                with self.lock:
+                    if self.offset is None or sample > self.offset:
+                        self.offset = sample
+                    else:
+                        self.offset += (sample - self.offset) * 0.02
+                    self.snapshots.append((server_time, players))
+        except (struct.error, IndexError):
+            pass
+
+    async def run(self):
+        """Connect and keep sending until stop()"""
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: self, remote_addr=(self.host, self.port))
+        self.running = True
+        next_hello = 0.0
+        try:
+            while self.running:
+                now = time.monotonic()
+                if self.connected and self._timed_out(now):
+                    self._disconnect()
+                if not self.connected:
+                    if now >= next_hello:
+                        self._send(HELLO_PACKET.pack(HELLO, self.snapshot_rate))
+                        next_hello = now + 0.5
+                elif self.state:
+                    if not self.outbox.sent:
+                        self.acked = now    # the server has until TIMEOUT to acknowledge the first state
+                    seq, baseline, records = self.outbox.pack({self.player: self.state}, self.ack)
+                    self._send(STATE_HEADER.pack(STATE, seq, baseline, self.inbox.ack, self.snapshot_rate, now) + records)
+                self.traffic.tick()
+                await asyncio.sleep(1 / self.send_rate if self.connected else 0.05)
+        finally:
+            if self.connected:
+                self._send(KIND.pack(BYE))
+            self.transport.close()
+
+    def start(self):
+        """Run the connection in a background thread"""
+        self.thread = threading.Thread(target=asyncio.run, args=(self.run(),), daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+
+
+def client_from_env(variable='SM64_PRESENCE', **kwargs):
+    """A started client for the host:port in the environment variable, or None when it isn't set"""
+    address = os.environ.get(variable)
+    if not address:
+        return None
+    host, _, port = address.partition(':')
+    return PresenceClient(host or '127.0.0.1', int(port or PORT), **kwargs).start()
+
+
+def _pose(state):
+    area, x, y, z, heading = state
+    return area, (x, y, z), heading * 360 / 65536
+
+
+def _lerp(a, b, f):
+    if a[0] != b[0]:
+        return _pose(b)     # changed area, don't slide across the map
+    turn = ((b[4] - a[4] + 32768) & 0xffff) - 32768
+    return b[0], tuple(p + (q - p) * f for p, q in zip(a[1:4], b[1:4])), (a[4] + turn * f) * 360 / 65536 % 360
+
+
+async def loopback(clients=32, seconds=3.0, send_rate=20, snapshot_rate=20, tolerance=0.5):
+    """Run a server and `clients` simulated games on localhost, each walking its own circle.
+
+    Returns a report of what every client ended up seeing and what it cost.
+    """
+    server = await PresenceServer().start('127.0.0.1', 0)
+    games = [PresenceClient('127.0.0.1', server.port, send_rate=send_rate, snapshot_rate=snapshot_rate)
+             for _ in range(clients)]
+    tasks = [asyncio.create_task(game.run()) for game in games]
+
+    def walk(index, t):
+        # Every circle walked at 2 units per second
+        radius = 5 + index
+        angle = t * 2 / radius + index
+        return (math.cos(angle) * radius, 0.0, math.sin(angle) * radius)
+
+    start = time.monotonic()
+    while time.monotonic() - start < seconds:
+        t = time.monotonic() - start
+        for index, game in enumerate(games):
+            game.publish(index % 4, walk(index, t), t * 30)
+        await asyncio.sleep(1 / 60)
+
+    # Everyone's view of everyone else against where they really were one interpolation delay ago
+    now = time.monotonic()
+    index_of = {game.player: index for index, game in enumerate(games)}
+    seen, worst = [], 0.0
+    for game in games:
+        remote = game.remote_players(now)
+        seen.append(len(remote))
+        for player, (area, position, heading) in remote.items():
+            # Shifted by half a send interval, states are on average that old when they leave
+            truth = walk(index_of[player], now - start - game.delay - 0.5 / send_rate)
+            worst = max(worst, math.dist(position, truth))
+
+    report = {
+        'clients': clients,
+        'connected': sum(game.connected for game in games),
+        'min_seen': min(seen),
+        'max_error': worst,
+        'client_in_bps': sum(game.traffic.rates['bytes_in'] for game in games) / clients,
+        'client_out_bps': sum(game.traffic.rates['bytes_out'] for game in games) / clients,
+        'server_out_bps': server.traffic.rates['bytes_out'],
+        'rtt_ms': max((game.rtt or 0) for game in games) * 1000,
+    }
+    report['ok'] = report['connected'] == clients and report['min_seen'] == clients - 1 and worst < tolerance
+
+    for game in games:
+        game.stop()
+    await asyncio.gather(*tasks)
+    server.close()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Presence server for local multiplayer')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help='run a server')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=PORT)
+    serve.add_argument('--tick', type=int, default=60, help='server ticks per second')
+    test = commands.add_parser('loopback', help='check a server with simulated clients on localhost')
+    test.add_argument('--clients', type=int, default=32)
+    test.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        async def serve_forever():
+            server = await PresenceServer(tick_rate=args.tick).start(args.host, args.port)
+            print(f"Presence server on {args.host}:{server.port}")
+            while True:
+                await asyncio.sleep(5)
+                rates = server.traffic.rates
+                print(f"{len(server.clients)} clients, {rates['bytes_in'] / 1024:.1f} KB/s in, "
+                      f"{rates['bytes_out'] / 1024:.1f} KB/s out")
+        try:
+            asyncio.run(serve_forever())
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    report = asyncio.run(loopback(args.clients, args.seconds))
+    for name, value in report.items():
+        print(f"{name:>16}  {value:.2f}" if isinstance(value, float) else f"{name:>16}  {value}")
+    return 0 if report['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+In-game sampling profiler
+
+A SamplingProfiler wakes up `rate` times per second on its own thread and
+records the main thread's Python stack, tagged with the area the game is
+in at that moment. The main thread does no profiling work itself. A sample
+costs one walk up the stack and a counter increment for that stack.
+
+Stopping writes the samples to PROFILE_FOLDER in the collapsed-stack
+format that flame graph tools read (flamegraph.pl, speedscope, inferno).
+Each line is one stack, root first, with frames separated by semicolons,
+followed by the number of samples. The area is the root frame, so each
+area gets its own tower in the graph.
+
+Set the rate with the SM64_PROFILE_HZ environment variable (default 250).
+"""
+
+import os
+import sys
+import threading
+import time as pytime
+from collections import Counter
+
+from sm64 import ROOT
+
+
+PROFILE_FOLDER = os.path.join(ROOT, 'profiles')
+RATE = int(os.environ.get('SM64_PROFILE_HZ', 250))
+MAX_DEPTH = 128
+
+
+class SamplingProfiler:
+    """Samples the thread that calls start(); context() names the area each sample is tagged with"""
+    def __init__(self, rate=RATE, context=None, name='profile', folder=PROFILE_FOLDER):
+        self.rate = rate
+        self.context = context
+        self.name = name
+        self.folder = folder
+        self.stacks = Counter()
+        self.labels = {}        # code object -> frame label
+        self.thread = None
+        self.target = None
+        self.stopping = threading.Event()
+        self.samples = 0
+        self.sampling_time = 0.0
+        self.started = 0.0
+        self.elapsed = 0.0
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self):
+        """Start sampling the calling thread, forgetting any previous samples"""
+        if self.running:
+            return
+        self.stacks.clear()
+        self.samples = 0
+        self.sampling_time = 0.0
+        self.target = threading.get_ident()
+        self.stopping.clear()
+        self.started = pytime.perf_counter()
+        self.thread = threading.Thread(target=self._run, name='sampling profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop sampling and write the flame graph, returns its path or None if nothing was sampled"""
+        if not self.running:
+            return None
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+        self.elapsed = pytime.perf_counter() - self.started
+        if not self.stacks:
+            return None
+        path = os.path.join(self.folder, f"{self.name}-{pytime.strftime('%Y%m%d-%H%M%S')}.folded")
+        self.write(path)
+        return path
+
+    def toggle(self):
+        """start() or stop(), returns stop()'s path when stopping"""
+        if self.running:
+            return self.stop()
+        self.start()
+        return None
+
+    def _label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            if filename.startswith(ROOT):
+                filename = os.path.relpath(filename, ROOT)
+            else:
+                filename = os.path.basename(filename)
+            label = self.labels[code] = f"{getattr(code, 'co_qualname', code.co_name)} ({filename}:{code.co_firstlineno})"
+        return label
+
+    def sample(self):
+        """Record the target thread's stack once"""
+        frame = sys._current_frames().get(self.target)
+        if frame is None:
+            return
+        stack = []
+        while frame is not None and len(stack) < MAX_DEPTH:
+            stack.append(self._label(frame.f_code))
+            frame = frame.f_back
+        area = self.context() if self.context else None
+        stack.append(f'[{area}]' if area else '[unknown]')
+        self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        interval = 1 / self.rate
+        next_sample = pytime.perf_counter()
+        while not self.stopping.is_set():
+            t = pytime.perf_counter()
+            self.sample()
+            self.sampling_time += pytime.perf_counter() - t
+            next_sample += interval
+            # Fall behind rather than burst to catch up after a stall
+            next_sample = max(next_sample, pytime.perf_counter())
+            self.stopping.wait(next_sample - pytime.perf_counter())
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        os.replace(temporary, path)
+
+    def top(self, count=10):
+        """[(frame, share of samples)] for the frames most often at the top of the stack"""
+        leaves = Counter()
+        for stack, samples in self.stacks.items():
+            leaves[stack.rpartition(';')[2]] += samples
+        total = sum(leaves.values()) or 1
+        return [(frame, samples / total) for frame, samples in leaves.most_common(count)]
+
+    def summary(self):
+        """A few lines about the last run, for the console"""
+        lines = [f"{self.samples} samples in {self.elapsed:.1f} s "
+                 f"({self.samples / max(self.elapsed, 1e-9):.0f} Hz, "
+                 f"{self.sampling_time / max(self.samples, 1) * 1e6:.0f} us per sample)"]
+        for frame, share in self.top(5):
+            lines.append(f"  {share * 100:5.1f}%  {frame}")
+        return '\n'.join(lines)
@@ -0,0 +1,219 @@
+"""
+Pooled projectiles with batched ballistics
+
+Every projectile of one kind comes from a fixed pool allocated up front, so
+firing only flips a row on and shows a node that already exists. All live
+projectiles are integrated together each frame, and each one's path over
+the frame is swept against the course's static collider boxes, the terrain
+and the target, so fast shots can't tunnel through thin walls.
+"""
+
+import math
+
+import numpy as np
+from panda3d.core import NodePath
+from ursina import Entity, application, load_model, time
+
+from sm64.components import ComponentStore
+
+
+PROJECTILE_TYPES = {
+    'cannonball': {
+        'model': 'sphere',
+        'color': (0.15, 0.15, 0.15),
+        'scale': 0.7,
+        'radius': 0.35,
+        'gravity': 9.8,
+        'lifetime': 6.0,
+        'glow': False,
+    },
+    'fireball': {
+        'model': 'sphere',
+        'color': (1.0, 0.45, 0.1),
+        'scale': 0.8,
+        'radius': 0.4,
+        'gravity': 0.0,         # skims along flat like Bowser's flames
+        'lifetime': 4.0,
+        'glow': True,
+    },
+}
+
+
+def launch_velocity(start, target, speed, gravity=9.8):
+    """Velocity that sends a shot from start to target at `speed`, on the flatter of the two arcs.
+
+    Out of range targets get the 45 degree shot that lands closest.
+    """
+    dx, dy, dz = target[0] - start[0], target[1] - start[1], target[2] - start[2]
+    distance = math.hypot(dx, dz)
+    if distance < 1e-6:
+        return (0.0, speed, 0.0)
+    if gravity:
+        root = speed ** 4 - gravity * (gravity * distance * distance + 2 * dy * speed * speed)
+        angle = math.atan2(speed * speed - math.sqrt(root), gravity * distance) if root >= 0 else math.pi / 4
+    else:
+        angle = math.atan2(dy, distance)
+    horizontal = speed * math.cos(angle) / distance
+    return (dx * horizontal, speed * math.sin(angle), dz * horizontal)
+
+
+class ProjectilePool(Entity):
+    """Up to `capacity` live projectiles of one kind.
+
+    boxes are static colliders as (min x, min y, min z, max x, max y, max z)
+    in the pool's parent space, as returned by navigation.static_boxes.
+    target is hit when a shot passes within its hit_radius; on_hit(kind) is
+    called for every hit.
+    """
+    def __init__(self, kind, capacity=32, boxes=(), terrain=None, target=None, hit_radius=0.8, on_hit=None, **kwargs):
+        super().__init__(**kwargs)
+        self.kind = kind
+        self.settings = PROJECTILE_TYPES[kind]
+        self.capacity = capacity
+        self.terrain = terrain
+        self.target = target
+        self.hit_radius = hit_radius
+        self.on_hit = on_hit
+        self.boxes = boxes
+
+        self.shots = ComponentStore(
+            capacity=capacity,
+            position=(np.float32, 3),
+            velocity=(np.float32, 3),
+            age=np.float32,
+            active=np.bool_
+        )
+
+        # Every node exists from the start, hidden until fired
+        body = NodePath(kind)
+        body.setScale(self.settings['scale'])
+        body.setColorScale(*self.settings['color'], 1)
+        if self.settings['glow']:
+            body.setLightOff(1)
+        name = self.settings['model']
+        model = load_model(name, application.asset_folder) or load_model(name, application.internal_models_compressed_folder)
+        template = model.copyTo(body)
+        template.clearTransform()
+        template.clearColorScale()
+        template.clearColor()
+        for i in range(capacity):
+            node = self.attachNewNode(f'{kind}_{i}')
+            body.instanceTo(node)
+            node.hide()
+            self.shots.add(node)
+
+    @property
+    def boxes(self):
+        return self._boxes
+
+    @boxes.setter
+    def boxes(self, value):
+        # Grown by the shot radius so the sweep can treat shots as points
+        boxes = np.asarray(value, dtype=np.float32).reshape(-1, 6)
+        radius = self.settings['radius']
+        self._boxes = value
+        self.box_min = boxes[:, :3] - radius - np.array(self.position, dtype=np.float32)
+        self.box_max = boxes[:, 3:] + radius - np.array(self.position, dtype=np.float32)
+
+    @property
+    def active_count(self):
+        return int(self.shots.active.sum())
+
+    def fire(self, position, velocity):
+        """Launch a shot from a local position. A full pool recycles its oldest shot."""
+        shots = self.shots
+        idle = np.flatnonzero(~shots.active)
+        row = int(idle[0]) if len(idle) else int(np.argmax(shots.age))
+        shots.position[row] = position
+        shots.velocity[row] = velocity
+        shots.age[row] = 0
+        shots.active[row] = True
+        node = shots.nodes[row]
+        node.setPos(*shots.position[row].tolist())
+        node.show()
+        return row
+
+    def clear(self):
+        for row in np.flatnonzero(self.shots.active).tolist():
+            self.shots.nodes[row].hide()
+        self.shots.active[:] = False
+
+    def refresh(self):
+        """Show and place every node as its row says, after the rows were set from outside (rewinds)"""
+        shots = self.shots
+        for row, (active, (x, y, z)) in enumerate(zip(shots.active.tolist(), shots.position.tolist())):
+            node = shots.nodes[row]
+            if active:
+                node.setPos(x, y, z)
+                node.show()
+            else:
+                node.hide()
+
+    def update(self):
+        shots = self.shots
+        rows = np.flatnonzero(shots.active)
+        if not len(rows):
+            return
+        dt = time.dt
+        s = self.settings
+
+        start = shots.position[rows]
+        velocity = shots.velocity[rows]
+        velocity[:, 1] -= s['gravity'] * dt
+        motion = velocity * dt
+        age = shots.age[rows] + dt
+
+        # How much of each path the shot travels this frame, cut short by the first wall or the ground
+        reach = np.ones(len(rows), dtype=np.float32)
+        stopped = age > s['lifetime']
+
+        # Slab test of every path against every box at once: first entry time in [0, 1]
+        if len(self.box_min):
+            step = np.where(np.abs(motion) < 1e-9, 1e-9, motion)[:, None, :]
+            near = (self.box_min[None] - start[:, None, :]) / step
+            far = (self.box_max[None] - start[:, None, :]) / step
+            enter = np.minimum(near, far).max(axis=2)
+            leave = np.maximum(near, far).min(axis=2)
+            crossed = (leave >= np.maximum(enter, 0)) & (enter <= 1)
+            first = np.where(crossed, np.maximum(enter, 0), np.inf).min(axis=1)
+            blocked = np.isfinite(first)
+            reach[blocked] = first[blocked]
+            stopped |= blocked
+
+        if self.terrain:
+            # Sample the travelled path about once per terrain cell, so a fast shot can't cross a ridge
+            longest = float(np.sqrt(np.einsum('ij,ij->i', motion, motion).max()))
+            samples = max(1, math.ceil(longest / self.terrain.field.cell))
+            fractions = reach[:, None] * (np.arange(1, samples + 1, dtype=np.float32) / samples)
+            points = start[:, None, :] + motion[:, None, :] * fractions[..., None]
+            ground = self.terrain.heights_at(points[..., 0] + self.world_x, points[..., 2] + self.world_z) - self.world_y
+            below = points[..., 1] < ground
+            landed = below.any(axis=1)
+            reach[landed] = fractions[landed, below[landed].argmax(axis=1)]
+            stopped |= landed
+
+        end = start + motion * reach[:, None]
+
+        if self.target:
+            # Closest approach of each path, as far as it got, to the middle of the target
+            target = self.target.world_position - self.world_position
+            center = np.array((target.x, target.y + 1, target.z), dtype=np.float32)
+            t = np.clip(np.einsum('ij,ij->i', center - start, motion) / np.maximum(np.einsum('ij,ij->i', motion, motion), 1e-9), 0, reach)
+            closest = start + motion * t[:, None]
+            hit = np.einsum('ij,ij->i', closest - center, closest - center) < (self.hit_radius + s['radius']) ** 2
+            stopped |= hit
+            if hit.any() and self.on_hit:
+                for _ in range(int(hit.sum())):
+                    self.on_hit(self.kind)
+
+        shots.position[rows] = end
+        shots.velocity[rows] = velocity
+        shots.age[rows] = age
+
+        done = rows[stopped]
+        shots.active[done] = False
+        nodes = shots.nodes
+        for row in done.tolist():
+            nodes[row].hide()
+        for row, (x, y, z) in zip(rows[~stopped].tolist(), end[~stopped].tolist()):
+            nodes[row].setPos(x, y, z)
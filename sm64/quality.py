@@ -0,0 +1,200 @@
+"""
+Quality presets and dynamic resolution scaling
+
+Pick a preset with the SM64_QUALITY environment variable (low, medium or
+high) and call apply_quality() once the scene's lights exist. Presets with
+a frame rate target also get a DynamicResolution controller that renders
+the 3D scene into a scaled offscreen buffer.
+"""
+
+import os
+
+from panda3d.core import LightAttrib, SamplerState, Texture as PandaTexture, TexturePool
+from ursina import Entity, Texture, application, camera, destroy, scene, time
+
+
+PRESETS = {
+    'low': {
+        'draw_distance': 250,
+        'lighting': 'unlit',        # no lights at all, vertex colors only
+        'texture_filter': 'nearest',
+        'anisotropy': 0,
+        'shadows': False,
+        'bake_static': True,        # static geometry lit once into vertex colors
+        'clouds': False,            # plain gradient sky
+        'water_resolution': 24,     # animated water grid cells per side
+        'target_fps': 60,
+        'resolution_scale': (0.5, 1.0),
+    },
+    'medium': {
+        'draw_distance': 500,
+        'lighting': 'vertex',       # fixed-function per-vertex lighting
+        'texture_filter': 'linear',
+        'anisotropy': 2,
+        'shadows': False,
+        'bake_static': True,
+        'clouds': True,
+        'water_resolution': 48,
+        'target_fps': 60,
+        'resolution_scale': (0.7, 1.0),
+    },
+    'high': {
+        'draw_distance': 1000,
+        'lighting': 'pixel',        # generated per-pixel lighting shader
+        'texture_filter': 'mipmap',
+        'anisotropy': 8,
+        'shadows': True,
+        'bake_static': False,       # keep runtime lighting so the castle receives shadows
+        'clouds': True,
+        'water_resolution': 96,
+        'target_fps': None,         # always native resolution
+        'resolution_scale': (1.0, 1.0),
+    },
+}
+
+QUALITY = os.environ.get('SM64_QUALITY', 'high')
+
+FILTERS = {
+    'nearest': (SamplerState.FT_nearest, SamplerState.FT_nearest),
+    'linear': (SamplerState.FT_linear, SamplerState.FT_linear),
+    'mipmap': (SamplerState.FT_linear_mipmap_linear, SamplerState.FT_linear),
+}
+
+# Lights as they were before a preset turned them off
+_scene_lights = None
+# Only one resolution controller per window, shared across builds
+_dynamic_resolution = None
+
+
+def quality_preset(name=None):
+    """Settings of the named preset, or of the one picked by SM64_QUALITY"""
+    return PRESETS[name or QUALITY]
+
+
+def apply_quality(name=None, lights=()):
+    """Apply a preset to the running scene. Returns the DynamicResolution controller, if any."""
+    global _scene_lights, _dynamic_resolution
+    preset = quality_preset(name)
+
+    # Draw distance
+    camera.clip_plane_far = preset['draw_distance']
+
+    # Light model
+    attrib = scene.getAttrib(LightAttrib)
+    if attrib and not attrib.hasAllOff():
+        _scene_lights = attrib
+    scene.clearShader()
+    if preset['lighting'] == 'unlit':
+        scene.setLightOff(1)
+    else:
+        scene.clearLight()
+        if _scene_lights:
+            scene.setAttrib(_scene_lights)
+        if preset['lighting'] == 'pixel':
+            scene.setShaderAuto()
+
+    for light in lights:
+        if hasattr(light, 'shadows'):
+            light.shadows = preset['shadows']
+
+    # Texture filtering, for loaded textures and anything loaded later
+    minfilter, magfilter = FILTERS[preset['texture_filter']]
+    for texture in TexturePool.findAllTextures():
+        texture.setMinfilter(minfilter)
+        texture.setMagfilter(magfilter)
+        texture.setAnisotropicDegree(preset['anisotropy'])
+    Texture.default_filtering = {'nearest': None, 'linear': 'bilinear', 'mipmap': 'mipmap'}[preset['texture_filter']]
+
+    # Dynamic resolution
+    if not preset['target_fps']:
+        if _dynamic_resolution:
+            destroy(_dynamic_resolution)
+            _dynamic_resolution = None
+        return None
+
+    low, high = preset['resolution_scale']
+    if not _dynamic_resolution:
+        _dynamic_resolution = DynamicResolution()
+    _dynamic_resolution.configure(target_fps=preset['target_fps'], min_scale=low, max_scale=high)
+    return _dynamic_resolution
+
+
+class DynamicResolution(Entity):
+    """Renders the 3D scene into a scaled buffer and steers the scale toward a target frame time.
+
+    Frame time comes from the frame clock, which tracks GPU cost once the
+    game is GPU bound. With vsync on a frame can't report headroom, so after
+    a few on-target intervals the scale is probed upward and falls back if
+    that misses the target. The UI camera keeps native resolution.
+    """
+    def __init__(self, target_fps=60, min_scale=0.5, max_scale=1.0, step=0.05, interval=0.5, probe_after=6, **kwargs):
+        super().__init__(eternal=True, **kwargs)
+        from direct.filter.FilterManager import FilterManager
+
+        self.step = step
+        self.interval = interval
+        self.probe_after = probe_after
+        self.on_target = 0
+        self.timer = 0
+        self.configure(target_fps, min_scale, max_scale)
+
+        base = application.base
+        self.manager = FilterManager(base.win, base.cam)
+        self.texture = PandaTexture('dynamic-resolution')
+        self.texture.setMinfilter(SamplerState.FT_linear)
+        self.texture.setMagfilter(SamplerState.FT_linear)
+        self.quad = self.manager.renderSceneInto(colortex=self.texture)
+        self.quad.setColor(1, 1, 1, 1)     # FilterManager tints its quad pink by default
+        self.buffer = self.manager.buffers[0]
+        self.resize()
+        # FilterManager sizes its buffers to the window on every window event, which would
+        # undo the scale. Accepting the event again replaces its handler with ours.
+        self.manager.accept('window-event', self.window_event)
+
+    def configure(self, target_fps=60, min_scale=0.5, max_scale=1.0):
+        self.target = 1 / target_fps
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.scale_factor = max_scale
+        self.frame_time = self.target
+        if hasattr(self, 'buffer'):
+            self.resize()
+
+    def resize(self):
+        win = application.base.win
+        self.buffer.setSize(
+            max(1, int(win.getXSize() * self.scale_factor)),
+            max(1, int(win.getYSize() * self.scale_factor))
+        )
+
+    def window_event(self, win):
+        self.resize()
+
+    def update(self):
+        # The offscreen buffer does the clearing now, keep it on the window's background color
+        self.buffer.setClearColor(application.base.win.getClearColor())
+
+        # Smoothed frame time, adjusted a little at a time to avoid thrashing the buffer
+        self.frame_time += (time.dt - self.frame_time) * 0.1
+        self.timer += time.dt
+        if self.timer < self.interval:
+            return
+        self.timer = 0
+
+        scale = self.scale_factor
+        if self.frame_time > self.target * 1.05:
+            scale = max(self.min_scale, scale - self.step)
+            self.on_target = 0
+        else:
+            self.on_target += 1
+            if self.frame_time < self.target * 0.85 or self.on_target >= self.probe_after:
+                scale = min(self.max_scale, scale + self.step)
+                self.on_target = 0
+
+        if scale != self.scale_factor:
+            self.scale_factor = scale
+            self.resize()
+
+    def on_destroy(self):
+        self.manager.ignore('window-event')
+        self.manager.cleanup()
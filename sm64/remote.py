@@ -0,0 +1,86 @@
+"""
+Other players from a presence server, drawn in the scene
+
+AvatarPool builds its avatars once and hands them out to whichever remote
+players are in the same area as us, so players joining, leaving and
+switching courses never create or destroy entities. PresencePanel is the
+connection's debug readout: round trip, bandwidth and packet rates.
+"""
+
+from ursina import Entity, Text, Vec3, camera, color, time
+
+
+class Avatar(Entity):
+    """A remote Mario, told apart from ours by a green cap"""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.body = Entity(parent=self, model='cube', color=color.rgb(0, 92/255, 170/255), scale=(0.8, 1, 0.6), y=0.5)
+        self.head = Entity(parent=self, model='sphere', color=color.rgb(0, 160/255, 60/255), scale=0.7, y=1.35)
+
+
+class AvatarPool(Entity):
+    """Shows the client's remote players that are in area(), up to `capacity` at once"""
+    def __init__(self, client, area, capacity=32, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.area = area
+        self.avatars = [Avatar(parent=self, enabled=False) for _ in range(capacity)]
+        self.free = list(reversed(self.avatars))
+        self.assigned = {}      # player id -> Avatar
+
+    def release_all(self):
+        for avatar in self.assigned.values():
+            avatar.enabled = False
+            self.free.append(avatar)
+        self.assigned.clear()
+
+    def on_disable(self):
+        if hasattr(self, 'assigned'):
+            self.release_all()
+
+    def update(self):
+        area = self.area()
+        visible = {player: pose for player, pose in self.client.remote_players().items() if pose[0] == area}
+
+        for player in [player for player in self.assigned if player not in visible]:
+            avatar = self.assigned.pop(player)
+            avatar.enabled = False
+            self.free.append(avatar)
+
+        for player, (_, position, heading) in visible.items():
+            avatar = self.assigned.get(player)
+            if not avatar:
+                if not self.free:
+                    continue    # more players here than avatars
+                avatar = self.assigned[player] = self.free.pop()
+                avatar.enabled = True
+            avatar.world_position = Vec3(*position)
+            avatar.world_rotation_y = heading
+
+
+class PresencePanel(Text):
+    """Connection stats, refreshed a few times per second"""
+    def __init__(self, client, **kwargs):
+        super().__init__('', parent=camera.ui, position=(-0.85, 0.35), scale=0.8, color=color.white,
+                         background=True, ignore=False, **kwargs)     # Text skips update() by default
+        self.client = client
+        self.clock = 0.0
+
+    def update(self):
+        self.clock -= time.dt
+        if self.clock > 0:
+            return
+        self.clock = 0.25
+        client = self.client
+        if not client.connected:
+            self.text = f'presence: connecting to {client.host}:{client.port}'
+            return
+        rates = client.traffic.rates
+        rtt = f'{client.rtt * 1000:.1f} ms' if client.rtt is not None else '-'
+        self.text = '\n'.join((
+            f'presence: player {client.player}, {len(client.remote_players())} others',
+            f'round trip  {rtt}',
+            f'in   {rates["bytes_in"] / 1024:6.2f} KB/s  {rates["packets_in"]:5.1f} packets/s',
+            f'out  {rates["bytes_out"] / 1024:6.2f} KB/s  {rates["packets_out"]:5.1f} packets/s',
+            f'send {client.send_rate}/s, snapshots {client.snapshot_rate}/s',
+        ))
@@ -0,0 +1,172 @@
+"""
+Save files as small fixed-layout binary records
+
+Each slot is one file holding a single record: a header with the star
+count, then the fields every build shares. Menus only need the star count,
+so they read the header and nothing else.
+
+A SaveFile keeps its record in memory as bytes. Setting a field packs just
+that field into place and marks the record dirty only if the bytes really
+changed, so saving after every star pickup only touches the disk when
+something was won. Saves go through a temporary file and a rename, so a
+crash mid-save leaves the previous save intact.
+"""
+
+import os
+import struct
+import zlib
+
+from sm64 import ROOT
+
+
+SAVE_FOLDER = os.path.join(ROOT, 'saves')
+SLOTS = 3
+
+MAGIC = b'SM64'
+VERSION = 1
+IN_USE = 1
+
+# magic, version, flags, stars, crc32 of the body
+HEADER = struct.Struct('<4sBBHI')
+STARS = struct.Struct('<H')
+STARS_OFFSET = 6
+
+# Body fields in record order
+BODY = (
+    ('coins', '<I'),
+    ('lives', '<B'),
+    ('course_stars', '<8B'),    # a bit per star, a byte per course
+)
+
+DEFAULTS = {
+    'stars': 0,
+    'coins': 0,
+    'lives': 4,
+    'course_stars': (0,) * 8,
+}
+
+# name -> (offset, struct) for every field, the header's star count included
+FIELDS = {'stars': (STARS_OFFSET, STARS)}
+_offset = HEADER.size
+for _name, _format in BODY:
+    FIELDS[_name] = (_offset, struct.Struct(_format))
+    _offset += FIELDS[_name][1].size
+RECORD_SIZE = _offset
+
+
+def slot_path(slot, folder=SAVE_FOLDER):
+    return os.path.join(folder, f'file{slot}.sav')
+
+
+def read_stars(slot, folder=SAVE_FOLDER):
+    """Star count of a slot from its header alone, or None if the slot is empty"""
+    try:
+        with open(slot_path(slot, folder), 'rb') as f:
+            data = f.read(HEADER.size)
+    except OSError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    magic, version, flags, stars, _ = HEADER.unpack(data)
+    if magic != MAGIC or version != VERSION or not flags & IN_USE:
+        return None
+    return stars
+
+
+class SaveFile:
+    """One save slot.
+
+    Fields are read and written with save['coins'] and save['coins'] = 10.
+    courses names the course ids whose stars are tracked bit by bit, in the
+    order their bytes appear in the record.
+    """
+    def __init__(self, slot, courses=(), folder=SAVE_FOLDER):
+        self.slot = slot
+        self.courses = tuple(courses)
+        self.folder = folder
+        self.path = slot_path(slot, folder)
+        self.record = bytearray(RECORD_SIZE)
+        self.exists = False
+        self.dirty = False
+        self.load()
+
+    def __getitem__(self, name):
+        offset, layout = FIELDS[name]
+        values = layout.unpack_from(self.record, offset)
+        return values if len(values) > 1 else values[0]
+
+    def __setitem__(self, name, value):
+        offset, layout = FIELDS[name]
+        packed = layout.pack(*value) if isinstance(value, (tuple, list)) else layout.pack(value)
+        if self.record[offset:offset + layout.size] != packed:
+            self.record[offset:offset + layout.size] = packed
+            self.dirty = True
+
+    def reset(self):
+        """Fresh file contents in memory, written by the next save()"""
+        self.record[:] = bytes(RECORD_SIZE)
+        for name, value in DEFAULTS.items():
+            self[name] = value
+        self.dirty = True
+
+    def load(self):
+        """Read the slot from disk, returns False and starts fresh if it's empty or damaged"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read(RECORD_SIZE)
+        except OSError:
+            data = b''
+        if len(data) == RECORD_SIZE:
+            magic, version, flags, _, checksum = HEADER.unpack_from(data)
+            if magic == MAGIC and version == VERSION and flags & IN_USE and zlib.crc32(data[HEADER.size:]) == checksum:
+                self.record[:] = data
+                self.exists = True
+                self.dirty = False
+                return True
+        self.reset()
+        self.exists = False
+        self.dirty = False
+        return False
+
+    def save(self):
+        """Write the record if anything changed since the last save, returns whether it did"""
+        if not self.dirty and self.exists:
+            return False
+        stars = self['stars']
+        HEADER.pack_into(self.record, 0, MAGIC, VERSION, IN_USE, stars, zlib.crc32(self.record[HEADER.size:]))
+
+        os.makedirs(self.folder, exist_ok=True)
+        # Write then rename so a crash mid-save never leaves a broken file
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(self.record)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        self.exists = True
+        self.dirty = False
+        return True
+
+    def erase(self):
+        """Delete the slot from disk and start it fresh"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self.reset()
+        self.exists = False
+        self.dirty = False
+
+    def star_collected(self, course, index):
+        if course not in self.courses:
+            return False
+        return bool(self['course_stars'][self.courses.index(course)] >> index & 1)
+
+    def collect_star(self, course, index):
+        """Mark a course's star as won, returns False if it already was"""
+        if course not in self.courses or self.star_collected(course, index):
+            return False
+        masks = list(self['course_stars'])
+        masks[self.courses.index(course)] |= 1 << index
+        self['course_stars'] = masks
+        return True
@@ -0,0 +1,212 @@
+"""
+Full-screen gradient sky with scrolling clouds
+
+The sky is one screen-covering quad parented to the camera. Its shader
+rebuilds the view direction per pixel and draws it in the background bin
+without depth, so it sits at infinite depth behind everything and costs a
+single pass instead of a huge overdrawn sphere. Switching presets only
+changes shader inputs; no geometry is created after construction.
+"""
+
+from panda3d.core import OmniBoundingVolume
+from ursina import Entity, Shader, Vec4, application, camera, time
+
+from sm64.quality import quality_preset
+
+
+SKY_VERTEX = '''#version 140
+
+uniform mat4 p3d_ModelMatrix;
+uniform mat4 p3d_ProjectionMatrix;
+in vec4 p3d_Vertex;
+out vec3 view_dir;
+
+
+void main() {
+    // ursina's quad spans -0.5..0.5, stretch it over the whole screen on the far plane
+    vec2 ndc = p3d_Vertex.xy * 2.0;
+    gl_Position = vec4(ndc, 1.0, 1.0);
+
+    // Camera-space ray through this corner, then rotated into the world (y up)
+    vec3 local = vec3(ndc.x / abs(p3d_ProjectionMatrix[0][0]), ndc.y / abs(p3d_ProjectionMatrix[1][1]), 1.0);
+    view_dir = mat3(p3d_ModelMatrix) * local;
+}
+'''
+
+SKY_FRAGMENT = '''#version 140
+
+uniform float sky_time;
+uniform vec4 sky_top;
+uniform vec4 sky_horizon;
+uniform vec4 sky_bottom;
+uniform vec4 sky_cloud_color;   // rgb, opacity
+uniform vec4 sky_clouds;        // cover (0 = none), scale, wind x, wind z
+#ifdef CUBEMAP
+uniform samplerCube sky_cubemap;
+#endif
+in vec3 view_dir;
+out vec4 fragColor;
+
+
+float hash(vec2 p) {
+    return fract(sin(dot(p, vec2(127.1, 311.7))) * 43758.5453);
+}
+
+float noise(vec2 p) {
+    vec2 i = floor(p);
+    vec2 f = fract(p);
+    vec2 u = f * f * (3.0 - 2.0 * f);
+    return mix(mix(hash(i), hash(i + vec2(1.0, 0.0)), u.x),
+               mix(hash(i + vec2(0.0, 1.0)), hash(i + vec2(1.0, 1.0)), u.x), u.y);
+}
+
+float fbm(vec2 p) {
+    float value = 0.0;
+    float amplitude = 0.5;
+    for (int i = 0; i < 4; i++) {
+        value += noise(p) * amplitude;
+        p *= 2.03;
+        amplitude *= 0.5;
+    }
+    return value;
+}
+
+
+void main() {
+    vec3 dir = normalize(view_dir);
+    float h = dir.y;
+
+#ifdef CUBEMAP
+    // Cube maps are authored z-up
+    vec3 sky = texture(sky_cubemap, dir.xzy).rgb;
+#else
+    vec3 sky = h > 0.0
+        ? mix(sky_horizon.rgb, sky_top.rgb, pow(h, 0.6))
+        : mix(sky_horizon.rgb, sky_bottom.rgb, pow(-h, 0.4));
+#endif
+
+    if (sky_clouds.x > 0.0 && h > 0.0) {
+        // Project onto a flat cloud layer overhead, fading out toward the horizon
+        vec2 uv = dir.xz / (h + 0.1) * sky_clouds.y * 4.0 + sky_time * sky_clouds.zw;
+        float density = smoothstep(0.85 - sky_clouds.x, 1.15 - sky_clouds.x, fbm(uv));
+        sky = mix(sky, sky_cloud_color.rgb, density * sky_cloud_color.a * smoothstep(0.0, 0.2, h));
+    }
+
+    fragColor = vec4(sky, 1.0);
+}
+'''
+
+DEFAULT_INPUT = {
+    'sky_time': 0.0,
+    'sky_top': Vec4(0.3, 0.5, 0.9, 1),
+    'sky_horizon': Vec4(0.6, 0.75, 0.95, 1),
+    'sky_bottom': Vec4(0.5, 0.6, 0.75, 1),
+    'sky_cloud_color': Vec4(1, 1, 1, 0.8),
+    'sky_clouds': Vec4(0, 1, 0, 0),
+}
+
+gradient_sky_shader = Shader(name='gradient_sky_shader', language=Shader.GLSL,
+    vertex=SKY_VERTEX, fragment=SKY_FRAGMENT, default_input=DEFAULT_INPUT)
+cubemap_sky_shader = Shader(name='cubemap_sky_shader', language=Shader.GLSL,
+    vertex=SKY_VERTEX, fragment=SKY_FRAGMENT.replace('#version 140\n', '#version 140\n#define CUBEMAP\n'),
+    default_input=DEFAULT_INPUT)
+
+# Colors are normalized rgb; clouds = (cover, scale, wind x, wind z)
+SKY_PRESETS = {
+    'castle': {
+        'top': (0.30, 0.50, 0.92),
+        'horizon': (0.62, 0.78, 0.96),
+        'bottom': (0.50, 0.64, 0.80),
+        'cloud_color': (1.0, 1.0, 1.0, 0.85),
+        'clouds': (0.45, 1.2, 0.08, 0.04),
+    },
+    'menu': {
+        'top': (0.33, 0.55, 0.93),
+        'horizon': (0.55, 0.71, 0.94),
+        'bottom': (0.55, 0.71, 0.94),
+        'cloud_color': (1.0, 1.0, 1.0, 0.6),
+        'clouds': (0.35, 1.0, 0.04, 0.0),
+    },
+    'bob_omb': {
+        'top': (0.25, 0.48, 0.95),
+        'horizon': (0.70, 0.85, 1.00),
+        'bottom': (0.45, 0.65, 0.45),
+        'cloud_color': (1.0, 1.0, 1.0, 0.9),
+        'clouds': (0.5, 1.0, 0.12, 0.0),
+    },
+    'whomps': {
+        'top': (0.35, 0.55, 0.90),
+        'horizon': (0.85, 0.85, 0.80),
+        'bottom': (0.55, 0.55, 0.55),
+        'cloud_color': (1.0, 0.98, 0.92, 0.8),
+        'clouds': (0.4, 1.4, 0.08, 0.08),
+    },
+    'cool_cool': {
+        'top': (0.55, 0.68, 0.88),
+        'horizon': (0.92, 0.95, 1.00),
+        'bottom': (0.85, 0.90, 0.95),
+        'cloud_color': (0.95, 0.96, 1.0, 0.95),
+        'clouds': (0.6, 0.8, 0.16, 0.04),
+    },
+    'jolly_roger': {
+        'top': (0.15, 0.30, 0.60),
+        'horizon': (0.55, 0.70, 0.80),
+        'bottom': (0.05, 0.20, 0.35),
+        'cloud_color': (0.85, 0.88, 0.92, 0.6),
+        'clouds': (0.3, 1.6, 0.04, 0.12),
+    },
+    'bowser1': {
+        'top': (0.05, 0.00, 0.10),
+        'horizon': (0.45, 0.10, 0.15),
+        'bottom': (0.10, 0.00, 0.05),
+        'cloud_color': (0.30, 0.05, 0.10, 0.7),
+        'clouds': (0.5, 0.7, 0.2, 0.2),
+    },
+}
+
+
+class GradientSky(Entity):
+    """Screen-space sky. Call set_preset() to switch courses, the quad is reused."""
+    def __init__(self, preset='castle', **kwargs):
+        super().__init__(parent=camera, model='quad', **kwargs)
+        self.time = 0.0
+        self.preset = None
+        self.cubemap = None
+
+        # Drawn first and never depth tested or culled, so it covers the whole screen behind everything
+        self.setBin('background', 0)
+        self.setDepthWrite(False)
+        self.setDepthTest(False)
+        self.setLightOff(1)
+        self.node().setBounds(OmniBoundingVolume())
+        self.node().setFinal(True)
+
+        self.set_preset(preset)
+
+    def set_preset(self, name, **overrides):
+        """Apply a SKY_PRESETS entry, optionally overriding some of its values"""
+        settings = dict(SKY_PRESETS[name], **overrides)
+
+        if settings.get('cubemap'):
+            self.cubemap = application.base.loader.loadCubeMap(settings['cubemap'])    # cached by the texture pool
+            self.shader = cubemap_sky_shader
+            self.set_shader_input('sky_cubemap', self.cubemap)
+        else:
+            self.cubemap = None
+            self.shader = gradient_sky_shader
+
+        # Assigning a shader resets its inputs to the defaults, so the time is carried over
+        self.set_shader_input('sky_time', self.time)
+        self.set_shader_input('sky_top', Vec4(*settings['top'], 1))
+        self.set_shader_input('sky_horizon', Vec4(*settings['horizon'], 1))
+        self.set_shader_input('sky_bottom', Vec4(*settings['bottom'], 1))
+        self.set_shader_input('sky_cloud_color', Vec4(*settings['cloud_color']))
+        cover, scale, wind_x, wind_z = settings['clouds']
+        if not quality_preset()['clouds']:
+            cover = 0
+        self.set_shader_input('sky_clouds', Vec4(cover, scale, wind_x, wind_z))
+        self.preset = name
+
+    def update(self):
+        self.time += time.dt
+        self.set_shader_input('sky_time', self.time)
@@ -0,0 +1,128 @@
+"""
+Rewindable snapshots of the live game state
+
+A SnapshotRing captures the game a few times per second into a ring of
+records allocated once: every channel (Mario, game_state, the columns of
+a ComponentStore, ...) is one field of a numpy structured dtype, so a
+snapshot is a single fixed-size row and taking one only copies values
+into it. Rewinding steps back through the ring and writes a row back into
+the game; quicksaves are loose copies of a row that can be restored the
+same way.
+
+Channels are plain read/write callbacks, so the ring knows nothing about
+what it captures. Changing the channels (entering another course) starts
+a new ring.
+"""
+
+import numpy as np
+from ursina import Entity, time
+
+
+class SnapshotRing(Entity):
+    """The last `capacity` snapshots, taken `rate` times per second while enabled"""
+    def __init__(self, capacity=80, rate=8, **kwargs):
+        super().__init__(**kwargs)
+        self.capacity = capacity
+        self.interval = 1 / rate
+        self.clock = 0.0
+        self.reset()
+
+    def reset(self):
+        """Forget every channel and snapshot"""
+        self.channels = {}      # name -> (shape, dtype, read, write)
+        self.buffer = None
+        self.head = -1
+        self.size = 0
+
+    def add(self, name, read, write, shape, dtype=np.float32):
+        """Capture a channel of `shape` values.
+
+        read(out) fills the channel's slot of a record in place, write(values)
+        puts those values back into the game.
+        """
+        self.channels[name] = ((shape,) if isinstance(shape, int) else tuple(shape), np.dtype(dtype), read, write)
+        self.buffer = None
+        self.head = -1
+        self.size = 0
+
+    def add_store(self, name, store, after=None):
+        """Capture every column of a ComponentStore, and which rows are alive.
+
+        after() is called once the columns have been written back, to bring
+        the store's nodes in line.
+        """
+        def column_channel(column):
+            def read(out):
+                out[...] = store.columns[column]
+
+            def write(values):
+                store.columns[column][...] = values
+            return read, write
+
+        def read_alive(out):
+            out[...] = store.alive
+
+        def write_alive(values):
+            store.alive[...] = values
+            if after:
+                after()
+
+        for column, array in store.columns.items():
+            self.add(f'{name}.{column}', *column_channel(column), array.shape, array.dtype)
+        # Last, so after() sees every column restored
+        self.add(f'{name}.alive', read_alive, write_alive, store.alive.shape, bool)
+
+    @property
+    def dtype(self):
+        return np.dtype([(name, dtype, shape) for name, (shape, dtype, _, _) in self.channels.items()])
+
+    def _read(self, record):
+        for name, (_, _, read, _) in self.channels.items():
+            read(record[name])
+
+    def _write(self, record):
+        for name, (_, _, _, write) in self.channels.items():
+            write(record[name])
+
+    def capture(self):
+        """Take a snapshot into the next slot of the ring"""
+        if self.buffer is None:
+            self.buffer = np.zeros(self.capacity, dtype=self.dtype)
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self._read(self.buffer[self.head])
+
+    def rewind(self, steps=1):
+        """Go back `steps` snapshots, as far as the ring reaches, and return how many it went.
+
+        Later snapshots are dropped, so capturing carries on from the restored state.
+        """
+        steps = min(steps, self.size - 1)
+        if steps < 0:
+            return 0
+        self.head = (self.head - steps) % self.capacity
+        self.size -= steps
+        self._write(self.buffer[self.head])
+        self.clock = 0.0
+        return steps
+
+    def snapshot(self):
+        """A standalone copy of the current state, for quicksaves"""
+        record = np.zeros((), dtype=self.dtype)
+        self._read(record)
+        return record
+
+    def restore(self, record):
+        """Write a snapshot() back, it must have been taken with the same channels"""
+        if record.dtype != self.dtype:
+            raise ValueError('snapshot was taken with other channels')
+        self._write(record)
+        self.clock = 0.0
+
+    def update(self):
+        if not self.channels:
+            return
+        self.clock += time.dt
+        if self.clock >= self.interval:
+            self.clock %= self.interval
+            self.capture()
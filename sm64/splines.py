@@ -0,0 +1,189 @@
+"""
+Catmull-Rom tracks with arc-length tables
+
+A spline is evaluated once at load into a table of points spaced evenly
+by distance along the curve, with a tangent, right and up vector for each.
+Looking up a position from a distance is then an index and a lerp, no
+matter how long the track is, and movement in distance units gives the
+same speed everywhere on the curve.
+
+SlideTrack turns a spline into a trough mesh (built once per layout and
+reused) and carries a rider along it. The rider's position always comes
+from the table rather than from integrating velocity against colliders,
+so no speed can make it skip through a wall or off the track.
+"""
+
+import math
+
+import numpy as np
+from panda3d.core import Geom, GeomNode, GeomTriangles, GeomVertexData, GeomVertexFormat
+from ursina import Entity, held_keys, time
+
+
+class CatmullRom:
+    """Curve through `points`, tabulated every `step` units of length"""
+    def __init__(self, points, step=0.25, subdivisions=16):
+        points = np.asarray(points, dtype=np.float64)
+        self.key = (points.tobytes(), step, subdivisions)
+
+        # Mirror the end points so the curve starts and ends on them
+        padded = np.vstack([2 * points[0] - points[1], points, 2 * points[-1] - points[-2]])
+        t = np.linspace(0, 1, subdivisions, endpoint=False)[:, None]
+        t2, t3 = t * t, t * t * t
+        dense = []
+        for i in range(len(points) - 1):
+            p0, p1, p2, p3 = padded[i:i + 4]
+            dense.append(0.5 * (2 * p1 + (p2 - p0) * t + (2 * p0 - 5 * p1 + 4 * p2 - p3) * t2 + (3 * p1 - p0 - 3 * p2 + p3) * t3))
+        dense.append(points[-1:])
+        dense = np.concatenate(dense)
+
+        # Arc length along the dense samples, then resample at even distances
+        lengths = np.concatenate([[0], np.cumsum(np.linalg.norm(np.diff(dense, axis=0), axis=1))])
+        self.length = float(lengths[-1])
+        count = max(int(math.ceil(self.length / step)), 1) + 1
+        self.step = self.length / (count - 1)
+        distances = np.linspace(0, self.length, count)
+        self.positions = np.stack([np.interp(distances, lengths, dense[:, axis]) for axis in range(3)], axis=1)
+
+        tangents = np.gradient(self.positions, axis=0)
+        self.tangents = tangents / np.linalg.norm(tangents, axis=1, keepdims=True)
+        rights = np.stack([self.tangents[:, 2], np.zeros(count), -self.tangents[:, 0]], axis=1)
+        self.rights = rights / np.maximum(np.linalg.norm(rights, axis=1, keepdims=True), 1e-9)
+        self.ups = np.cross(self.tangents, self.rights)
+
+        # Plain lists for per-frame lookups, like HeightField.samples
+        self._positions = self.positions.tolist()
+        self._tangents = self.tangents.tolist()
+        self._rights = self.rights.tolist()
+
+    def _index(self, distance):
+        u = min(max(distance / self.step, 0.0), len(self._positions) - 1.001)
+        i = int(u)
+        return i, u - i
+
+    def point_at(self, distance):
+        """Position `distance` units along the curve, clamped to its ends"""
+        i, f = self._index(distance)
+        a, b = self._positions[i], self._positions[i + 1]
+        return (a[0] + (b[0] - a[0]) * f, a[1] + (b[1] - a[1]) * f, a[2] + (b[2] - a[2]) * f)
+
+    def tangent_at(self, distance):
+        """Unit direction of travel at `distance`"""
+        return tuple(self._tangents[self._index(distance)[0]])
+
+    def right_at(self, distance):
+        """Level unit vector to the right of the direction of travel"""
+        return tuple(self._rights[self._index(distance)[0]])
+
+
+_track_meshes = {}  # (spline key, width, wall height) -> GeomNode
+
+
+def _track_node(spline, width, wall_height):
+    """Trough along the spline: a flat floor and two sloped walls"""
+    key = (spline.key, width, wall_height)
+    if key in _track_meshes:
+        return _track_meshes[key]
+
+    # Cross section as (right, up) offsets, and the normal of each vertex
+    half = width / 2
+    profile = np.array([(-half - wall_height * 0.4, wall_height), (-half, 0), (half, 0), (half + wall_height * 0.4, wall_height)])
+    normals = np.array([(0.8, 0.6), (0.4, 0.9), (-0.4, 0.9), (-0.8, 0.6)])
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    count, sides = len(spline.positions), len(profile)
+
+    right, up = spline.rights[:, None, :], spline.ups[:, None, :]
+    vertices = spline.positions[:, None, :] + right * profile[None, :, 0, None] + up * profile[None, :, 1, None]
+    vertex_normals = right * normals[None, :, 0, None] + up * normals[None, :, 1, None]
+
+    vdata = GeomVertexData('slide', GeomVertexFormat.getV3n3(), Geom.UH_static)
+    vdata.uncleanSetNumRows(count * sides)
+    rows = np.frombuffer(memoryview(vdata.modifyArray(0)), dtype=np.float32).reshape(-1, 6)
+    rows[:, :3] = vertices.reshape(-1, 3)
+    rows[:, 3:] = vertex_normals.reshape(-1, 3)
+
+    corner = (np.arange(count - 1)[:, None] * sides + np.arange(sides - 1)[None, :]).ravel()
+    a, b = corner, corner + 1
+    c, d = corner + sides, corner + sides + 1
+    triangles = GeomTriangles(Geom.UH_static)
+    triangles.setIndexType(Geom.NT_uint32)
+    handle = triangles.modifyVertices()
+    handle.uncleanSetNumRows(len(corner) * 6)
+    np.frombuffer(memoryview(handle), dtype=np.uint32)[:] = np.stack([a, c, b, b, c, d], axis=1).ravel()
+
+    geom = Geom(vdata)
+    geom.addPrimitive(triangles)
+    node = GeomNode('slide')
+    node.addGeom(geom)
+    _track_meshes[key] = node
+    return node
+
+
+class SlideTrack(Entity):
+    """Slide along a spline in the entity's local space.
+
+    ride(entity) puts a rider at the start. Gravity along the slope speeds
+    it up, friction slows it down, and a/d steer between the walls. At the
+    end the rider is let go and on_finish(rider) is called.
+    """
+    def __init__(self, spline, width=4, wall_height=1, gravity=18, friction=0.12, min_speed=3, max_speed=35,
+                 on_finish=None, **kwargs):
+        super().__init__(**kwargs)
+        self.spline = spline
+        self.width = width
+        self.gravity = gravity
+        self.friction = friction
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.on_finish = on_finish
+        self.rider = None
+        self.distance = 0.0
+        self.speed = 0.0
+        self.offset = 0.0
+
+        self.track = self.attachNewNode(_track_node(spline, width, wall_height))
+        self.track.setTwoSided(True)
+        self.model = self.track
+
+    @property
+    def start(self):
+        return self.spline.point_at(0)
+
+    def ride(self, rider, speed=None):
+        self.rider = rider
+        self.distance = 0.0
+        self.speed = speed or self.min_speed
+        self.offset = 0.0
+
+    def release(self):
+        """Let go of the rider, if any, and return it"""
+        rider, self.rider = self.rider, None
+        return rider
+
+    def update(self):
+        rider = self.rider
+        if not rider:
+            return
+        spline = self.spline
+        dt = time.dt
+
+        # Downhill pulls, friction drags, speed stays in range
+        tangent = spline.tangent_at(self.distance)
+        self.speed += (-tangent[1] * self.gravity - self.speed * self.friction) * dt
+        self.speed = min(max(self.speed, self.min_speed), self.max_speed)
+        self.distance += self.speed * dt
+
+        limit = self.width / 2 - 0.5
+        self.offset += (held_keys['d'] - held_keys['a']) * 6 * dt
+        self.offset = min(max(self.offset, -limit), limit)
+
+        if self.distance >= spline.length:
+            self.release()
+            if self.on_finish:
+                self.on_finish(rider)
+            return
+
+        x, y, z = spline.point_at(self.distance)
+        rx, ry, rz = spline.right_at(self.distance)
+        rider.position = self.world_position + (x + rx * self.offset, y + 0.1, z + rz * self.offset)
+        rider.rotation_y = math.degrees(math.atan2(tangent[0], tangent[2]))
@@ -0,0 +1,116 @@
+"""
+Startup pipeline - phase timing and deferred scene construction
+
+Import this before ursina so the import itself can be timed. The menu is
+built up front; gameplay scene construction is handed to a DeferredLoader
+which builds it a slice per frame while the player is on the menu.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import time as pytime
+
+
+class StartupTimer:
+    """Records how long each startup phase took"""
+    CATEGORIES = ('import', 'window', 'assets', 'scene build')
+
+    def __init__(self):
+        self.start = pytime.perf_counter()
+        self.phases = []    # (category, label, seconds)
+        self.first_frame = None
+
+    @contextmanager
+    def phase(self, category, label=None):
+        t = pytime.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(category, label or category, pytime.perf_counter() - t)
+
+    def add(self, category, label, seconds):
+        self.phases.append((category, label, seconds))
+
+    def mark_first_frame(self):
+        if self.first_frame is None:
+            self.first_frame = pytime.perf_counter() - self.start
+
+    def totals(self):
+        totals = {category: 0.0 for category in self.CATEGORIES}
+        for category, label, seconds in self.phases:
+            totals[category] = totals.get(category, 0.0) + seconds
+        return totals
+
+    def report(self):
+        lines = ['Startup time:']
+        for category, seconds in self.totals().items():
+            lines.append(f'  {category:<12} {seconds * 1000:8.1f} ms')
+            for phase_category, label, phase_seconds in self.phases:
+                if phase_category == category and label != category:
+                    lines.append(f'    {label:<18} {phase_seconds * 1000:8.1f} ms')
+        if self.first_frame is not None:
+            lines.append(f'  {"first frame":<12} {self.first_frame * 1000:8.1f} ms after launch')
+        return '\n'.join(lines)
+
+
+class DeferredLoader:
+    """Runs scene-building generators a slice at a time, one frame budget per frame.
+
+    Each `yield 'label'` inside a build generator ends a slice; the time spent
+    in that slice is recorded on the timer under the given category.
+    """
+    def __init__(self, timer, budget=0.008):
+        self.timer = timer
+        self.budget = budget
+        self.jobs = deque()     # (category, generator)
+        self.on_done = []
+        self.ticker = None
+
+    @property
+    def done(self):
+        return not self.jobs
+
+    def add(self, build, category='scene build'):
+        self.jobs.append((category, build))
+        return self
+
+    def start(self):
+        from ursina import Entity
+        self.ticker = Entity(name='deferred_loader', update=self.tick, ignore_paused=True)
+
+    def step(self):
+        """Run one slice of the first pending job. Returns False once everything is built."""
+        if not self.jobs:
+            return False
+        category, build = self.jobs[0]
+        t = pytime.perf_counter()
+        try:
+            label = next(build)
+        except StopIteration:
+            self.jobs.popleft()
+            return bool(self.jobs) or self._finished()
+        self.timer.add(category, label, pytime.perf_counter() - t)
+        return True
+
+    def tick(self):
+        self.timer.mark_first_frame()
+        deadline = pytime.perf_counter() + self.budget
+        while self.step() and pytime.perf_counter() < deadline:
+            pass
+
+    def finish(self):
+        """Build everything that is left right now, e.g. when the player starts before loading is done"""
+        while self.step():
+            pass
+
+    def _finished(self):
+        if self.ticker:
+            from ursina import destroy
+            # Still inside the ticker's own update, so let it go next frame
+            self.ticker.enabled = False
+            destroy(self.ticker, delay=0.1)
+            self.ticker = None
+        for callback in self.on_done:
+            callback()
+        self.on_done.clear()
+        return False
@@ -0,0 +1,496 @@
+"""
+Stress scenes for scaling benchmarks
+
+StressScene builds the castle grounds or a course with n trees, coins,
+stars, crates and enemies each, laid out from a seed so every run at the
+same n is the same scene. The area grows with n and the density doesn't,
+so the camera sees about as much at 100 as at 100,000.
+
+What is being compared is how the scene is drawn and collided with:
+
+    render='entities'     an Entity per object and per part, like sm64.castle
+    render='instanced'    one model per kind instanced to a node per object,
+                          like EnemySwarm
+    render='flattened'    trees and crates merged into a few batched meshes,
+                          coins and stars spun on the GPU by a MotionClock
+
+    collision='colliders' box colliders the probe raycasts against, and a
+                          distance() check per pickup, like the builds did
+                          before component stores
+    collision='arrays'    crates as numpy box bounds and pickups in
+                          ComponentStores, each tested in one call
+
+Enemies are an EnemySwarm in every variant. A probe circles the scene at
+walking speed with the camera behind it, picking things up and chasing off
+enemies, so every strategy does the same work.
+
+    python -m sm64.stress                       # every strategy, 10 to 100,000
+    python -m sm64.stress --sizes 10 1000 --render instanced --layout course
+
+Each (strategy, n) point is measured in a fresh worker process, drawing
+into an offscreen buffer. A strategy stops growing once a point takes
+longer than --max-load to build or its frames longer than --max-frame,
+or before a size it would run out of memory at. The results go to
+PROFILE_FOLDER as a CSV file and an SVG chart of load time, frame time
+and memory against n.
+"""
+
+import argparse
+import csv
+import math
+import multiprocessing
+import os
+import sys
+import time as pytime
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from panda3d.core import NodePath
+from ursina import Entity, Vec3, application, camera, color, destroy, load_model, raycast, scene, time
+
+from sm64.components import ComponentStore
+from sm64.enemies import EnemySwarm
+from sm64.headless import boot
+from sm64.memory import node_arrays
+from sm64.motion import MotionClock
+from sm64.profiler import PROFILE_FOLDER
+from sm64.terrain import HeightField, Terrain, rolling_hills
+
+
+RENDERS = ('entities', 'instanced', 'flattened')
+COLLISIONS = ('colliders', 'arrays')
+LAYOUTS = ('grounds', 'course')
+SIZES = (10, 100, 1000, 10000, 100000)
+
+# (model, scale, offset, rgb) for each part of each kind of object
+KINDS = {
+    'tree': (('cube', (1, 5, 1), (0, 2.5, 0), (101/255, 67/255, 33/255)),
+             ('sphere', (5, 5, 5), (0, 6, 0), (34/255, 139/255, 34/255))),
+    'crate': (('cube', (2, 2, 2), (0, 1, 0), (0.6, 0.45, 0.25)),),
+    'coin': (('sphere', (0.8, 0.8, 0.15), (0, 1, 0), (1, 215/255, 0)),),
+    'star': (('sphere', (1, 1, 1), (0, 1.5, 0), (1, 1, 0.3)),),
+}
+PICKUPS = ('coin', 'star')
+SPACING = 6         # square units of ground per object of each kind is SPACING ** 2
+PICKUP_RADIUS = 1.5
+PROBE_SPEED = 8
+
+
+def template(kind):
+    """A NodePath with every part of kind, for instancing or copying"""
+    root = NodePath(kind)
+    for name, scale, offset, rgb in KINDS[kind]:
+        model = load_model(name, application.asset_folder) or load_model(name, application.internal_models_compressed_folder)
+        part = model.copyTo(root)
+        part.clearTransform()
+        part.clearColor()
+        part.setPos(*offset)
+        part.setScale(*scale)
+        part.setColorScale(*rgb, 1)
+    return root
+
+
+class StressScene(Entity):
+    """n of every kind of object over an area that grows with n"""
+    def __init__(self, n, layout='grounds', render='entities', collision='colliders', seed=0, **kwargs):
+        super().__init__(**kwargs)
+        self.n = n
+        self.layout = layout
+        self.render = render
+        self.collision = collision
+        self.size = max(20.0, SPACING * math.sqrt(n) / 2)      # half the side of the area
+        self.rng = np.random.default_rng(seed)
+        self.collected = 0
+        self.blocked_frames = 0
+        self.angle = 0.0
+        self.clock = 0.0
+
+        if layout == 'course':
+            field = HeightField.from_function(lambda x, z: rolling_hills(x, z, amplitude=3, seed=seed),
+                                              self.size * 2, self.size * 2, cell=2.0)
+            self.terrain = Terrain(field, parent=self)
+            self.ground = None
+        else:
+            self.terrain = None
+            self.ground = Entity(parent=self, model='plane', scale=self.size * 2, color=color.rgb(34/255, 177/255, 76/255),
+                                 collider='box' if collision == 'colliders' else None)
+            # The castle stays the same size whatever n is
+            Entity(parent=self, model='cube', scale=(20, 25, 18), position=(0, 12.5, 0), color=color.rgb(245/255, 245/255, 220/255))
+
+        self.positions = {kind: self._scatter(n) for kind in KINDS}
+        self.statics = Entity(parent=self)
+        if render == 'flattened':
+            self.motion = MotionClock(self)
+            for kind in ('tree', 'crate'):
+                self._flatten(kind)
+        else:
+            self.motion = None
+            for kind in ('tree', 'crate'):
+                self._place(kind, self.statics)
+        self.pickups = {kind: self._pickups(kind) for kind in PICKUPS}
+        self._crates()
+
+        self.enemies = EnemySwarm('goomba', n, area=self.size, terrain=self.terrain, seed=seed, parent=self)
+        self.probe = Entity(parent=self, model='cube', scale=(0.8, 1.6, 0.8), color=color.red)
+        self.enemies.target = self.probe
+
+    def _scatter(self, count):
+        xz = self.rng.uniform(-self.size, self.size, (count, 2)).astype(np.float32)
+        if self.terrain:
+            y = self.terrain.heights_at(xz[:, 0] + self.world_x, xz[:, 1] + self.world_z) - self.world_y
+        else:
+            y = np.zeros(count, dtype=np.float32)
+        return np.column_stack([xz[:, 0], y, xz[:, 1]]).astype(np.float32)
+
+    def _place(self, kind, parent):
+        """A node per object, returns them in the order of self.positions[kind]"""
+        positions = self.positions[kind].tolist()
+        if self.render == 'entities':
+            nodes = []
+            for position in positions:
+                node = Entity(parent=parent, position=position)
+                for model, scale, offset, rgb in KINDS[kind]:
+                    # Crates collide through their own entity, as the castle's walls do
+                    collider = 'box' if kind == 'crate' and self.collision == 'colliders' else None
+                    Entity(parent=node, model=model, scale=scale, position=offset, color=color.rgb(*rgb), collider=collider)
+                nodes.append(node)
+            return nodes
+        body = template(kind)
+        nodes = []
+        for i, (x, y, z) in enumerate(positions):
+            node = parent.attachNewNode(f'{kind}_{i}')
+            body.instanceTo(node)
+            node.setPos(x, y, z)
+            nodes.append(node)
+        return nodes
+
+    def _flatten(self, kind):
+        """Copies of kind merged into as few meshes as the vertex limits allow"""
+        body = template(kind)
+        batch = self.statics.attachNewNode(f'{kind}_batch')
+        for x, y, z in self.positions[kind].tolist():
+            copy = body.copyTo(batch)
+            copy.setPos(x, y, z)
+        batch.flattenStrong()
+
+    def _pickups(self, kind):
+        store = ComponentStore(capacity=max(self.n, 1), position=(np.float32, 3), collected=np.bool_)
+        if self.render == 'flattened':
+            # Spun by the shader, so nothing per pickup runs each frame. The parts' offsets and
+            # scales go into the shared vertices, so spinning the model turns the whole pickup
+            # about its y axis as _spin() does
+            body = template(kind)
+            body.flattenLight()
+            nodes = []
+            for position in self.positions[kind].tolist():
+                node = Entity(parent=self, position=position)
+                body.instanceTo(node)
+                self.motion.add(node, spin=100, spin_axis='y')
+                nodes.append(node)
+        else:
+            nodes = self._place(kind, self)
+        for node, position in zip(nodes, self.positions[kind]):
+            store.add(node, position=position)
+        return store
+
+    def _crates(self):
+        """Crate bounds, as colliders or as arrays"""
+        (_, scale, offset, _), = KINDS['crate']
+        half = np.array(scale, dtype=np.float32) / 2
+        center = self.positions['crate'] + np.array(offset, dtype=np.float32)
+        self.box_min = center - half
+        self.box_max = center + half
+        if self.collision == 'colliders' and self.render != 'entities':
+            for position in center.tolist():
+                Entity(parent=self.statics, position=position, scale=scale, collider='box')
+
+    def update(self):
+        # Walk the probe around a circle and keep the camera behind it
+        self.clock += time.dt
+        radius = self.size * 0.6
+        self.angle += PROBE_SPEED / radius * time.dt
+        x, z = math.cos(self.angle) * radius, math.sin(self.angle) * radius
+        y = self.terrain.height_at(x, z) - self.world_y if self.terrain else 0
+        self.probe.position = (x, y + 0.8, z)
+        # Heading along the circle, counterclockwise
+        self.probe.rotation_y = -math.degrees(self.angle)
+        camera.world_position = self.probe.world_position + Vec3(math.sin(self.angle) * 12, 6, -math.cos(self.angle) * 12)
+        camera.look_at(self.probe)
+
+        if self.collision == 'colliders':
+            self._collide_colliders()
+        else:
+            self._collide_arrays()
+        if self.render != 'flattened':
+            self._spin()
+
+    def _collide_colliders(self):
+        probe = self.probe
+        # The two rays a FirstPersonController casts each frame
+        raycast(probe.world_position, Vec3(0, -1, 0), distance=2, ignore=(probe,))
+        if raycast(probe.world_position, probe.forward, distance=1.5, ignore=(probe,)).hit:
+            self.blocked_frames += 1
+        position = probe.position
+        for kind in PICKUPS:
+            store = self.pickups[kind]
+            for row, node in enumerate(store.nodes):
+                if not store.collected[row] and (node.getPos(self) - position).length() < PICKUP_RADIUS:
+                    self._collect(store, row)
+
+    def _collide_arrays(self):
+        position = np.array(self.probe.position, dtype=np.float32)
+        # The forward ray as a slab test against every crate at once, like ProjectilePool's sweep
+        motion = np.array(self.probe.forward, dtype=np.float32) * 1.5
+        step = np.where(np.abs(motion) < 1e-9, 1e-9, motion)
+        near = (self.box_min - position) / step
+        far = (self.box_max - position) / step
+        enter = np.minimum(near, far).max(axis=1)
+        leave = np.maximum(near, far).min(axis=1)
+        if ((leave >= np.maximum(enter, 0)) & (enter <= 1)).any():
+            self.blocked_frames += 1
+        for kind in PICKUPS:
+            store = self.pickups[kind]
+            for row in store.within(position, PICKUP_RADIUS, ~store.collected).tolist():
+                self._collect(store, row)
+
+    def _collect(self, store, row):
+        store.collected[row] = True
+        store.nodes[row].hide()
+        self.collected += 1
+
+    def _spin(self):
+        # The same spin CastleGrounds gives its coins, visible rows only
+        heading = self.clock * 100 % 360
+        for kind in PICKUPS:
+            store = self.pickups[kind]
+            for row in store.rows(~store.collected).tolist():
+                store.nodes[row].setH(heading)
+
+
+def _rss_peak():
+    """Peak resident memory of this process in bytes, or None where it can't be read"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure(n, layout='grounds', render='entities', collision='colliders', seed=0, frames=120, warmup=10):
+    """Build one stress scene in this process and time it, returns a result row"""
+    app = boot(render=True)
+    t = pytime.perf_counter()
+    stress = StressScene(n, layout, render, collision, seed)
+    app.step()      # the first frame prepares everything for drawing
+    load = pytime.perf_counter() - t
+
+    for _ in range(warmup):
+        app.step()
+    times = []
+    for _ in range(frames):
+        t = pytime.perf_counter()
+        app.step()
+        times.append(pytime.perf_counter() - t)
+    times = np.array(times) * 1000
+
+    # Buffers shared by instances count once
+    gpu = sum(node_arrays(stress).values())
+    peak = _rss_peak()
+    row = {
+        'layout': layout, 'render': render, 'collision': collision, 'n': n,
+        'load_s': round(load, 4),
+        'frame_ms': round(float(times.mean()), 3),
+        'frame_p95_ms': round(float(np.percentile(times, 95)), 3),
+        'frame_max_ms': round(float(times.max()), 3),
+        'rss_mb': round(peak / 2**20, 1) if peak else None,
+        'gpu_mb': round(gpu / 2**20, 2),
+        'entities': sum(entity.has_ancestor(stress) for entity in scene.entities),
+        'collected': stress.collected,
+        'blocked_frames': stress.blocked_frames,
+    }
+    destroy(stress)
+    return row
+
+
+def _measure_safely(*args, **kwargs):
+    try:
+        return measure(*args, **kwargs)
+    except Exception:
+        return {'error': traceback.format_exc(limit=3)}
+
+
+def _start_worker():
+    sys.stdout = open(os.devnull, 'w')
+
+
+def _physical_mb():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 2**20
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def sweep(sizes=SIZES, layout='grounds', renders=RENDERS, collisions=COLLISIONS, seed=0, frames=120,
+          max_load=60.0, max_frame=1000.0, max_rss=None, workers=None, log=print):
+    """measure() every strategy at every size, each in its own process, returns the rows.
+
+    Strategies run side by side, each one's sizes in order. A strategy stops
+    at the first size that took longer than max_load seconds to build or
+    max_frame milliseconds per frame, or before a size its last two points
+    say would need more than max_rss MB (default: physical memory split
+    between the workers).
+    """
+    workers = workers or os.cpu_count()
+    if max_rss is None and _physical_mb():
+        max_rss = 0.9 * _physical_mb() / workers
+    strategies = [(render, collision) for render in renders for collision in collisions]
+    queues = {strategy: sorted(sizes) for strategy in strategies}
+    last = {}       # strategy -> its latest (n, rss_mb)
+    rows = []
+    context = multiprocessing.get_context('spawn')
+
+    def stop(strategy, n, rss):
+        """Whether the strategy's next size would go over max_rss, growing as it did since its last point"""
+        previous, last[strategy] = last.get(strategy), (n, rss)
+        if not (max_rss and rss and previous and previous[1] and queues.get(strategy)):
+            return False
+        following = queues[strategy][0]
+        projected = rss + (rss - previous[1]) / (n - previous[0]) * (following - n)
+        if projected > max_rss:
+            log(f"{strategy[0]}/{strategy[1]} n={following} skipped, it would need about {projected:,.0f} MB")
+            return True
+        return False
+
+    while queues:
+        # One process per point, so a point's peak memory is its own. A worker the system kills
+        # breaks the whole pool, so its strategy is dropped and the rest go on in a new pool.
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_start_worker,
+                                 max_tasks_per_child=1) as pool:
+            running = {}    # future -> (strategy, n)
+            broken = False
+            while (queues or running) and not broken:
+                busy = {strategy for strategy, _ in running.values()}
+                for strategy in [strategy for strategy in queues if strategy not in busy]:
+                    n = queues[strategy].pop(0)
+                    if not queues[strategy]:
+                        del queues[strategy]
+                    running[pool.submit(_measure_safely, n, layout, *strategy, seed=seed, frames=frames)] = (strategy, n)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    (render, collision), n = running.pop(future)
+                    try:
+                        row = future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        row = {'error': 'the worker was killed, most likely out of memory'}
+                    if 'error' in row:
+                        log(f"{render}/{collision} n={n} failed:\n{row['error']}")
+                        queues.pop((render, collision), None)
+                        continue
+                    rows.append(row)
+                    log(f"{render:>9}/{collision:<9} n={n:<7} load {row['load_s']:7.2f} s  "
+                        f"frame {row['frame_ms']:7.2f} ms  rss {row['rss_mb']} MB  gpu {row['gpu_mb']} MB")
+                    if (row['load_s'] > max_load or row['frame_ms'] > max_frame
+                            or stop((render, collision), n, row['rss_mb'])):
+                        queues.pop((render, collision), None)
+            # The points still running when the pool broke go back to their queues
+            for strategy, n in running.values():
+                queues.setdefault(strategy, []).insert(0, n)
+    return sorted(rows, key=lambda row: (row['render'], row['collision'], row['n']))
+
+
+def write_csv(rows, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# (column, title) of each chart, all against n
+CHARTS = (('load_s', 'load time (s)'), ('frame_ms', 'frame time (ms)'), ('rss_mb', 'peak memory (MB)'))
+PALETTE = ('#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f')
+
+
+def plot_svg(rows, path, title='stress'):
+    """Log-log charts of every CHARTS column against n, a line per strategy, as an SVG file"""
+    strategies = sorted({(row['render'], row['collision']) for row in rows})
+    width, height, pad, top = 360, 280, 50, 45
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width * len(CHARTS)}" height="{height + 40 + 18 * len(strategies)}" '
+             f'font-family="sans-serif" font-size="11">',
+             f'<text x="10" y="16" font-size="14">{title}</text>']
+    ns = [row['n'] for row in rows]
+    x_low, x_high = math.log10(min(ns)), math.log10(max(ns))
+
+    for chart, (column, label) in enumerate(CHARTS):
+        values = [row[column] for row in rows if row[column]]
+        if not values:
+            continue
+        y_low, y_high = math.floor(math.log10(min(values))), math.ceil(math.log10(max(values)))
+        y_high = max(y_high, y_low + 1)
+        left = chart * width + pad
+        plot_w, plot_h = width - pad - 15, height - top - 25
+
+        def to_x(n):
+            return left + (math.log10(n) - x_low) / max(x_high - x_low, 1e-9) * plot_w
+
+        def to_y(value):
+            return top + plot_h - (math.log10(value) - y_low) / (y_high - y_low) * plot_h
+
+        parts.append(f'<text x="{left}" y="{top - 8}" font-weight="bold">{label}</text>')
+        parts.append(f'<rect x="{left}" y="{top}" width="{plot_w}" height="{plot_h}" fill="none" stroke="#999"/>')
+        for decade in range(y_low, y_high + 1):
+            y = to_y(10 ** decade)
+            parts.append(f'<line x1="{left}" x2="{left + plot_w}" y1="{y:.1f}" y2="{y:.1f}" stroke="#eee"/>')
+            parts.append(f'<text x="{left - 5}" y="{y + 4:.1f}" text-anchor="end">{10 ** decade:g}</text>')
+        for n in sorted(set(ns)):
+            parts.append(f'<text x="{to_x(n):.1f}" y="{top + plot_h + 15}" text-anchor="middle">{n:,}</text>')
+        for strategy, colour in zip(strategies, PALETTE):
+            points = [(row['n'], row[column]) for row in rows
+                      if (row['render'], row['collision']) == strategy and row[column]]
+            if points:
+                path_points = ' '.join(f'{to_x(n):.1f},{to_y(value):.1f}' for n, value in points)
+                parts.append(f'<polyline points="{path_points}" fill="none" stroke="{colour}" stroke-width="2"/>')
+                parts.extend(f'<circle cx="{to_x(n):.1f}" cy="{to_y(value):.1f}" r="2.5" fill="{colour}"/>' for n, value in points)
+
+    for i, ((render, collision), colour) in enumerate(zip(strategies, PALETTE)):
+        y = height + 20 + 18 * i
+        parts.append(f'<line x1="{pad}" x2="{pad + 20}" y1="{y}" y2="{y}" stroke="{colour}" stroke-width="3"/>')
+        parts.append(f'<text x="{pad + 26}" y="{y + 4}">{render} / {collision}</text>')
+    parts.append('</svg>')
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(parts) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure how load time, frame time and memory scale with scene size')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--layout', choices=LAYOUTS, default='grounds')
+    parser.add_argument('--render', choices=RENDERS, nargs='+', default=RENDERS)
+    parser.add_argument('--collision', choices=COLLISIONS, nargs='+', default=COLLISIONS)
+    parser.add_argument('--frames', type=int, default=120)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-load', type=float, default=60.0, help='stop growing a strategy after a load this slow (s)')
+    parser.add_argument('--max-frame', type=float, default=1000.0, help='or after frames this slow (ms)')
+    parser.add_argument('--max-rss', type=float, help='or before a size that would need more memory than this (MB)')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    rows = sweep(args.sizes, args.layout, args.render, args.collision, args.seed, args.frames,
+                 args.max_load, args.max_frame, args.max_rss, args.workers)
+    if not rows:
+        return 1
+    name = os.path.join(PROFILE_FOLDER, f"stress-{args.layout}-{pytime.strftime('%Y%m%d-%H%M%S')}")
+    write_csv(rows, name + '.csv')
+    plot_svg(rows, name + '.svg', f'{args.layout}, seed {args.seed}, {args.frames} frames per point')
+    print(f"Results written to {name}.csv and {name}.svg")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""
+Heightfield terrain with chunk streaming
+
+A HeightField holds the whole course as a grid of heights, so ground
+queries are a bilinear lookup of four samples no matter how large the map
+is. Terrain cuts it into square chunks and only keeps meshes for the ones
+near the camera, building a few per frame as the camera moves and keeping
+recently dropped chunks around in case they come back into range.
+"""
+
+from collections import OrderedDict
+import math
+
+import numpy as np
+from panda3d.core import Geom, GeomNode, GeomTriangles, GeomVertexData, GeomVertexFormat
+from ursina import Entity, camera
+
+from sm64.bake import light_vertices
+
+
+class HeightField:
+    """Heights sampled every `cell` units, starting at local (x0, z0)"""
+    def __init__(self, heights, cell=1.0, x0=0.0, z0=0.0):
+        self.heights = np.asarray(heights, dtype=np.float32)
+        self.rows, self.columns = self.heights.shape
+        # Plain lists index several times faster than numpy for single samples
+        self.samples = self.heights.tolist()
+        self.cell = cell
+        self.x0 = x0
+        self.z0 = z0
+
+        # Normals from central differences, for meshes and slope queries
+        dz, dx = np.gradient(self.heights, cell)
+        normals = np.stack([-dx, np.ones_like(dx), -dz], axis=-1)
+        self.normals = normals / np.linalg.norm(normals, axis=-1, keepdims=True)
+
+    @classmethod
+    def from_function(cls, function, width, depth, cell=1.0):
+        """Sample function(x, z) -> heights over a width x depth area centered on the origin.
+
+        The function gets numpy arrays and should be vectorized.
+        """
+        columns = int(round(width / cell)) + 1
+        rows = int(round(depth / cell)) + 1
+        x0, z0 = -width / 2, -depth / 2
+        x, z = np.meshgrid(x0 + np.arange(columns) * cell, z0 + np.arange(rows) * cell)
+        return cls(function(x, z), cell, x0, z0)
+
+    @property
+    def width(self):
+        return (self.columns - 1) * self.cell
+
+    @property
+    def depth(self):
+        return (self.rows - 1) * self.cell
+
+    def height_at(self, x, z):
+        """Bilinear height at a local point, clamped to the edge outside the field"""
+        u = min(max((x - self.x0) / self.cell, 0.0), self.columns - 1.001)
+        v = min(max((z - self.z0) / self.cell, 0.0), self.rows - 1.001)
+        i, j = int(u), int(v)
+        fu, fv = u - i, v - j
+        row, next_row = self.samples[j], self.samples[j + 1]
+        top = row[i] + (row[i + 1] - row[i]) * fu
+        bottom = next_row[i] + (next_row[i + 1] - next_row[i]) * fu
+        return top + (bottom - top) * fv
+
+    def heights_at(self, x, z):
+        """height_at for numpy arrays of points, for moving many objects at once"""
+        u = np.clip((np.asarray(x) - self.x0) / self.cell, 0.0, self.columns - 1.001)
+        v = np.clip((np.asarray(z) - self.z0) / self.cell, 0.0, self.rows - 1.001)
+        i, j = u.astype(np.int32), v.astype(np.int32)
+        fu, fv = u - i, v - j
+        h = self.heights
+        top = h[j, i] + (h[j, i + 1] - h[j, i]) * fu
+        bottom = h[j + 1, i] + (h[j + 1, i + 1] - h[j + 1, i]) * fu
+        return top + (bottom - top) * fv
+
+    def normal_at(self, x, z):
+        """Normal of the nearest sample"""
+        i = min(max(int(round((x - self.x0) / self.cell)), 0), self.columns - 1)
+        j = min(max(int(round((z - self.z0) / self.cell)), 0), self.rows - 1)
+        return tuple(float(n) for n in self.normals[j, i])
+
+
+def mountain(x, z, center=(0, 0), height=20, radius=15):
+    """Smooth round peak, vectorized"""
+    d = np.hypot(x - center[0], z - center[1]) / radius
+    return height * np.exp(-d * d * 2)
+
+
+def rolling_hills(x, z, amplitude=1.5, wavelength=25, seed=0):
+    """A few crossed sine waves, enough to break up flat ground"""
+    rng = np.random.default_rng(seed)
+    result = np.zeros_like(x, dtype=np.float32)
+    for octave in range(3):
+        angle = rng.uniform(0, math.tau)
+        phase = rng.uniform(0, math.tau)
+        k = math.tau / (wavelength / 2 ** octave)
+        result += amplitude / 2 ** octave * np.sin((x * math.cos(angle) + z * math.sin(angle)) * k + phase)
+    return result
+
+
+class Terrain(Entity):
+    """Streams chunk meshes of a HeightField around the camera.
+
+    bands is a list of (max height, rgb) from low to high; slopes steeper
+    than cliff_slope use cliff_color. Shading from sun_direction is baked
+    into the vertex colors, so the terrain needs no lights.
+    """
+    def __init__(self, field, chunk_cells=16, view_distance=60, builds_per_frame=2, cache_size=32,
+                 bands=((1e9, (0.3, 0.7, 0.3)),), cliff_color=(0.5, 0.4, 0.3), cliff_slope=0.6,
+                 sun_direction=(1, -1, -1), ambient=(0.55, 0.55, 0.55), **kwargs):
+        super().__init__(**kwargs)
+        self.field = field
+        self.chunk_cells = chunk_cells
+        self.view_distance = view_distance
+        self.builds_per_frame = builds_per_frame
+        self.cache_size = cache_size
+        self.chunks = {}                # (cx, cz) -> NodePath, currently shown
+        self.cache = OrderedDict()      # (cx, cz) -> NodePath, recently hidden
+        self.center = None
+        self.missing = []               # chunks in range that aren't shown yet, nearest first
+
+        self.chunk_columns = math.ceil((field.columns - 1) / chunk_cells)
+        self.chunk_rows = math.ceil((field.rows - 1) / chunk_cells)
+
+        # Colors for the whole field at once: height bands, cliffs on steep slopes, then baked shading
+        colors = np.empty(field.heights.shape + (3,), dtype=np.float32)
+        colors[:] = bands[-1][1]
+        for top, rgb in reversed(bands):
+            colors[field.heights <= top] = rgb
+        colors[field.normals[..., 1] < cliff_slope] = cliff_color
+        shade = light_vertices(field.normals.reshape(-1, 3), sun_direction, (1, 1, 1), ambient)
+        self.colors = np.clip(colors * shade.reshape(colors.shape), 0, 1)
+
+    def height_at(self, x, z):
+        """Ground height under a world-space point"""
+        return self.field.height_at(x - self.world_x, z - self.world_z) + self.world_y
+
+    def heights_at(self, x, z):
+        """Ground heights under arrays of world-space points"""
+        return self.field.heights_at(x - self.world_x, z - self.world_z) + self.world_y
+
+    def normal_at(self, x, z):
+        return self.field.normal_at(x - self.world_x, z - self.world_z)
+
+    def _build_chunk(self, cx, cz):
+        field = self.field
+        i0, j0 = cx * self.chunk_cells, cz * self.chunk_cells
+        i1 = min(i0 + self.chunk_cells, field.columns - 1)
+        j1 = min(j0 + self.chunk_cells, field.rows - 1)
+        columns, rows = i1 - i0, j1 - j0
+
+        heights = field.heights[j0:j1 + 1, i0:i1 + 1]
+        x, z = np.meshgrid(field.x0 + np.arange(i0, i1 + 1) * field.cell, field.z0 + np.arange(j0, j1 + 1) * field.cell)
+
+        vdata = GeomVertexData('terrain', GeomVertexFormat.getV3n3c4(), Geom.UH_static)
+        vdata.uncleanSetNumRows(heights.size)
+        rows_view = np.frombuffer(memoryview(vdata.modifyArray(0)), dtype=np.dtype([
+            ('vertex', np.float32, 3), ('normal', np.float32, 3), ('color', np.uint8, 4)]))
+        rows_view['vertex'] = np.stack([x.ravel(), heights.ravel(), z.ravel()], axis=1)
+        rows_view['normal'] = field.normals[j0:j1 + 1, i0:i1 + 1].reshape(-1, 3)
+        rgb = (self.colors[j0:j1 + 1, i0:i1 + 1].reshape(-1, 3) * 255).astype(np.uint8)
+        rows_view['color'] = np.concatenate([rgb, np.full((len(rgb), 1), 255, np.uint8)], axis=1)
+
+        corner = (np.arange(rows)[:, None] * (columns + 1) + np.arange(columns)[None, :]).ravel()
+        a, b = corner, corner + 1
+        c, d = corner + columns + 1, corner + columns + 2
+        triangles = GeomTriangles(Geom.UH_static)
+        triangles.setIndexType(Geom.NT_uint32)
+        handle = triangles.modifyVertices()
+        handle.uncleanSetNumRows(columns * rows * 6)
+        np.frombuffer(memoryview(handle), dtype=np.uint32)[:] = np.stack([a, b, c, b, d, c], axis=1).ravel()
+
+        geom = Geom(vdata)
+        geom.addPrimitive(triangles)
+        node = GeomNode(f'chunk_{cx}_{cz}')
+        node.addGeom(geom)
+        return self.attachNewNode(node)
+
+    def _wanted(self, center_x, center_z):
+        """Chunks within view distance, nearest first"""
+        size = self.chunk_cells * self.field.cell
+        reach = math.ceil(self.view_distance / size)
+        wanted = []
+        for cz in range(max(0, center_z - reach), min(self.chunk_rows, center_z + reach + 1)):
+            for cx in range(max(0, center_x - reach), min(self.chunk_columns, center_x + reach + 1)):
+                wanted.append(((cx - center_x) ** 2 + (cz - center_z) ** 2, (cx, cz)))
+        wanted.sort()
+        return [key for distance, key in wanted if distance <= (reach + 0.5) ** 2]
+
+    def update(self):
+        size = self.chunk_cells * self.field.cell
+        position = camera.world_position
+        center = (int((position.x - self.world_x - self.field.x0) // size),
+                  int((position.z - self.world_z - self.field.z0) // size))
+
+        if center != self.center:
+            first = self.center is None
+            self.center = center
+            wanted = self._wanted(*center)
+            keep = set(wanted)
+            for key in [key for key in self.chunks if key not in keep]:
+                node = self.chunks.pop(key)
+                node.detachNode()
+                self.cache[key] = node
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)[1].removeNode()
+            self.missing = [key for key in wanted if key not in self.chunks]
+            # Fill the whole view at once the first time so the course never pops in
+            if first:
+                self.stream(len(self.missing))
+
+        if self.missing:
+            self.stream(self.builds_per_frame)
+
+    def stream(self, budget):
+        """Show up to `budget` missing chunks, nearest first. Cached chunks don't count against it."""
+        while self.missing and budget > 0:
+            key = self.missing.pop(0)
+            if key in self.cache:
+                node = self.cache.pop(key)
+                node.reparentTo(self)
+            else:
+                node = self._build_chunk(*key)
+                budget -= 1
+            self.chunks[key] = node
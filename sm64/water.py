@@ -0,0 +1,146 @@
+"""
+Animated water surface from summed sine waves
+
+The surface is a square grid whose heights and normals are evaluated with
+NumPy for every vertex at once and copied straight into the vertex buffer.
+An optional ring of coarse, flat tiles extends the water out to a larger
+extent; the waves fade to zero at the edge of the animated grid so the two
+meet without cracks. Per-frame cost depends only on the grid resolution.
+"""
+
+import math
+
+import numpy as np
+from panda3d.core import Geom, GeomNode, GeomTriangles, GeomVertexData, GeomVertexFormat, NodePath
+from ursina import Entity, time
+
+from sm64.quality import quality_preset
+
+
+# (amplitude, wavelength, speed, direction in degrees)
+CALM_WAVES = (
+    (0.02, 8.0, 1.0, 20),
+    (0.014, 5.0, 0.8, 110),
+    (0.01, 3.0, 0.6, 250),
+)
+
+OCEAN_WAVES = (
+    (0.25, 22.0, 3.0, 10),
+    (0.15, 11.0, 2.2, 60),
+    (0.08, 6.0, 1.6, 300),
+    (0.04, 3.0, 1.1, 200),
+)
+
+
+def _grid(x0, x1, z0, z1, columns, rows):
+    """Vertex xz positions and triangle indices of a columns x rows cell grid"""
+    xs = np.linspace(x0, x1, columns + 1, dtype=np.float32)
+    zs = np.linspace(z0, z1, rows + 1, dtype=np.float32)
+    x, z = np.meshgrid(xs, zs)
+    xz = np.stack([x.ravel(), z.ravel()], axis=1)
+
+    corner = (np.arange(rows)[:, None] * (columns + 1) + np.arange(columns)[None, :]).ravel()
+    a, b = corner, corner + 1
+    c, d = corner + columns + 1, corner + columns + 2
+    indices = np.stack([a, b, c, b, d, c], axis=1).astype(np.uint32).ravel()
+    return xz, indices
+
+
+def _geom_node(name, xz, indices, usage):
+    """GeomNode with a v3n3 vertex buffer filled from numpy, flat and facing up"""
+    vdata = GeomVertexData(name, GeomVertexFormat.getV3n3(), usage)
+    vdata.uncleanSetNumRows(len(xz))
+    rows = np.frombuffer(memoryview(vdata.modifyArray(0)), dtype=np.float32).reshape(-1, 6)
+    rows[:, 0] = xz[:, 0]
+    rows[:, 1] = 0
+    rows[:, 2] = xz[:, 1]
+    rows[:, 3:6] = (0, 1, 0)
+
+    triangles = GeomTriangles(Geom.UH_static)
+    triangles.setIndexType(Geom.NT_uint32)
+    handle = triangles.modifyVertices()
+    handle.uncleanSetNumRows(len(indices))
+    np.frombuffer(memoryview(handle), dtype=np.uint32)[:] = indices
+
+    geom = Geom(vdata)
+    geom.addPrimitive(triangles)
+    node = GeomNode(name)
+    node.addGeom(geom)
+    return node
+
+
+class WaterSurface(Entity):
+    """Square water patch of `size` with `resolution` cells per side.
+
+    ring_size adds flat coarse tiles around the patch out to that width,
+    with cells of about ring_cell units. The surface lies in the entity's
+    local xz plane, centered on its position.
+    """
+    def __init__(self, size=60, resolution=None, waves=CALM_WAVES, ring_size=0, ring_cell=10, edge_fade=0.15, **kwargs):
+        super().__init__(**kwargs)
+        self.size = size
+        self.resolution = resolution or quality_preset()['water_resolution']
+        self.time = 0.0
+
+        half = size / 2
+        xz, indices = _grid(-half, half, -half, half, self.resolution, self.resolution)
+        self.surface = NodePath(_geom_node('water', xz, indices, Geom.UH_dynamic))
+        self.surface.reparentTo(self)
+        self.vdata = self.surface.node().modifyGeom(0).modifyVertexData()
+
+        if ring_size > size:
+            self.ring = self.surface.attachNewNode(self._ring_node(half, ring_size / 2, ring_cell))
+        else:
+            self.ring = None
+
+        # Everything that only depends on the grid and the wave set is computed once
+        amplitude, wavelength, speed, degrees = (np.array(column, dtype=np.float32) for column in zip(*waves))
+        k = 2 * math.pi / wavelength
+        direction = np.stack([np.cos(np.radians(degrees)), np.sin(np.radians(degrees))], axis=1)
+        self.phase = (xz @ direction.T) * k                     # (vertices, waves)
+        self.omega = (speed * k).astype(np.float32)
+        self.amplitude = amplitude
+
+        # Waves die down near the edge so the patch meets the ring and banks flat
+        edge = np.minimum(half - np.abs(xz[:, 0]), half - np.abs(xz[:, 1])) / max(size * edge_fade, 1e-6)
+        fade = np.clip(edge, 0, 1)
+        self.fade = (fade * fade * (3 - 2 * fade)).astype(np.float32)
+        self.slope_x = amplitude * k * direction[:, 0]
+        self.slope_z = amplitude * k * direction[:, 1]
+
+        self.model = self.surface
+        self.update()
+
+    def _ring_node(self, inner, outer, cell):
+        strips = (
+            (-outer, outer, inner, outer),      # far
+            (-outer, outer, -outer, -inner),    # near
+            (inner, outer, -inner, inner),      # right
+            (-outer, -inner, -inner, inner),    # left
+        )
+        positions, indices = [], []
+        offset = 0
+        for x0, x1, z0, z1 in strips:
+            columns = max(1, math.ceil((x1 - x0) / cell))
+            rows = max(1, math.ceil((z1 - z0) / cell))
+            xz, strip_indices = _grid(x0, x1, z0, z1, columns, rows)
+            positions.append(xz)
+            indices.append(strip_indices + offset)
+            offset += len(xz)
+        return _geom_node('water_ring', np.concatenate(positions), np.concatenate(indices), Geom.UH_static)
+
+    def update(self):
+        self.time += time.dt
+        angle = self.phase + self.omega * self.time
+        sin, cos = np.sin(angle), np.cos(angle)
+
+        heights = (sin @ self.amplitude) * self.fade
+        dx = (cos @ self.slope_x) * self.fade
+        dz = (cos @ self.slope_z) * self.fade
+        length = np.sqrt(dx * dx + dz * dz + 1)
+
+        rows = np.frombuffer(memoryview(self.vdata.modifyArray(0)), dtype=np.float32).reshape(-1, 6)
+        rows[:, 1] = heights
+        rows[:, 3] = -dx / length
+        rows[:, 4] = 1 / length
+        rows[:, 5] = -dz / length
@@ -6,20 +6,30 @@ With 3D Mario Head Feature
 Built with Ursina Engine
 """
 
-from ursina import *
-from ursina.prefabs.first_person_controller import FirstPersonController
-import math
-import random
-import time as pytime
+from sm64.startup import StartupTimer, DeferredLoader
+
+# Time every startup phase from here on
+startup = StartupTimer()
+
+with startup.phase('import'):
+    from ursina import *
+    import math
+    import random
+    import time as pytime
+    from sm64.gcpolicy import GCPolicy, GCReadout
+    from sm64.motion import MotionClock
+    from sm64.quality import apply_quality
+    from sm64.saves import SaveFile, read_stars
 
 # Initialize the app
-app = Ursina(
-    title='Ultra Mario 3D 1.0x - Flames Co. Infdev Build',
-    borderless=False,
-    fullscreen=False,
-    vsync=True,
-    development_mode=False
-)
+with startup.phase('window'):
+    app = Ursina(
+        title='Ultra Mario 3D 1.0x - Flames Co. Infdev Build',
+        borderless=False,
+        fullscreen=False,
+        vsync=True,
+        development_mode=False
+    )
 
 # Color palette - N64/Mario 64 inspired
 MARIO_RED = color.rgb(230, 0, 18)
@@ -38,11 +48,17 @@ game_state = {
     'selected_option': 0
 }
 
+# Save file behind NEW GAME / CONTINUE
+save_file = SaveFile(1)
+
 # Configure window
 window.color = SKY_BLUE
 window.exit_button.visible = False
 window.fps_counter.enabled = False
 
+# Quality preset (SM64_QUALITY=low/medium/high)
+apply_quality()
+
 class MarioHead(Entity):
     """3D Mario head that reacts to cursor like in SM64"""
     def __init__(self):
@@ -322,6 +338,8 @@ class Mario64Menu(Entity):
                 'name': name
             })
         
+        self.refresh_continue()
+        
         # Selection star cursor
         self.cursor = Text(
             '★',
@@ -362,16 +380,20 @@ class Mario64Menu(Entity):
             origin=(0, 0)
         )
         
+        # Menu animations run on the GPU from a single time uniform
+        self.motion = MotionClock(self)
+        
+        # Animate cursor and title
+        self.motion.add(self.cursor, bob=(0.02, 3, 0), bob_axis='x', sway=(10, 2, 0))
+        self.motion.add(self.title, pulse=(0.05, 2, 0))
+        
         # Decorative stars
         self.create_background_stars()
         
-        # Animation timers
-        self.animation_timer = 0
-        
-    def create_background_stars(self):
+    def create_background_stars(self, count=8):
         """Create animated background stars"""
         self.bg_stars = []
-        for i in range(8):
+        for i in range(count):
             star = Text(
                 '★',
                 parent=self,
@@ -381,11 +403,21 @@ class Mario64Menu(Entity):
                 origin=(0, 0),
                 z=10
             )
-            star.base_y = star.y
-            star.speed = random.uniform(0.5, 2)
-            star.offset = random.uniform(0, math.pi * 2)
+            speed = random.uniform(0.5, 2)
+            self.motion.add(
+                star,
+                bob=(0.02, speed, random.uniform(0, math.pi * 2)),
+                spin=50 * speed
+            )
             self.bg_stars.append(star)
     
+    def refresh_continue(self):
+        """Star count of the save file next to CONTINUE, read from its header only"""
+        stars = read_stars(save_file.slot)
+        for slot in self.file_slots:
+            if slot['stars']:
+                slot['stars'].text = f'★ × {stars or 0}'
+    
     def input(self, key):
         if not game_state['menu_active']:
             return
@@ -421,9 +453,11 @@ class Mario64Menu(Entity):
         option = self.file_slots[self.selected_slot]['name']
         
         if option == 'NEW GAME':
+            save_file.reset()
             self.start_game()
         elif option == 'CONTINUE':
-            print("No save file found! Starting new game...")
+            if not save_file.load():
+                print("No save file found! Starting new game...")
             self.start_game()
         elif option == 'OPTIONS':
             print("Options menu not yet implemented")
@@ -453,6 +487,12 @@ class Mario64Menu(Entity):
     
     def launch_game(self):
         """Actually start the game"""
+        # Finish whatever the deferred loader hasn't built yet
+        loader.finish()
+        # The screen is black, collect now rather than in the first frames of play
+        gc_policy.transition()
+        gc_policy.gameplay()
+        
         game_state['menu_active'] = False
         game_state['game_started'] = True
         game_state['mario_head_active'] = False
@@ -461,36 +501,20 @@ class Mario64Menu(Entity):
         self.enabled = False
         mario_head.enabled = False
         
-        # Enable game elements
+        # Enable game elements, the orbit camera after the controller so it keeps the camera
         player.enabled = True
+        lakitu.enabled = True
         game_world.enabled = True
         hud.enabled = True
+        hud.update_display()
         
         # Change environment
         window.color = SKY_BLUE
         window.fps_counter.enabled = True
+        gc_readout.enabled = True
         
         print("Game started!")
         print("♪ Doo doo doo, doo doo DOO! ♪")
-    
-    def update(self):
-        if not game_state['menu_active']:
-            return
-        
-        self.animation_timer += time.dt
-        
-        # Animate cursor
-        self.cursor.x = -0.25 + math.sin(self.animation_timer * 3) * 0.02
-        self.cursor.rotation_z = math.sin(self.animation_timer * 2) * 10
-        
-        # Animate title
-        pulse = (math.sin(self.animation_timer * 2) + 1) / 2
-        self.title.scale = 4 + pulse * 0.2
-        
-        # Animate background stars
-        for star in self.bg_stars:
-            star.y = star.base_y + math.sin(self.animation_timer * star.speed + star.offset) * 0.02
-            star.rotation_z = self.animation_timer * 50 * star.speed
 
 class GameWorld(Entity):
     """Simple game world for testing"""
@@ -563,17 +587,16 @@ class GameHUD(Entity):
             scale=1,
             color=MARIO_RED
         )
+    
+    def update_display(self):
+        self.star_counter.text = f'★ × {save_file["stars"]}'
+        self.coin_counter.text = f'© × {save_file["coins"]}'
+        self.lives.text = f'MARIO × {save_file["lives"]}'
 
-# Create game objects
-mario_head = MarioHead()
-menu = Mario64Menu()
-player = FirstPersonController(
-    enabled=False,
-    speed=8,
-    jump_height=3
-)
-game_world = GameWorld()
-hud = GameHUD()
+# Create the menu first so it is on screen by the first frame
+with startup.phase('scene build', 'menu'):
+    mario_head = MarioHead()
+    menu = Mario64Menu()
 
 # Camera setup
 camera.fov = 70
@@ -582,8 +605,54 @@ camera.fov = 70
 camera.position = (0, 0, 5)
 camera.rotation = (0, 0, 0)
 
-# Sky
-sky = Sky(color=SKY_BLUE)
+def warm_assets():
+    """Load the models and textures the game world needs ahead of time"""
+    for name in ('cube', 'sphere'):
+        load_model(name)
+        yield name
+    load_texture('white_cube')
+    yield 'white_cube'
+
+def build_world():
+    """Build the game objects a piece per frame while the menu is up"""
+    global player, lakitu, game_world, hud, sky
+    # Gameplay-only modules, imported on demand
+    from ursina.prefabs.first_person_controller import FirstPersonController
+    from sm64.lakitu import LakituCamera
+    from sm64.sky import GradientSky
+    
+    player = FirstPersonController(
+        enabled=False,
+        speed=8,
+        jump_height=3
+    )
+    # Seen from behind by the orbit camera
+    Entity(parent=player, model='cube', color=color.rgb(0, 92/255, 170/255), scale=(0.8, 1, 0.6), y=0.5)
+    Entity(parent=player, model='sphere', color=color.rgb(230/255, 0, 18/255), scale=0.7, y=1.35)
+    # The controller grabs the camera, the orbit camera parks it for the menu until the game starts
+    lakitu = LakituCamera(player, enabled=False, rest_fov=70, fov=70)
+    yield 'player'
+    
+    game_world = GameWorld()
+    yield 'game world'
+    
+    hud = GameHUD()
+    yield 'hud'
+    
+    # Sky
+    sky = GradientSky('castle')
+    yield 'sky'
+
+# Collections happen between scenes rather than mid-frame, their pauses show under the fps counter
+gc_policy = GCPolicy()
+gc_readout = GCReadout(gc_policy, enabled=False)
+
+loader = DeferredLoader(startup)
+loader.add(warm_assets(), 'assets')
+loader.add(build_world())
+loader.on_done.append(lambda: print(startup.report()))
+loader.on_done.append(gc_policy.loaded)
+loader.start()
 
 def update():
     """Main update loop"""
@@ -603,27 +672,45 @@ def return_to_menu():
     
     # Hide game elements
     player.enabled = False
+    lakitu.enabled = False
     game_world.enabled = False
     hud.enabled = False
     
-    # Reset camera
-    camera.position = (0, 0, 5)
-    camera.rotation = (0, 0, 0)
+    save_file.save()
+    menu.refresh_continue()
     
     # Reset window
     window.fps_counter.enabled = False
+    gc_readout.enabled = False
+    gc_policy.menu()
     
     print("Returned to menu")
 
+# Started and stopped with F4
+profiler = None
+
 def input(key):
     """Global input handler"""
+    global profiler
     # Debug commands
     if key == 'f1':
         window.fps_counter.enabled = not window.fps_counter.enabled
+        gc_readout.enabled = window.fps_counter.enabled
     elif key == 'f2':
         print(f"Mario Head Active: {game_state['mario_head_active']}")
         print(f"Menu Active: {game_state['menu_active']}")
         print(f"Game Started: {game_state['game_started']}")
+    elif key == 'f4':
+        if profiler is None:
+            from sm64.profiler import SamplingProfiler
+            profiler = SamplingProfiler(context=lambda: 'game' if game_state['game_started'] else 'menu', name='titlecard0')
+        if profiler.running:
+            path = profiler.stop()
+            print(profiler.summary())
+            print(f"Flame graph written to {path}")
+        else:
+            profiler.start()
+            print(f"Profiling at {profiler.rate} Hz, F4 again to stop")
 
 # ASCII art startup
 print("""
@@ -645,9 +732,11 @@ print("  • ↑↓ - Navigate menu")
 print("  • ENTER - Select option")
 print("  • Click on Mario's face to interact!")
 print("  • ESC - Return to menu (in-game)")
-print("  • F1 - Toggle FPS counter")
+print("  • F1 - Toggle FPS counter, frame time and GC pauses")
 print("  • F2 - Debug info")
+print("  • F4 - Start/stop the profiler")
 print("-" * 55)
 
-# Run the application
-app.run()
+# Run the application (launcher.py hosts builds in its own window)
+if __name__ == '__main__':
+    app.run()